@@ -2,11 +2,12 @@ import pandas as pd
 import numpy as np
 import tkinter as tk
 import random
+from eeg_ingest import load_eeg_frame
 
 # Load EEG data
 def load_eeg_data(file_path):
     # Assume the data has columns: 'timestamp', 'alpha', 'beta', 'gamma', etc.
-    return pd.read_csv(file_path)
+    return load_eeg_frame(file_path)
 
 # Preprocessing function
 def preprocess_eeg_data(data):
@@ -1,24 +1,24 @@
+import os
 import pandas as pd
 import numpy as np
 import mne
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Input
 import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import ttk
+from eeg_cache import file_digest, stage_key
+from eeg_ingest import load_eeg_arrays
+from eeg_lstm import LSTM_WEIGHTS, LSTMNetwork, export_keras_weights, compare_with_keras
+
+# Training settings; exported weights are only reused if these, the data and its channels all match
+HYPERPARAMETERS = {'time_steps': 10, 'units': (64, 32), 'epochs': 10, 'batch_size': 32, 'validation_split': 0.2}
 
 def preprocess_eeg_data(file_path):
-    df = pd.read_csv(file_path)
-    # Drop columns if they exist
-    columns_to_drop = ['TimeStamp (ms)', 'Test Label:Stimulus']
-    existing_columns_to_drop = [col for col in columns_to_drop if col in df.columns]
-    if existing_columns_to_drop:
-        df.drop(columns=existing_columns_to_drop, inplace=True)
-    data = df.values.T
-    info = mne.create_info(ch_names=df.columns.tolist(), sfreq=256, ch_types='eeg')
+    # The timestamp and label columns are left out by the shared ingest
+    data, _, channel_names = load_eeg_arrays(file_path)
+    info = mne.create_info(ch_names=channel_names, sfreq=256, ch_types='eeg')
     raw = mne.io.RawArray(data, info)
     raw.filter(l_freq=1, h_freq=40)
-    return raw.get_data().T
+    return raw.get_data().T, channel_names
 
 def prepare_data(data, time_steps=10):
     X, y = [], []
@@ -28,21 +28,40 @@ def prepare_data(data, time_steps=10):
     return np.array(X), np.array(y)
 
 def create_model(input_shape, output_shape):
+    # TensorFlow is only needed to train, so it is only imported here
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Input
+
+    first_units, second_units = HYPERPARAMETERS['units']
     model = Sequential([
         Input(shape=input_shape),
-        LSTM(64, return_sequences=True),
-        LSTM(32, return_sequences=False),
+        LSTM(first_units, return_sequences=True),
+        LSTM(second_units, return_sequences=False),
         Dense(output_shape)
     ])
     model.compile(optimizer='adam', loss='mse')
     return model
 
 def main(file_path):
-    data = preprocess_eeg_data(file_path)
-    X, y = prepare_data(data)
-    model = create_model((X.shape[1], X.shape[2]), y.shape[1])
-    model.fit(X, y, epochs=10, batch_size=32, validation_split=0.2)
-    predictions = model.predict(X)
+    data, channel_names = preprocess_eeg_data(file_path)
+    X, y = prepare_data(data, HYPERPARAMETERS['time_steps'])
+    fingerprint = stage_key(file_digest(file_path), channel_names, HYPERPARAMETERS)
+    network = LSTMNetwork.load(LSTM_WEIGHTS) if os.path.exists(LSTM_WEIGHTS) else None
+    if network is not None and network.fingerprint == fingerprint:
+        # Already trained on this data, so run the exported weights in NumPy without loading TensorFlow
+        predictions = network.predict(X)
+    else:
+        if network is not None:
+            print(f"{LSTM_WEIGHTS} was trained on other data or settings, retraining.")
+        model = create_model((X.shape[1], X.shape[2]), y.shape[1])
+        model.fit(X, y, epochs=HYPERPARAMETERS['epochs'], batch_size=HYPERPARAMETERS['batch_size'],
+                  validation_split=HYPERPARAMETERS['validation_split'])
+        predictions = model.predict(X)
+
+        # Export the weights for the NumPy engine and check it gives the same predictions
+        export_keras_weights(model, LSTM_WEIGHTS, fingerprint)
+        difference = compare_with_keras(model, LSTMNetwork.load(LSTM_WEIGHTS), X[:2048])
+        print(f"Exported {LSTM_WEIGHTS}; NumPy and Keras predictions differ by at most {difference:.2e}")
     
     # Adjust this list based on the actual number of columns in predictions
     column_names = [
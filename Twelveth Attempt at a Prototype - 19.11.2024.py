@@ -3,14 +3,29 @@ from tkinter import ttk, messagebox
 from neurosity import NeurositySDK
 from dotenv import load_dotenv
 import os
-import csv
+import queue
+import threading
+from collections import deque
 from datetime import datetime
 import numpy as np
 import tkinter as tk
 from scipy.signal import butter, filtfilt, lfilter
-from scipy import stats
-from colorsys import hls_to_rgb
 import time
+import eeg_markers
+from eeg_markers import MarkerStore
+from eeg_session import save_session
+from eeg_export import epochs_to_samples, write_samples_csv
+from eeg_dsp import EEGPreprocessor, StreamingSOSFilter, make_band_power_engine, estimation_delay
+from eeg_dsp import MultiRateStream, RAW_RATE, FEATURE_RATE, Rereferencer, AnalysisWindowAggregator
+from eeg_artifacts import ArtifactDetector, ChannelQualityMonitor
+from eeg_calibration import BaselineAccumulator, BaselineCache, GUEST
+from eeg_states import COLOR_RANGES
+from eeg_states import STATE_FORMULAS, CALIBRATED_STATE_FORMULAS
+from eeg_formulas import load_state_formulas
+from eeg_feedback import FEEDBACK_RULES, CALIBRATED_FEEDBACK_RULES, FeedbackEngine
+from eeg_states import HysteresisGate, StateAnalyzer, TrendForecaster, make_state_smoother
+from eeg_lstm import LSTM_WEIGHTS, LSTMNetwork, StreamingLSTM
+from eeg_classifier import ClassifierStore, TRAINING_LABELS, classifier_features
 
 # Sample AI Document Text for Document Display
 def get_ai_document():
@@ -29,9 +44,13 @@ class ColorState:
     
     def add_observer(self, callback):
         self._observers.append(callback)
+
+    def remove_observer(self, callback):
+        if callback in self._observers:
+            self._observers.remove(callback)
     
     def notify_observers(self):
-        for callback in self._observers:
+        for callback in list(self._observers):
             callback()
     
     @property
@@ -52,11 +71,12 @@ class ColorState:
             return False
     
     def update_colors(self, bg, fg):
+        # Only a real change notifies, so observers don't repaint for the same colours
         changed = False
-        if self._is_valid_color(bg):
+        if self._is_valid_color(bg) and bg != self._bg_color:
             self._bg_color = bg
             changed = True
-        if self._is_valid_color(fg):
+        if self._is_valid_color(fg) and fg != self._fg_color:
             self._fg_color = fg
             changed = True
         if changed:
@@ -79,6 +99,39 @@ def bandpass_filter(data, lowcut, highcut, fs, order=4):
 # Load environment variables
 load_dotenv()
 
+# Band power engine for the live session: "envelope" (streaming envelope, lowest latency),
+# "iir" (per-epoch filter bank) or "sdft" (sliding DFT)
+BAND_POWER_ENGINE = os.getenv("BAND_POWER_ENGINE", "envelope")
+
+# Live re-reference: "average" (common average of good channels), "none", or channel names such as "F5,F6"
+EEG_REFERENCE = os.getenv("EEG_REFERENCE", "average")
+
+# Band power is averaged over this much data (seconds) by the iir and sdft engines, and read once per hop
+# rather than for every 16-sample epoch. Every engine is stateful and processes each sample once, so the
+# hop only sets how often band power (and so the display) updates, not how much data is refiltered.
+ANALYSIS_WINDOW = float(os.getenv("ANALYSIS_WINDOW", "2.0"))
+ANALYSIS_HOP = float(os.getenv("ANALYSIS_HOP", "0.25"))
+
+# Seconds of resting data recorded at the start of a session when the user has no stored baseline,
+# and how many days a stored baseline stays valid before the user is calibrated again
+CALIBRATION_SECONDS = float(os.getenv("CALIBRATION_SECONDS", "60"))
+CALIBRATION_MAX_AGE_DAYS = float(os.getenv("CALIBRATION_MAX_AGE_DAYS", "30"))
+
+# Smoothing of the mental states before they reach the colours: "one_euro", "ema", "kalman" or "none"
+STATE_SMOOTHING = os.getenv("STATE_SMOOTHING", "one_euro")
+
+# Colours follow the latest states ("none"), or the states forecast over the measured pipeline latency
+# ("trend"). Off by default: the forecast only just beats the stale states on average and is worse for focus
+STATE_FORECAST = os.getenv("STATE_FORECAST", "none")
+
+# A focused/distracted label from the user trains the classifier on this many seconds of data before it
+LABEL_SPAN = float(os.getenv("LABEL_SPAN", "4"))
+
+# JSON file of mental-state formulas that tune or add to the built-in ones, under "states"
+# (band shares of total power) and "calibrated_states" (band z-scores), e.g.
+# {"states": {"focus": "(beta * 0.5 + gamma * 0.3) / (theta * 0.3)"}}
+STATE_FORMULAS_FILE = os.getenv("STATE_FORMULAS_FILE", "state_formulas.json")
+
 # Load user list from file
 def load_users():
     users = {}
@@ -115,6 +168,43 @@ class NeurosityDataCollector:
         })
         self.data = []
         self.session_active = False
+        self.save_messages = queue.Queue()  # Filled by the background save, shown from the Tk thread
+
+        # Event markers stamped with the device sample index
+        self.sampling_rate = 256
+        self.markers = MarkerStore()
+        self.sample_count = 0
+        self._last_receipt_time = None  # Host clock (time.monotonic) when the latest epoch arrived
+
+        # DC blocker and mains notch, run once per epoch ahead of the band filters
+        self.preprocessor = EEGPreprocessor(self.sampling_rate)
+        self.band_engine = make_band_power_engine(BAND_POWER_ENGINE, self.sampling_rate, ANALYSIS_WINDOW)
+
+        # How far behind the signal a band power reading is, and the device sample of the latest reading
+        self.estimation_delay = estimation_delay(self.band_engine, ANALYSIS_WINDOW)
+        self.last_hop_sample = None
+
+        # Rolling channel quality decides which channels feed the common average and band power
+        self.quality_monitor = ChannelQualityMonitor(self.sampling_rate)
+        self.rereferencer = Rereferencer(EEG_REFERENCE)
+
+        # Per-channel artifact flags for the latest epoch; contaminated channels are left out of band power
+        self.artifact_detector = ArtifactDetector()
+        self.channel_mask = np.ones(8, dtype=bool)
+        self.artifact_flags = None
+
+        # Cleaned data fans out at 256/64/16 Hz and as band features; each consumer takes the lowest rate it needs
+        # Nothing in the app plots the signal, so there are no decimated tiers
+        self.streams = MultiRateStream(self.sampling_rate, tiers=())
+        self.streams.subscribe(RAW_RATE, self.analyse_epoch)  # Band power needs the full bandwidth up to gamma
+        # The baseline and the classifier only need the band powers, once per hop
+        self.streams.subscribe(FEATURE_RATE, self.update_baseline)
+        self.streams.subscribe(FEATURE_RATE, self.update_classifier)
+
+        # Epochs are gathered into analysis windows; the DSP only runs on each hop boundary
+        self.window_aggregator = AnalysisWindowAggregator(self.analyse_window, self.sampling_rate,
+                                                          ANALYSIS_WINDOW, ANALYSIS_HOP)
+        self.window_masks = deque(maxlen=max(1, self.window_aggregator.window // 16))
         
         # Initialize brainwave variables
         self.alpha_waves = 0.0
@@ -122,218 +212,314 @@ class NeurosityDataCollector:
         self.theta_waves = 0.0
         self.gamma_waves = 0.0
 
+        # Per-channel powers (channels x theta/alpha/beta/gamma) from the latest hop
+        self.band_power_matrix = np.zeros((8, 4), dtype=np.float32)
+
+        # Per-user resting baseline; until one is loaded or calibrated there are no z-scores
+        self.username = GUEST
+        self.baseline_cache = BaselineCache(users)
+        self.baseline = None
+        self.calibration = BaselineAccumulator()
+        self.calibration_hops = max(1, int(round(CALIBRATION_SECONDS / ANALYSIS_HOP)))
+        self.band_zscores = None  # theta/alpha/beta/gamma z-scores over the clean channels
+
+        # Focused/distracted classifier, learnt per user from the labels they give during sessions
+        self.classifier_store = ClassifierStore(users)
+        self.classifier = self.classifier_store.load(GUEST)
+        self.recent_features = deque(maxlen=max(1, int(LABEL_SPAN / ANALYSIS_HOP)) + 1)  # (end sample, features)
+        self.focus_probability = None
+        # Hops are added and predicted on the SDK thread while labels train on the Tk thread
+        self.classifier_lock = threading.Lock()
+
+        # The New Iteration LSTM, run in NumPy from its exported weights when they are available.
+        # It was trained on 1-40 Hz data, so it gets its own band-pass ahead of it.
+        # How far its next-sample predictions miss is shown as a measure of how familiar the signal looks.
+        self.lstm = None
+        self.lstm_prediction = None
+        self.lstm_error = None  # RMS miss over the latest epoch, in the signal's units
+        if os.path.exists(LSTM_WEIGHTS):
+            network = LSTMNetwork.load(LSTM_WEIGHTS)
+            if network.n_inputs != 8 or network.n_outputs != 8:
+                print(f"{LSTM_WEIGHTS} was trained on {network.n_inputs} channels, not the Crown's 8, "
+                      f"so the LSTM is disabled.")
+            else:
+                # Each prediction runs over the latest training-length window, as the network was trained
+                self.lstm = StreamingLSTM(network, window_size=network.time_steps)
+                self.lstm_filter = StreamingSOSFilter(butter(4, (1, 40), btype="band", fs=self.sampling_rate,
+                                                             output="sos"))
+
     def start_session(self):
         """Starts data collection"""
         if not self.session_active:
             self.session_active = True
             self.data = []
+            self.markers.clear()
+            self.sample_count = 0
+            self._last_receipt_time = None
+            self.preprocessor.reset()
+            self.artifact_detector.reset()
+            self.quality_monitor.reset()
+            self.band_engine.reset()
+            self.streams.reset()
+            self.window_aggregator.reset()
+            self.window_masks.clear()
+            self.last_hop_sample = None
+            if self.lstm is not None:
+                self.lstm.reset()
+                self.lstm_filter.reset()
+                self.lstm_prediction = None
+                self.lstm_error = None
+            self.load_baseline(current_user.get() or GUEST)
+            with self.classifier_lock:
+                self.classifier = self.classifier_store.load(self.username)
+                self.recent_features.clear()
+                self.focus_probability = None
             self.unsubscribe = self.neurosity.brainwaves_raw(self.collect_data)
+            self.mark(eeg_markers.SESSION_START)
             print("Data collection started.")
 
+    def calibration_settings(self):
+        """A baseline only holds for the band power settings it was recorded with."""
+        return {'engine': BAND_POWER_ENGINE, 'reference': EEG_REFERENCE, 'window': ANALYSIS_WINDOW}
+
+    def load_baseline(self, username):
+        """Reuses the user's stored baseline, or starts a calibration phase if there isn't a valid one."""
+        self.username = username
+        self.band_zscores = None
+        self.calibration.reset()
+        self.baseline = self.baseline_cache.load(username, CALIBRATION_MAX_AGE_DAYS, **self.calibration_settings())
+        if self.baseline is None:
+            print(f"Calibrating baseline for {username} over the first {CALIBRATION_SECONDS:.0f} s.")
+        else:
+            print(f"Using the stored baseline for {username}.")
+
+    def update_baseline(self, band_powers):
+        """Scores the latest band powers against the baseline, or adds them to the calibration."""
+        if self.baseline is not None:
+            zscores = self.baseline.band_zscores(band_powers, self.channel_mask)
+            if zscores is not None:
+                self.band_zscores = zscores
+            return
+
+        # Leave out the first second while the filters and channel quality settle
+        if self.quality_monitor.epochs_seen < self.quality_monitor.warmup_epochs:
+            return
+        self.calibration.update(band_powers, self.channel_mask)
+        if self.calibration.updates < self.calibration_hops:
+            return
+        try:
+            self.baseline = self.calibration.baseline(self.username, **self.calibration_settings())
+        except ValueError:
+            # Too few clean readings, so calibrate again from scratch
+            print("Calibration data was too noisy, recalibrating.")
+            self.calibration.reset()
+            return
+        self.baseline_cache.save(self.baseline)
+        self.mark(eeg_markers.CALIBRATION_DONE, self.username)
+        print(f"Baseline calibrated for {self.username}.")
+
+    def current_sample_index(self):
+        """Estimates the device sample index for 'now' from the samples received so far.
+
+        Counts on from the end of the latest epoch by the host time since it arrived, so
+        the index only depends on the host clock, never on the device's.
+        """
+        if self._last_receipt_time is None:
+            return self.sample_count
+        elapsed = time.monotonic() - self._last_receipt_time
+        return self.sample_count + max(0, int(round(elapsed * self.sampling_rate)))
+
+    def pipeline_latency(self):
+        """Seconds between the brain activity behind the current band powers and now, or None before the first hop.
+
+        The age of the newest analysed sample since it arrived (filtering and analysis) plus
+        the band power engine's own delay.
+        """
+        if self.last_hop_sample is None:
+            return None
+        age = (self.current_sample_index() - self.last_hop_sample) / self.sampling_rate
+        return max(age, 0.0) + self.estimation_delay
+
+    def mark(self, label, detail=""):
+        """Emits an event marker at the current device sample index."""
+        if self.session_active:
+            self.markers.add(self.current_sample_index(), label, detail)
+
     def collect_data(self, data):
         """Collects incoming data into a list and calculates brainwaves."""
         if self.session_active:
-            self.data.append(data)
-            self.calculate_brain_waves(data['data'])
-        
-            # Print the calculated brainwave values
-            print(f"Alpha: {self.alpha_waves:.2f}, Beta: {self.beta_waves:.2f}, Theta: {self.theta_waves:.2f}, Gamma: {self.gamma_waves:.2f}")
-
-    def calculate_brain_waves(self, eeg_data):
-        """Calculates alpha, beta, theta, and gamma waves from EEG data."""
-        sampling_rate = 256  # As defined in your 'info' section
-
-        # Convert eeg_data to numpy array for filtering
-        eeg_array = np.array(eeg_data)
-
-        # Apply bandpass filters for each frequency band
-        alpha_band = bandpass_filter(eeg_array, 8, 13, sampling_rate)
-        beta_band = bandpass_filter(eeg_array, 13, 30, sampling_rate)
-        theta_band = bandpass_filter(eeg_array, 4, 8, sampling_rate)
-        gamma_band = bandpass_filter(eeg_array, 30, 50, sampling_rate)
-
-        # Calculate power (mean square) of each band and update variables
-        self.alpha_waves = np.mean(alpha_band ** 2)
-        self.beta_waves = np.mean(beta_band ** 2)
-        self.theta_waves = np.mean(theta_band ** 2)
-        self.gamma_waves = np.mean(gamma_band ** 2)
+            # Kept as a float32 block rather than the SDK's nested lists, about an eighth of the memory
+            info = data.get('info', {})
+            self.data.append({'data': np.asarray(data['data'], dtype=np.float32), 'info': info})
+
+            # Keep track of where this epoch sits in the device sample stream, and when it arrived
+            self.sampling_rate = info.get('samplingRate', self.sampling_rate)
+            self.sample_count += len(data['data'][0])
+            self._last_receipt_time = time.monotonic()
+
+            # Remove the DC offset/drift and line noise before the band filters see the data
+            cleaned = self.preprocessor.process(data['data'], info)
+
+            # Update channel quality and check for artifacts, then re-reference to the good, clean channels
+            # to strip the common mode. Artifacts are judged before re-referencing: the common average
+            # would shrink a frontal blink and spread it onto every other channel.
+            self.quality_monitor.notch = self.preprocessor.notch
+            good = self.quality_monitor.update(data['data'], cleaned)
+            clean_mask, self.artifact_flags = self.artifact_detector.check(cleaned)
+            self.window_masks.append(clean_mask)
+            self.streams.push(self.rereferencer.process(cleaned, good & clean_mask))
+
+            if self.lstm is not None:
+                self.update_lstm(cleaned)
+
+    def update_lstm(self, cleaned):
+        """Scores the LSTM's predictions for this epoch's samples, then predicts the next epoch's first."""
+        filtered = self.lstm_filter.process(cleaned)
+        predictions = self.lstm.update(filtered)  # The sample after each one, (n x channels)
+        if self.lstm_prediction is not None:
+            predicted = np.vstack([self.lstm_prediction, predictions[:-1]])
+            self.lstm_error = float(np.sqrt(np.mean((predicted - filtered.T) ** 2)))
+        self.lstm_prediction = predictions[-1]
+
+    def analyse_epoch(self, referenced):
+        """Full-rate consumer: adds each re-referenced epoch to the analysis window."""
+        self.window_aggregator.push(referenced)
+
+    def analyse_window(self, window, new_samples, end_sample):
+        """Runs band power once per hop and publishes it on the feature-rate stream."""
+        # A channel counts as clean if no epoch in the window was flagged and its rolling quality is good
+        self.channel_mask = np.logical_and.reduce(self.window_masks) & self.quality_monitor.good
+        # The engines are stateful, so they only need the samples since the last hop
+        self.calculate_brain_waves(new_samples, self.channel_mask)
+        self.last_hop_sample = end_sample
+        self.streams.publish_features(self.band_power_matrix)
+
+        # Print the calculated brainwave values
+        print(f"Alpha: {self.alpha_waves:.2f}, Beta: {self.beta_waves:.2f}, Theta: {self.theta_waves:.2f}, Gamma: {self.gamma_waves:.2f}")
+
+    def update_classifier(self, band_powers):
+        """Keeps the classifier's features for labelling, and its prediction once it has been trained."""
+        features = classifier_features(band_powers, self.channel_mask)
+        if features is None:
+            return
+        with self.classifier_lock:
+            self.recent_features.append((self.last_hop_sample, features))
+            if self.classifier.count:
+                self.focus_probability = self.classifier.predict_proba(features)
+
+    def calculate_brain_waves(self, eeg_data, channel_mask=None):
+        """Calculates alpha, beta, theta, and gamma waves from EEG data, skipping flagged channels."""
+        # Every channel goes through the engine so a stateful engine keeps an unbroken history
+        band_powers = self.band_engine.update(eeg_data)  # channels x (theta, alpha, beta, gamma)
+        self.band_power_matrix = band_powers
+
+        # If every channel is contaminated, keep the previous values rather than chase the artifact
+        if channel_mask is not None:
+            if not channel_mask.any():
+                return
+            band_powers = band_powers[channel_mask]
+
+        # Average power of each band over the clean channels and update variables
+        self.theta_waves, self.alpha_waves, self.beta_waves, self.gamma_waves = band_powers.mean(axis=0)
+
+    def label_state(self, label):
+        """Marks a focused/distracted label and trains the classifier on the hops just before it."""
+        if not self.session_active:
+            return
+        self.mark(label)
+        since = self.current_sample_index() - int(LABEL_SPAN * self.sampling_rate)
+        with self.classifier_lock:
+            for end_sample, features in self.recent_features:
+                if end_sample >= since:
+                    self.classifier.update(features, TRAINING_LABELS[label])
 
     def stop_session(self):
         """Stops data collection and saves to a CSV file with specified columns."""
         if self.session_active:
+            self.mark(eeg_markers.SESSION_STOP)
             self.unsubscribe()  # Stop data collection
             self.session_active = False
-            self.save_data_to_csv()  # Call the new save function
+            username = current_user.get() if current_user.get() else "Guest"
+            self.classifier_store.save(self.username, self.classifier)
+
+            # Hand the recording to a background save so the Tk thread isn't blocked
+            data, markers = self.data, self.markers
             self.data = []  # Clear the data after saving
+            self.markers = MarkerStore()
+            threading.Thread(target=self.save_data_to_csv, args=(data, markers, username), daemon=True).start()
 
     # New function to save data with specified format
-    def save_data_to_csv(self):
-        """Saves EEG data to CSV with custom columns, including the username stamp."""
-        username = current_user.get() if current_user.get() else "Guest"
-        
+    def save_data_to_csv(self, data, markers, username="Guest"):
+        """Saves EEG data to CSV with one row per sample, including the username stamp."""
         filename = f"{username} - eeg_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        headers = ["Sample Count", "CP3", "C3", "F5", "PO3", "PO4", "F6", "C4", "CP4", "Marker Column", "Timestamp"]
 
-        with open(filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(headers)  # Write header row
-        
-            for i, data_point in enumerate(self.data):
-                sample_count = i % 32  # Cycles 0-31 for each set of samples
-                eeg_values = data_point['data'][:8]  # First 8 values for EEG channels
-                marker = ""  # Placeholder for marker column
-                timestamp = int(datetime.now().timestamp() * 1000)  # Current time in milliseconds
-            
-                writer.writerow([sample_count] + eeg_values + [marker, timestamp])
-
-        # Display an alert popup with the filename
-        alert_popup(f"Data has been saved as {filename}")
-
-class BrainStateAnalyzer:
+        # This runs on a daemon thread, so a failure is reported rather than lost with the thread.
+        # The popups are shown from the Tk thread by poll_save_messages.
+        try:
+            # Epochs arrive as channels x 16, so stack and transpose them into sample rows
+            samples, timestamps = epochs_to_samples(data, sampling_rate=self.sampling_rate)
+
+            # The binary session (samples and marker index, for epoch analysis) goes first, so the
+            # raw data survives if the CSV export fails
+            if len(samples):
+                save_session(filename[:-len(".csv")], samples.T, markers, self.sampling_rate,
+                             start_time=int(timestamps[0]))
+
+            marker_column = markers.labels_for_samples(0, len(samples))
+            write_samples_csv(filename, samples, timestamps, marker_column)
+        except Exception as error:
+            print(f"Saving {filename} failed: {error!r}")
+            self.save_messages.put(f"Saving {filename} failed: {error}")
+            return
+        self.save_messages.put(f"Data has been saved as {filename}")
+
+class BrainStateAnalyzer(StateAnalyzer):
+    """The app's StateAnalyzer: configured from the environment, pushing colour changes to color_state."""
+
     def __init__(self):
-        # Thresholds based on typical EEG patterns
-        self.thresholds = {
-            'focus': {'alpha': 0.3, 'beta': 0.4, 'theta': 0.2, 'gamma': 0.3},
-            'concentration': {'beta': 0.35, 'theta': 0.25},
-            'engagement': {'beta': 0.4, 'gamma': 0.3},
-            'enjoyment': {'alpha': 0.35, 'gamma': 0.25},
-            'memory': {'theta': 0.3, 'gamma': 0.35},
-            'distraction': {'theta': 0.4, 'alpha': 0.35}
-        }
-        
-        # Moving windows for trend analysis
-        self.window_size = 10
-        self.history = {
-            'focus': [], 'concentration': [], 'engagement': [],
-            'enjoyment': [], 'memory': [], 'distraction': []
-        }
-        
-        # Modified color ranges for better visibility
-        self.color_ranges = {
-            'hue': (180, 240),  # Blue spectrum
-            'lightness': (0.6, 0.95),  # Increased contrast
-            'saturation': (0.15, 0.35)  # Slightly more saturated
-        }
-        
-        self.current_colors = {
-            'text': '#000000',
-            'background': '#FFFFFF'
-        }
-        
-        self.last_update = time.time()
-        self.color_transition_delay = 1.0  # Reduced delay for more responsive updates
-    
-    def analyze_brain_state(self, alpha, beta, theta, gamma):
-        """Analyze current brain state using normalized wave values."""
-        # Normalize input values
-        total = alpha + beta + theta + gamma
-        if total == 0:
+        # State formulas, compiled once; every state from the config file is scored in one pass
+        formulas, calibrated_formulas = load_state_formulas(
+            STATE_FORMULAS_FILE, STATE_FORMULAS, CALIBRATED_STATE_FORMULAS)
+
+        # States are smoothed as they arrive, and the colours only move once a state's level over the last couple
+        # of analysis hops clears its hysteresis band: at most 30 redraws a minute on steady input instead of ~235.
+        # The forecaster extrapolates the smoothed states over the pipeline latency, so the colours don't trail
+        # the user. The transition delay is one display tick: the envelope engine follows beta and gamma within
+        # ~70 ms, but theta and alpha readings take ~240 and ~175 ms to show half of a change
+        # (eeg_dsp.ENVELOPE_SMOOTHING).
+        super().__init__(formulas, calibrated_formulas, window_size=10, color_ranges=COLOR_RANGES,
+                         smoother=make_state_smoother(STATE_SMOOTHING), gate=HysteresisGate(),
+                         forecaster=TrendForecaster() if STATE_FORECAST == "trend" else None,
+                         transition_delay=0.1)
+
+        # Suggestions for the user, with thresholds on the scale of whichever states are in use
+        self.feedback = FeedbackEngine(FEEDBACK_RULES, self.state_names)
+        self.calibrated_feedback = FeedbackEngine(CALIBRATED_FEEDBACK_RULES, self.state_names)
+
+    def reset(self):
+        """Forgets the previous session's history, smoothing and feedback timing."""
+        super().reset()
+        self.feedback.reset()
+        self.calibrated_feedback.reset()
+
+    def optimize_colors(self, states, trends, latency=None):
+        """Generate optimal colors based on brain states and trends, and show them when they change."""
+        previous = self.current_colors
+        colors = super().optimize_colors(states, trends, latency)
+        if colors is not previous:
+            color_state.update_colors(colors['background'], colors['text'])
+        return colors
+
+    def get_optimization_feedback(self, states, calibrated=False):
+        """Returns the suggestion to show now, or None.
+
+        Every rule is checked on the smoothed states at once; a rule only fires once its
+        condition has held for a few seconds, and then rests, so suggestions come at a human pace.
+        """
+        if not states:
             return None
-            
-        norm_alpha = alpha / total
-        norm_beta = beta / total
-        norm_theta = theta / total
-        norm_gamma = gamma / total
-        
-        # Calculate mental states using weighted combinations
-        states = {
-            'focus': (norm_beta * 0.4 + norm_gamma * 0.3) / (norm_theta * 0.3),
-            'concentration': norm_beta / (norm_theta + 0.1),
-            'engagement': (norm_beta + norm_gamma) / (norm_alpha + norm_theta),
-            'enjoyment': (norm_alpha + norm_gamma) / 2,
-            'memory': (norm_theta + norm_gamma) / 2,
-            'distraction': (norm_theta + norm_alpha) / (norm_beta + 0.1)
-        }
-        
-        # Update history
-        for state, value in states.items():
-            self.history[state].append(value)
-            if len(self.history[state]) > self.window_size:
-                self.history[state].pop(0)
-        
-        return states
-    
-    def get_state_trends(self, states):
-        """Calculate trends for each mental state."""
-        trends = {}
-        for state, values in self.history.items():
-            if len(values) >= 3:  # Minimum required for trend analysis
-                slope, _, _, _, _ = stats.linregress(range(len(values)), values)
-                trends[state] = slope
-            else:
-                trends[state] = 0
-        return trends
-    
-    def optimize_colors(self, states, trends):
-        """Generate optimal colors based on brain states and trends."""
-        if not states or time.time() - self.last_update < self.color_transition_delay:
-            return self.current_colors
-
-        # Calculate base hue based on mental states
-        focus_factor = max(0.1, min(0.9, states.get('focus', 0.5)))
-        concentration_factor = max(0.1, min(0.9, states.get('concentration', 0.5)))
-
-        # Adjust hue based on cognitive state
-        hue = self.color_ranges['hue'][0] + (
-            (self.color_ranges['hue'][1] - self.color_ranges['hue'][0]) *
-            ((focus_factor + concentration_factor) / 2)
-        )
-
-        # Adjust lightness based on engagement and enjoyment
-        lightness = self.color_ranges['lightness'][0] + (
-            (self.color_ranges['lightness'][1] - self.color_ranges['lightness'][0]) *
-            ((states.get('engagement', 0.5) + states.get('enjoyment', 0.5)) / 2)
-        )
-
-        # Adjust saturation based on memory commitment and distraction
-        saturation = self.color_ranges['saturation'][0] + (
-            (self.color_ranges['saturation'][1] - self.color_ranges['saturation'][0]) *
-            (states.get('memory', 0.5) / (states.get('distraction', 0.1) + 0.1))
-        )
-
-        # Convert HLS to RGB and then to hex
-        rgb = hls_to_rgb(hue/360, lightness, saturation)
-        background_color = '#{:02x}{:02x}{:02x}'.format(
-            int(rgb[0]*255), int(rgb[1]*255), int(rgb[2]*255)
-        )
-
-        # Calculate contrasting text color
-        brightness = (rgb[0] * 299 + rgb[1] * 587 + rgb[2] * 114) / 1000
-        text_color = '#000000' if brightness > 0.5 else '#FFFFFF'
-
-        # Update the global color state
-        color_state.update_colors(background_color, text_color)
-
-        self.current_colors = {
-            'text': text_color,
-            'background': background_color
-        }
-        
-        self.last_update = time.time()
-        return self.current_colors
-    
-    def get_optimization_feedback(self, states, trends):
-        """Generate feedback about current optimization state."""
-        feedback = {
-            'status': 'optimal',
-            'suggestions': []
-        }
-        
-        # Check for suboptimal conditions
-        if states['distraction'] > self.thresholds['distraction']['theta']:
-            feedback['status'] = 'needs_improvement'
-            feedback['suggestions'].append('High distraction detected. Consider taking a short break.')
-            
-        if states['focus'] < self.thresholds['focus']['beta']:
-            feedback['status'] = 'needs_improvement'
-            feedback['suggestions'].append('Focus could be improved. Try deep breathing.')
-            
-        if states['engagement'] < self.thresholds['engagement']['beta']:
-            feedback['status'] = 'needs_improvement'
-            feedback['suggestions'].append('Engagement is low. Consider interactive elements.')
-            
-        return feedback
+        engine = self.calibrated_feedback if calibrated else self.feedback
+        return engine.update([states[state] for state in self.state_names], self.clock())
 
 brain_analyzer = BrainStateAnalyzer()
 
@@ -349,6 +535,17 @@ def alert_popup(message):
 # Initialize data collector instance
 data_collector = NeurosityDataCollector()
 
+# Show the saved-file popup once a background save has finished
+def poll_save_messages():
+    while not data_collector.save_messages.empty():
+        alert_popup(data_collector.save_messages.get())
+    root.after(250, poll_save_messages)
+
+poll_save_messages()
+
+# Mark every colour change in the recording
+color_state.add_observer(lambda: data_collector.mark(eeg_markers.COLOUR_CHANGE, color_state.bg_color))
+
 # Tkinter setup
 # root = tk.Tk()
 # root.title("Multi-Screen Display")
@@ -363,7 +560,7 @@ def display_current_user(frame):
     user_label = tk.Label(frame, text=f"Logged in as: {current_user.get()}", bg="#1d5899", fg="#a0e4cb", font=("Arial", 10))
     user_label.place(relx=0.02, rely=0.02)
 
-def update_brainwave_display(screen, alpha, beta, theta, gamma):
+def update_brainwave_display(screen, alpha, beta, theta, gamma, lstm_error=None, focus_probability=None):
     """Updates the brainwave display in the specified screen."""
     # Create a frame for the brainwave display if it doesn't already exist
     if not hasattr(screen, 'brainwave_display'):
@@ -379,12 +576,19 @@ def update_brainwave_display(screen, alpha, beta, theta, gamma):
         screen.theta_label.pack(anchor="w")
         screen.gamma_label = tk.Label(screen.brainwave_display, text="Gamma: 0.00", font=("Arial", 10), bg="#f0f0f0")
         screen.gamma_label.pack(anchor="w")
+        screen.lstm_label = tk.Label(screen.brainwave_display, text="", font=("Arial", 10), bg="#f0f0f0")
+        screen.lstm_label.pack(anchor="w")
+        screen.focus_label = tk.Label(screen.brainwave_display, text="", font=("Arial", 10), bg="#f0f0f0")
+        screen.focus_label.pack(anchor="w")
 
     # Update labels with the latest brainwave data
     screen.alpha_label.config(text=f"Alpha: {alpha:.2f}")
     screen.beta_label.config(text=f"Beta: {beta:.2f}")
     screen.theta_label.config(text=f"Theta: {theta:.2f}")
     screen.gamma_label.config(text=f"Gamma: {gamma:.2f}")
+    screen.lstm_label.config(text="" if lstm_error is None else f"LSTM error: {lstm_error:.2f}")
+    # Only once the user's classifier has been trained by their focused/distracted labels
+    screen.focus_label.config(text="" if focus_probability is None else f"Focused: {focus_probability:.0%}")
 
 def open_screen(bg_color="#1d5899", start_session=False):
     """Generic function to open a new screen with specified background color and optional session start"""
@@ -457,30 +661,48 @@ def open_start_session_screen():
     document_text.config(state="disabled")
     document_text.place(relx=0.5, rely=0.5, anchor="center")
 
-    # Color update callback
+    # Color update callback, only called when the colours actually change
     def update_document_colors():
         if document_text.winfo_exists():
             document_text.configure(
                 bg=color_state.bg_color,
                 fg=color_state.fg_color
             )
+        else:
+            color_state.remove_observer(update_document_colors)
+
+    color_state.add_observer(update_document_colors)
+
+    # The latest suggestion from the feedback rules
+    feedback_label = tk.Label(screen, text="", bg="#1d5899", fg="#a0e4cb", font=("Arial", 10))
+    feedback_label.place(relx=0.5, rely=0.72, anchor="center")
 
     def update_display_optimization():
         """Updates the display colors based on brain state analysis"""
         if data_collector.session_active and document_text.winfo_exists():
             try:
-                # Get current brain states
-                states = brain_analyzer.analyze_brain_state(
-                    data_collector.alpha_waves,
-                    data_collector.beta_waves,
-                    data_collector.theta_waves,
-                    data_collector.gamma_waves
-                )
+                # Get current brain states, against the user's baseline once there is one
+                calibrated = data_collector.band_zscores is not None
+                if calibrated:
+                    states = brain_analyzer.analyze_calibrated_state(data_collector.band_zscores)
+                else:
+                    states = brain_analyzer.analyze_brain_state(
+                        data_collector.alpha_waves,
+                        data_collector.beta_waves,
+                        data_collector.theta_waves,
+                        data_collector.gamma_waves
+                    )
 
                 if states:
                     # Get trends and optimize colors
                     trends = brain_analyzer.get_state_trends(states)
-                    brain_analyzer.optimize_colors(states, trends)
+                    brain_analyzer.optimize_colors(states, trends, data_collector.pipeline_latency())
+
+                    # Show a suggestion when one is due, and mark it in the recording
+                    rule = brain_analyzer.get_optimization_feedback(states, calibrated)
+                    if rule is not None:
+                        feedback_label.config(text=rule.message)
+                        data_collector.mark(eeg_markers.FEEDBACK_PROMPT, rule.name)
 
                 # Schedule next update
                 screen.after(100, update_display_optimization)
@@ -495,12 +717,39 @@ def open_start_session_screen():
                 data_collector.alpha_waves,
                 data_collector.beta_waves,
                 data_collector.theta_waves,
-                data_collector.gamma_waves
+                data_collector.gamma_waves,
+                data_collector.lstm_error,
+                data_collector.focus_probability
             )
             screen.after(500, periodic_update)
 
     # Start the data collection session
+    brain_analyzer.reset()
     data_collector.start_session()
+    data_collector.mark(eeg_markers.DOCUMENT_SHOWN, "AI")
+
+    # Mark any user input on the document
+    document_text.bind("<Button-1>", lambda event: data_collector.mark(eeg_markers.USER_INPUT, "click"))
+    document_text.bind("<Key>", lambda event: data_collector.mark(eeg_markers.USER_INPUT, event.keysym))
+
+    # Let the user say how they feel, which labels the recording and trains their classifier
+    focused_button = tk.Button(
+        screen,
+        text="Focused",
+        command=lambda: data_collector.label_state(eeg_markers.LABEL_FOCUSED),
+        bg="#a0e4cb",
+        font=("Arial", 10)
+    )
+    focused_button.place(relx=0.35, rely=0.8, anchor="center")
+    distracted_button = tk.Button(
+        screen,
+        text="Distracted",
+        command=lambda: data_collector.label_state(eeg_markers.LABEL_DISTRACTED),
+        bg="#a0e4cb",
+        font=("Arial", 10)
+    )
+    distracted_button.place(relx=0.65, rely=0.8, anchor="center")
+
     # Start the optimization updates
     update_display_optimization()
     periodic_update()
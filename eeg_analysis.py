@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+from scipy.signal import butter, filtfilt
+from eeg_ingest import LEGACY_COLUMNS, load_eeg_frame
+from eeg_session import open_session
+from eeg_features import FEATURE_NAMES, OFFLINE_BANDS, spectral_features
+from eeg_cache import FeatureCache, file_digest
+from eeg_pipeline import Pipeline, Stage
+
+# Settings of the band-pass filter and the multitaper PSD; both are part of the cache keys
+FILTER_SETTINGS = {'lowcut': 0.5, 'highcut': 50, 'order': 4}
+PSD_SETTINGS = {'fmin': 0.5, 'fmax': 50, 'adaptive': True, 'normalization': 'full'}
+
+# This is the function to load and rename columns in the csv file
+def load_and_rename_csv(file_path):
+    # The shared ingest detects the header and parses in chunks straight to float32/int64
+    df = load_eeg_frame(file_path)
+
+    # Headered exports name the channels 'CP3' etc., so bring them in line with the legacy names
+    df = df.rename(columns={name.replace('EEG Channel Value: ', ''): name for name in LEGACY_COLUMNS})
+
+    return df
+
+# This holds the filtered channels for the feature step without MNE copying them to float64
+class FilteredEEG:
+    def __init__(self, data, ch_names, sfreq):
+        self.data = data
+        self.ch_names = list(ch_names)
+        self.info = {'sfreq': sfreq, 'ch_names': self.ch_names}
+
+    def get_data(self):
+        return self.data
+
+    def to_mne(self):
+        # For plotting or anything else that needs a real MNE object
+        import mne
+        info = mne.create_info(ch_names=self.ch_names, sfreq=self.info['sfreq'], ch_types='eeg')
+        return mne.io.RawArray(self.data, info)
+
+# This is the function to preprocess EEG data (e.g., filtering)
+def preprocess_eeg_data(df, sfreq=256, dtype=np.float32, lowcut=FILTER_SETTINGS['lowcut'],
+                        highcut=FILTER_SETTINGS['highcut'], order=FILTER_SETTINGS['order']):
+    # This will convert timestamps to seconds, as it is normally in milliseconds and can cause confusion
+    df['Timestamp'] = df['Timestamp'] / 1000.0
+    
+    # Extract the EEG channels from the csv
+    eeg_channels = [
+        'EEG Channel Value: CP3',
+        'EEG Channel Value: C3',
+        'EEG Channel Value: F5',
+        'EEG Channel Value: PO3',
+        'EEG Channel Value: PO4',
+        'EEG Channel Value: F6',
+        'EEG Channel Value: C4',
+        'EEG Channel Value: CP4'
+    ]
+    
+    eeg_data = df[eeg_channels].dropna().values.T
+
+    # This applies the band-pass filter
+    def bandpass_filter(data, lowcut, highcut, fs, order=4):
+        nyquist = 0.5 * fs
+        low = lowcut / nyquist
+        high = highcut / nyquist
+        b, a = butter(order, [low, high], btype='band')
+        y = filtfilt(b, a, data, axis=-1)
+        return y
+    
+    # The filter runs in float64 so the large DC offsets don't swamp it; the result is stored as float32
+    filtered_data = bandpass_filter(eeg_data, lowcut, highcut, sfreq, order).astype(dtype)
+    
+    # This wraps the filtered data up to be used in the program
+    raw = FilteredEEG(filtered_data, eeg_channels, sfreq)
+    
+    return raw
+
+# This is the function to extract features from the interpreted data (e.g., power spectral density etc)
+def extract_features(raw, sfreq=256, dtype=np.float32, **psd_settings):
+    psds, freqs = multitaper_psd(raw.get_data(), sfreq, dtype, **psd_settings)
+    psd_df = pd.DataFrame(psds, index=raw.ch_names, columns=freqs)
+    return psd_df
+
+# This calculates the (channels x frequencies) power spectral density, without any DataFrame around it
+def multitaper_psd(data, sfreq=256, dtype=np.float32, **psd_settings):
+    from mne.time_frequency import psd_array_multitaper
+
+    settings = dict(PSD_SETTINGS, **psd_settings)
+
+    # This will calculate power spectral density for each EEG channel
+    psds = []
+    for channel in data:
+        psd, freqs = psd_array_multitaper(channel, sfreq, **settings)
+        psds.append(psd)
+
+    psds = [np.asarray(psd, dtype=dtype) for psd in psds]
+    
+    # This will ensure the PSDs all have the same length
+    min_length = min(psd.shape[0] for psd in psds)
+    psds = np.array([psd[:min_length] for psd in psds], dtype=dtype)
+    freqs = freqs[:min_length]
+    
+    return psds, freqs
+
+# This is the function to analyze drops in concentration, engagement, and memory commitment
+def analyze_eeg_data(psd_df):
+    # Every band and derived feature comes out of one vectorized pass over the PSD
+    features = spectral_features(psd_df.values, psd_df.columns.astype(float))
+    return analysis_frame(psd_df.index, features)
+
+# This lays the (channels x features) matrix from spectral_features out as the analysis table
+def analysis_frame(channels, features):
+    column = {name: features[:, i] for i, name in enumerate(FEATURE_NAMES)}
+    
+    # Creates a DataFrame to hold the results from the analysis
+    analysis_df = pd.DataFrame({
+        'Channel': channels,
+        'Theta Power': column['theta_power'],
+        'Alpha Power': column['alpha_power'],
+        'Beta Power': column['beta_power'],
+        'Gamma Power': column['gamma_power'],
+        'Engagement': column['engagement'],
+        'Memory Commitment': column['memory_commitment'],
+        'Spectral Entropy': column['spectral_entropy'],
+        'Peak Alpha Frequency': column['peak_alpha_frequency']
+    })
+    
+    return analysis_df
+
+# This is the function to load a saved binary session into the same layout as the csv files
+def load_session_frame(base_path):
+    session = open_session(base_path)
+    df = pd.DataFrame(np.asarray(session.data).T, columns=[f'EEG Channel Value: {name}' for name in session.channel_names])
+    df.insert(0, 'Sample Count', np.arange(session.n_samples) % 32)
+    start_time = session.start_time or 0
+    df['Timestamp'] = start_time + np.arange(session.n_samples) * (1000.0 / session.sampling_rate)
+    return df
+
+# This loads either a csv recording or a binary session, whichever the path points at
+def load_recording(file_path):
+    if file_path.endswith(('.npy', '.json')):
+        return load_session_frame(file_path)
+    return load_and_rename_csv(file_path)
+
+# This loads and filters a recording, handing on just the arrays
+def filter_recording(path, sfreq=256, **filter_settings):
+    raw = preprocess_eeg_data(load_recording(path), sfreq, **filter_settings)
+    return raw.get_data(), np.array(raw.ch_names, dtype=str)
+
+# This is the PSD step of the pipeline. It carries the channel names and sample count along with the spectra
+# so that later steps never need to read the (much larger) filtered signal back
+def recording_psd(data, ch_names, sfreq=256, **psd_settings):
+    psds, freqs = multitaper_psd(data, sfreq, **psd_settings)
+    return psds, freqs, ch_names, data.shape[1]
+
+# This is the last step of the pipeline, running analyze_eeg_data on the spectra. The table goes into the
+# cache as its numeric columns and their names, the channel names are already an output of the PSD step
+def analysis_stage(psds, freqs, channels):
+    analysis_df = analyze_eeg_data(pd.DataFrame(psds, index=channels, columns=freqs))
+    values = analysis_df.drop(columns='Channel')
+    return values.to_numpy(), np.array(values.columns, dtype=str)
+
+# This builds the offline pipeline: load/preprocess -> multitaper PSD -> analysis.
+# Arrays are handed from stage to stage in memory; only the stages named in checkpoints are written to the
+# cache, keyed by the recording's contents, the settings and each stage's code, so an edit to the analysis
+# only reruns the analysis and an unchanged recording goes straight to results. The filtered signal is as
+# large as the recording itself, so by default only the much smaller spectra and features are kept
+def offline_pipeline(sfreq=256, cache=None, checkpoints=('psd', 'analysis'), trace_memory=False):
+    stages = [
+        Stage('filtered', filter_recording, ['path'], ['data', 'ch_names'], dict(FILTER_SETTINGS, sfreq=sfreq),
+              code=(load_recording, load_and_rename_csv, load_session_frame, preprocess_eeg_data)),
+        Stage('psd', recording_psd, ['data', 'ch_names'], ['psds', 'freqs', 'channels', 'samples'],
+              dict(PSD_SETTINGS, sfreq=sfreq), code=(multitaper_psd,)),
+        Stage('analysis', analysis_stage, ['psds', 'freqs', 'channels'], ['analysis', 'analysis_columns'],
+              code=(analyze_eeg_data, analysis_frame, spectral_features), constants=(OFFLINE_BANDS, FEATURE_NAMES)),
+    ]
+    return Pipeline(stages, cache, trace_memory).checkpoint(*checkpoints)
+
+# This identifies a recording by its contents; a binary session is its samples plus the .json
+# holding the rate, channels and start time
+def recording_digest(file_path):
+    if file_path.endswith(('.npy', '.json')):
+        base_path = file_path.rsplit('.', 1)[0]
+        return [file_digest(base_path + '.npy'), file_digest(base_path + '.json')]
+    return file_digest(file_path)
+
+# This runs the offline pipeline on one recording and returns the PSD and analysis tables.
+# The per-stage timings (and memory, with trace_memory) are left in analysis_df.attrs['stages']
+def analyze_recording(file_path, sfreq=256, cache=None, checkpoints=('psd', 'analysis'), trace_memory=False):
+    pipeline = offline_pipeline(sfreq, cache or FeatureCache(), checkpoints, trace_memory)
+    targets = ['channels', 'psds', 'freqs', 'samples', 'analysis', 'analysis_columns']
+    results = pipeline.run({'path': file_path}, targets, source_keys={'path': recording_digest(file_path)})
+
+    channels = results['channels'].tolist()
+    psd_df = pd.DataFrame(results['psds'], index=channels, columns=results['freqs'])
+    psd_df.index.name = 'Time'
+    analysis_df = pd.DataFrame(results['analysis'], columns=results['analysis_columns'].tolist())
+    analysis_df.insert(0, 'Channel', channels)
+    # How much signal the results cover, for reporting throughput without reloading the recording
+    analysis_df.attrs['samples'] = int(results['samples'])
+    analysis_df.attrs['stages'] = pipeline.report
+    return psd_df, analysis_df
@@ -0,0 +1,141 @@
+import numpy as np
+
+from eeg_session import CHANNEL_NAMES
+
+# Order of the rows in the flags array returned by ArtifactDetector.check
+ARTIFACT_TYPES = ('amplitude', 'flatline', 'step', 'blink')
+
+
+class ArtifactDetector:
+    """Flags each channel of an incoming (cleaned) epoch for amplitude, flatline, step and blink artifacts."""
+
+    def __init__(self, max_amplitude=150.0, min_peak_to_peak=0.5, max_step=80.0,
+                 blink_amplitude=100.0, blink_ratio=3.0, channel_names=CHANNEL_NAMES):
+        self.max_amplitude = max_amplitude
+        self.min_peak_to_peak = min_peak_to_peak
+        self.max_step = max_step
+        self.blink_amplitude = blink_amplitude
+        self.blink_ratio = blink_ratio
+        self.frontal = [channel_names.index(name) for name in ('F5', 'F6') if name in channel_names]
+        self.posterior = [channel_names.index(name) for name in ('PO3', 'PO4') if name in channel_names]
+        self._last_sample = None
+
+    def reset(self):
+        self._last_sample = None
+
+    def check(self, epoch):
+        """Returns (clean_mask, flags): clean_mask is (channels,), flags is (artifact types x channels)."""
+        epoch = np.asarray(epoch)
+        n_channels = epoch.shape[0]
+        flags = np.zeros((len(ARTIFACT_TYPES), n_channels), dtype=bool)
+
+        peak_to_peak = np.ptp(epoch, axis=1)
+        flags[0] = np.abs(epoch).max(axis=1) > self.max_amplitude
+        flags[1] = peak_to_peak < self.min_peak_to_peak
+
+        # Sample-to-sample jumps, including the one across the previous epoch's last sample
+        if self._last_sample is not None and self._last_sample.shape[0] == n_channels:
+            steps = np.abs(np.diff(epoch, axis=1, prepend=self._last_sample[:, None]))
+        else:
+            steps = np.abs(np.diff(epoch, axis=1))
+        flags[2] = steps.max(axis=1, initial=0) > self.max_step
+        self._last_sample = epoch[:, -1].copy()
+
+        # Blinks: a large deflection on both frontal channels that the posterior channels don't share
+        if self.frontal and self.posterior:
+            frontal = peak_to_peak[self.frontal]
+            posterior = peak_to_peak[self.posterior].mean()
+            if frontal.min() > self.blink_amplitude and frontal.mean() > self.blink_ratio * posterior:
+                flags[3, self.frontal] = True
+
+        return ~flags.any(axis=0), flags
+
+
+# Scalp neighbours of each Crown channel, used to spot channels that stop tracking their surroundings
+CHANNEL_NEIGHBOURS = {
+    'CP3': ('C3', 'PO3'),
+    'C3': ('CP3', 'F5'),
+    'F5': ('C3', 'F6'),
+    'PO3': ('CP3', 'PO4'),
+    'PO4': ('CP4', 'PO3'),
+    'F6': ('C4', 'F5'),
+    'C4': ('CP4', 'F6'),
+    'CP4': ('C4', 'PO4')
+}
+
+
+class ChannelQualityMonitor:
+    """Rolling per-channel signal quality from exponentially weighted running statistics.
+
+    Tracks variance, the share of power at the mains frequency and the correlation with
+    scalp neighbours, updating them per epoch without keeping any history.
+    """
+
+    def __init__(self, fs=256, notch=50.0, smoothing=0.05, min_variance=0.25, max_variance=1e4,
+                 max_line_ratio=0.5, min_neighbour_correlation=0.2, warmup_epochs=16,
+                 channel_names=CHANNEL_NAMES):
+        self.fs = fs
+        self.notch = notch
+        self.smoothing = smoothing
+        self.min_variance = min_variance
+        self.max_variance = max_variance
+        self.max_line_ratio = max_line_ratio
+        self.min_neighbour_correlation = min_neighbour_correlation
+        self.warmup_epochs = warmup_epochs
+        n_channels = len(channel_names)
+        self.neighbours = np.zeros((n_channels, n_channels))
+        for name, neighbours in CHANNEL_NEIGHBOURS.items():
+            for neighbour in neighbours:
+                self.neighbours[channel_names.index(name), channel_names.index(neighbour)] = 1.0
+        self.reset()
+
+    def reset(self):
+        n_channels = self.neighbours.shape[0]
+        self.covariance = np.zeros((n_channels, n_channels))
+        self.line_ratio = np.zeros(n_channels)
+        self.epochs_seen = 0
+        self.quality = np.ones(n_channels)
+        self.good = np.ones(n_channels, dtype=bool)
+
+    @property
+    def variance(self):
+        return np.diag(self.covariance)
+
+    def neighbour_correlation(self):
+        """Best correlation with any scalp neighbour, so one bad neighbour doesn't condemn a channel."""
+        deviation = np.sqrt(np.maximum(self.variance, 1e-12))
+        correlation = self.covariance / np.outer(deviation, deviation)
+        return np.where(self.neighbours > 0, correlation, -np.inf).max(axis=1)
+
+    def update(self, raw_epoch, cleaned_epoch):
+        """Folds one epoch into the running statistics and returns the good-channel mask."""
+        raw_epoch = np.asarray(raw_epoch, dtype=np.float64)
+        cleaned_epoch = np.asarray(cleaned_epoch, dtype=np.float64)
+        n = cleaned_epoch.shape[1]
+        # Weight the first epochs more heavily so the statistics settle quickly
+        weight = max(self.smoothing, 1.0 / (self.epochs_seen + 1))
+
+        # Running covariance of the cleaned data gives variance and neighbour correlation together
+        self.covariance += weight * (cleaned_epoch @ cleaned_epoch.T / n - self.covariance)
+
+        # Share of the raw epoch's (offset-removed) power sitting at the mains frequency
+        centred = raw_epoch - raw_epoch.mean(axis=1, keepdims=True)
+        phasor = np.exp(-2j * np.pi * self.notch * np.arange(n) / self.fs)
+        line_power = 2.0 * np.abs(centred @ phasor) ** 2 / n ** 2
+        total_power = np.maximum(np.mean(centred ** 2, axis=1), 1e-12)
+        self.line_ratio += weight * (np.minimum(line_power / total_power, 1.0) - self.line_ratio)
+        self.epochs_seen += 1
+
+        # Quality is the share of checks a channel passes; it only counts as good once warmed up
+        variance = self.variance
+        correlation = self.neighbour_correlation()
+        checks = np.vstack([
+            variance >= self.min_variance,
+            variance <= self.max_variance,
+            self.line_ratio <= self.max_line_ratio,
+            correlation >= self.min_neighbour_correlation
+        ])
+        self.quality = checks.mean(axis=0)
+        if self.epochs_seen >= self.warmup_epochs:
+            self.good = checks.all(axis=0)
+        return self.good
@@ -0,0 +1,150 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from eeg_pipeline import format_report
+
+MANIFEST_NAME = "batch_manifest.json"
+SESSION_PATTERNS = ("*.csv", "*.npy")
+
+
+def find_sessions(source):
+    """Expands a directory or glob into the list of recordings to process.
+
+    The live app saves each recording both as X.csv and as the binary X.npy + X.json,
+    so a recording is listed once per stem, as the binary session when it has both.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for pattern in SESSION_PATTERNS:
+            paths.extend(glob.glob(os.path.join(source, pattern)))
+    else:
+        paths = glob.glob(source)
+    by_stem = {}
+    for path in sorted(os.path.abspath(path) for path in paths):
+        stem, extension = os.path.splitext(path)
+        binary = extension == ".npy" and os.path.exists(stem + ".json")
+        if stem not in by_stem or binary:
+            by_stem[stem] = path
+    return sorted(by_stem.values())
+
+
+def load_manifest(out_dir):
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def save_manifest(out_dir, manifest):
+    """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def input_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def is_done(manifest, path):
+    """An input is done if the manifest has it and the file hasn't changed since."""
+    entry = manifest.get(path)
+    return entry is not None and entry.get("signature") == input_signature(path)
+
+
+def process_session(path, out_dir, sfreq=256, trace_memory=False):
+    """Runs load -> preprocess -> features -> analysis on one recording in a worker process."""
+    # Imported here so the parent process doesn't pay for MNE when everything is already done
+    from eeg_analysis import analyze_recording
+
+    started = time.perf_counter()
+    features, analysis = analyze_recording(path, sfreq, trace_memory=trace_memory)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    features_path = os.path.join(out_dir, f"{name} - Extracted_Features.csv")
+    analysis_path = os.path.join(out_dir, f"{name} - EEG_Analysis.csv")
+    features.to_csv(features_path)
+    analysis.to_csv(analysis_path)
+
+    return {
+        "signature": input_signature(path),
+        "samples": analysis.attrs['samples'],
+        "seconds": time.perf_counter() - started,
+        "outputs": [features_path, analysis_path],
+        "stages": analysis.attrs['stages']
+    }
+
+
+def run_batch(source, out_dir, workers=None, sfreq=256, force=False, trace_memory=False):
+    """Processes every recording in source across a process pool, skipping those already done."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else load_manifest(out_dir)
+    # Leave out our own results in case the output folder sits inside the source folder
+    paths = [path for path in find_sessions(source) if os.path.dirname(path) != os.path.abspath(out_dir)]
+    pending = [path for path in paths if not is_done(manifest, path)]
+    print(f"{len(paths)} sessions found, {len(paths) - len(pending)} already done, {len(pending)} to process.")
+
+    started = time.perf_counter()
+    done_sessions = 0
+    done_samples = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_session, path, out_dir, sfreq, trace_memory): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                entry = future.result()
+            except Exception as error:
+                failed.append(path)
+                print(f"Failed: {path} ({error})")
+                continue
+            stages = entry.pop("stages")
+            # Record each session as soon as it finishes so an interrupted run can resume
+            manifest[path] = entry
+            save_manifest(out_dir, manifest)
+            done_sessions += 1
+            done_samples += entry["samples"]
+            print(f"Done: {os.path.basename(path)} ({entry['samples']} samples in {entry['seconds']:.2f} s)")
+            if trace_memory:
+                print(format_report(stages))
+
+    elapsed = time.perf_counter() - started
+    if done_sessions:
+        print(f"Processed {done_sessions} sessions / {done_samples} samples in {elapsed:.2f} s: "
+              f"{done_sessions / elapsed:.2f} sessions/s, {done_samples / elapsed:.0f} samples/s")
+    return manifest, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-run the EEG analysis pipeline over a folder or glob of recordings.")
+    parser.add_argument("source", help="Directory of .csv/.npy recordings, or a glob such as 'data/*.csv'")
+    parser.add_argument("-o", "--out-dir", default="batch_output", help="Where results and the manifest are written")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--sfreq", type=int, default=256, help="Sampling rate of the recordings")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and reprocess everything")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Report each pipeline stage's peak memory (slows the stages down)")
+    parser.add_argument("--convert", action="store_true",
+                        help="Only convert the CSVs into the binary session format in --out-dir")
+    args = parser.parse_args(argv)
+
+    if args.convert:
+        from eeg_ingest import convert_csv_archive
+        started = time.perf_counter()
+        converted = convert_csv_archive(args.source, args.out_dir, args.sfreq)
+        print(f"Converted {len(converted)} files in {time.perf_counter() - started:.2f} s.")
+        return 0
+
+    _, failed = run_batch(args.source, args.out_dir, args.workers, args.sfreq, args.force, args.trace_memory)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+CACHE_DIR = ".eeg_cache"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Hash of a file's contents, read in chunks so a long recording never sits in memory."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_digest(*functions):
+    """Hash of the functions' source, so editing a stage invalidates what it cached."""
+    digest = hashlib.blake2b(digest_size=16)
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+
+def stage_key(*parts):
+    """Combines an upstream key, settings and code digests into one stage key."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class FeatureCache:
+    """Intermediate arrays of the offline pipeline, one .npz per stage and key."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def path(self, stage, key):
+        return os.path.join(self.directory, f"{stage}-{key}.npz")
+
+    def load(self, stage, key):
+        """Returns the stored arrays as a dict, or None on a miss."""
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as stored:
+            return {name: stored[name] for name in stored.files}
+
+    def save(self, stage, key, **arrays):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(stage, key)
+        # Written under a temporary name first so parallel batch workers never read half a file
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, **arrays)
+        os.replace(temporary, path)
+        return path
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
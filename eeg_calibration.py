@@ -0,0 +1,145 @@
+import os
+import re
+import time
+
+import numpy as np
+
+from eeg_dsp import BAND_NAMES
+from eeg_session import CHANNEL_NAMES
+
+CALIBRATION_DIR = "calibration"
+GUEST = "Guest"  # Shared by anyone who hasn't logged in, so never given a stored profile
+POWER_FLOOR = 1e-6  # Keeps log power finite on a flat channel
+
+
+def log_power(band_powers):
+    """Band power is roughly log-normal across time and people, so baselines are kept in log10 units."""
+    return np.log10(np.maximum(np.asarray(band_powers, dtype=np.float32), POWER_FLOOR))
+
+
+class BaselineAccumulator:
+    """Running per-channel, per-band mean and variance of log band power (Welford), fed once per hop.
+
+    Channels masked out as contaminated are skipped for that update, so each channel keeps
+    its own count.
+    """
+
+    def __init__(self, n_channels=len(CHANNEL_NAMES), n_bands=len(BAND_NAMES)):
+        self.shape = (n_channels, n_bands)
+        self.reset()
+
+    def reset(self):
+        self.count = np.zeros(self.shape[0], dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+        self.updates = 0
+
+    def update(self, band_powers, channel_mask=None):
+        values = log_power(band_powers).astype(np.float64)
+        mask = np.ones(self.shape[0], dtype=bool) if channel_mask is None else np.asarray(channel_mask, dtype=bool)
+        self.updates += 1
+        if not mask.any():
+            return
+        self.count += mask
+        delta = values - self.mean
+        self.mean += np.where(mask[:, None], delta / np.maximum(self.count, 1)[:, None], 0.0)
+        self.m2 += np.where(mask[:, None], delta * (values - self.mean), 0.0)
+
+    def baseline(self, username, min_count=8, **config):
+        """Freezes the statistics into a UserBaseline.
+
+        Channels with fewer than min_count clean updates borrow the average of the others.
+        """
+        enough = self.count >= max(min_count, 2)
+        if not enough.any():
+            raise ValueError("Not enough clean data to calibrate a baseline")
+        variance = self.m2 / np.maximum(self.count - 1, 1)[:, None]
+        mean = np.where(enough[:, None], self.mean, self.mean[enough].mean(axis=0))
+        variance = np.where(enough[:, None], variance, variance[enough].mean(axis=0))
+        return UserBaseline(username, mean, np.sqrt(variance), self.count, created=time.time(), config=config)
+
+
+class UserBaseline:
+    """One user's resting log band power (channels x bands) to score live readings against."""
+
+    def __init__(self, username, mean, std, count, created=None, config=None):
+        self.username = username
+        self.mean = np.asarray(mean, dtype=np.float32)
+        # A floor on the spread stops a near-constant channel from turning noise into huge z-scores
+        self.std = np.maximum(np.asarray(std, dtype=np.float32), np.float32(0.05))
+        self.count = np.asarray(count, dtype=np.int64)
+        self.created = time.time() if created is None else created
+        self.config = dict(config or {})
+
+    def zscore(self, band_powers):
+        """(channels x bands) z-scores of the current band powers against this baseline."""
+        return (log_power(band_powers) - self.mean) / self.std
+
+    def band_zscores(self, band_powers, channel_mask=None):
+        """Per-band z-score averaged over the clean channels; None if no channel is clean."""
+        z = self.zscore(band_powers)
+        if channel_mask is not None:
+            if not channel_mask.any():
+                return None
+            z = z[channel_mask]
+        return z.mean(axis=0)
+
+    def matches(self, **config):
+        """True if the baseline was recorded with the same engine and window settings."""
+        return all(self.config.get(key) == value for key, value in config.items())
+
+
+def user_file_path(directory, usernames, username):
+    """Path of a known user's .npz in a per-user directory."""
+    if username not in usernames:
+        raise KeyError(f"Unknown user: {username}")
+    # Usernames are free text, so keep only characters that are safe in a file name
+    return os.path.join(directory, re.sub(r"[^\w.-]", "_", username) + ".npz")
+
+
+def save_user_file(path, **arrays):
+    """Writes a per-user .npz via a temporary file, so a crash never leaves a half-written profile."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = path + ".tmp.npz"
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+    return path
+
+
+class BaselineCache:
+    """Per-user baselines on disk, one small .npz per username listed in User_List.txt."""
+
+    def __init__(self, usernames, directory=CALIBRATION_DIR):
+        self.usernames = set(usernames)
+        self.directory = directory
+
+    def path(self, username):
+        return user_file_path(self.directory, self.usernames, username)
+
+    def load(self, username, max_age_days=None, **config):
+        """Returns the stored baseline, or None if there is none, it is too old or the settings changed."""
+        if username == GUEST or username not in self.usernames:
+            return None
+        path = self.path(username)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as stored:
+            keys = [str(key) for key in stored['config_keys']]
+            values = [str(value) for value in stored['config_values']]
+            baseline = UserBaseline(str(stored['username']), stored['mean'], stored['std'], stored['count'],
+                                    float(stored['created']), dict(zip(keys, values)))
+        if max_age_days is not None and time.time() - baseline.created > max_age_days * 86400:
+            return None
+        if not baseline.matches(**{key: str(value) for key, value in config.items()}):
+            return None
+        return baseline
+
+    def save(self, baseline):
+        """Stores a baseline for a known, logged-in user; guests are never persisted."""
+        if baseline.username == GUEST:
+            return None
+        config = {key: str(value) for key, value in baseline.config.items()}
+        return save_user_file(self.path(baseline.username), username=baseline.username, mean=baseline.mean,
+                              std=baseline.std, count=baseline.count, created=baseline.created,
+                              config_keys=np.array(list(config), dtype=str),
+                              config_values=np.array(list(config.values()), dtype=str))
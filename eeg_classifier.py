@@ -0,0 +1,130 @@
+import os
+import time
+
+import numpy as np
+
+import eeg_markers
+from eeg_calibration import GUEST, log_power, save_user_file, user_file_path
+from eeg_dsp import ASYMMETRY_PAIRS, BAND_NAMES, band_features
+
+CLASSIFIER_DIR = "classifier"
+
+# Marker labels a session can be trained from, and the class each stands for (1 = focused)
+TRAINING_LABELS = {
+    eeg_markers.LABEL_FOCUSED: 1.0,
+    eeg_markers.LABEL_DISTRACTED: 0.0
+}
+
+# Hemisphere pairs whose alpha asymmetry goes into the features
+ASYMMETRY_FEATURE_PAIRS = ('frontal', 'parietal')
+
+FEATURE_NAMES = tuple(f'{band}_log_power' for band in BAND_NAMES) + \
+    tuple(f'{band}_relative' for band in BAND_NAMES) + ('log_engagement',) + \
+    tuple(f'{pair}_alpha_asymmetry' for pair in ASYMMETRY_FEATURE_PAIRS)
+
+
+def classifier_features(band_powers, channel_mask=None):
+    """One float32 feature vector from a (channels x bands) power matrix, over the clean channels.
+
+    Log power of each band, each band's share of the total, log engagement
+    (beta / (alpha + theta)) and the frontal and parietal alpha asymmetry from
+    band_features. Returns None if no channel is clean.
+    """
+    powers = np.asarray(band_powers, dtype=np.float32)
+    if channel_mask is not None:
+        if not channel_mask.any():
+            return None
+        powers = powers[channel_mask]
+    bands = np.maximum(powers.mean(axis=0), np.float32(1e-6))
+    theta, alpha, beta = (bands[BAND_NAMES.index(name)] for name in ('theta', 'alpha', 'beta'))
+
+    # A pair with a masked channel has no asymmetry, and counts as balanced
+    asymmetry = band_features(band_powers, channel_mask)['asymmetry']
+    rows = [list(ASYMMETRY_PAIRS).index(pair) for pair in ASYMMETRY_FEATURE_PAIRS]
+    alpha_asymmetry = np.nan_to_num(asymmetry[rows, BAND_NAMES.index('alpha')], nan=0.0, posinf=0.0, neginf=0.0)
+    return np.concatenate([log_power(bands), bands / bands.sum(), [np.log10(beta / (alpha + theta))],
+                           alpha_asymmetry]).astype(np.float32)
+
+
+class OnlineLogisticRegression:
+    """Logistic regression trained one labelled example at a time with SGD.
+
+    Features are standardised with running means and variances updated on the same
+    examples, so raw log powers and ratios can go straight in. Everything is a handful
+    of small vector operations, a few microseconds per predict or update.
+    """
+
+    def __init__(self, n_features=len(FEATURE_NAMES), learning_rate=0.05, l2=1e-4):
+        self.n_features = n_features
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.reset()
+
+    def reset(self):
+        self.weights = np.zeros(self.n_features)
+        self.bias = 0.0
+        self.count = 0
+        self.mean = np.zeros(self.n_features)
+        self.m2 = np.zeros(self.n_features)
+
+    def _standardise(self, x):
+        if self.count < 2:
+            return x - self.mean
+        return (x - self.mean) / np.sqrt(self.m2 / (self.count - 1) + 1e-6)
+
+    def predict_proba(self, x):
+        """Probability of class 1 (focused) for one feature vector."""
+        score = float(self._standardise(np.asarray(x, dtype=np.float64)) @ self.weights) + self.bias
+        return 1.0 / (1.0 + np.exp(-score))
+
+    def update(self, x, y, weight=1.0):
+        """One SGD step on a labelled example (y is 1 or 0); returns the probability before the step."""
+        x = np.asarray(x, dtype=np.float64)
+        # Welford update of the feature statistics
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+        z = self._standardise(x)
+        probability = 1.0 / (1.0 + np.exp(-(float(z @ self.weights) + self.bias)))
+        # Step size decays slowly so early examples can move the model and later ones refine it
+        rate = self.learning_rate / np.sqrt(1.0 + self.count / 100.0)
+        error = weight * (probability - y)
+        self.weights -= rate * (error * z + self.l2 * self.weights)
+        self.bias -= rate * error
+        return probability
+
+
+class ClassifierStore:
+    """Per-user classifier weights, one small .npz per username listed in User_List.txt."""
+
+    def __init__(self, usernames, directory=CLASSIFIER_DIR):
+        self.usernames = set(usernames)
+        self.directory = directory
+
+    def path(self, username):
+        return user_file_path(self.directory, self.usernames, username)
+
+    def load(self, username):
+        """Returns the user's classifier, or a fresh one if none has been trained yet."""
+        classifier = OnlineLogisticRegression()
+        if username == GUEST or username not in self.usernames or not os.path.exists(self.path(username)):
+            return classifier
+        with np.load(self.path(username), allow_pickle=False) as stored:
+            if tuple(str(name) for name in stored['feature_names']) != FEATURE_NAMES:
+                return classifier  # Trained on different features, start again
+            classifier.weights = stored['weights'].astype(np.float64)
+            classifier.bias = float(stored['bias'])
+            classifier.count = int(stored['count'])
+            classifier.mean = stored['mean'].astype(np.float64)
+            classifier.m2 = stored['m2'].astype(np.float64)
+        return classifier
+
+    def save(self, username, classifier):
+        """Stores a logged-in user's classifier; guests' and untrained ones are not kept."""
+        if username == GUEST or classifier.count == 0:
+            return None
+        return save_user_file(self.path(username), weights=classifier.weights, bias=classifier.bias,
+                              count=classifier.count, mean=classifier.mean, m2=classifier.m2,
+                              feature_names=np.array(FEATURE_NAMES), saved=time.time())
@@ -0,0 +1,544 @@
+import numpy as np
+from scipy.signal import butter, group_delay, iirnotch, lfilter, sos2tf, sosfilt, sosfilt_zi, tf2sos
+
+from eeg_session import CHANNEL_NAMES, SAMPLING_RATE, SampleRingBuffer
+
+
+def parse_notch_frequency(value, default=50.0):
+    """Turns the SDK's notchFrequency (e.g. '50Hz') into a number."""
+    if value is None:
+        return default
+    try:
+        return float(str(value).lower().replace("hz", "").strip())
+    except ValueError:
+        return default
+
+
+class StreamingSOSFilter:
+    """Applies second-order sections to (channels x n) blocks, carrying filter state between calls.
+
+    Coefficients, state and output all share `dtype`, so a float32 filter never promotes.
+    """
+
+    def __init__(self, sos, n_channels=8, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self.sos = np.asarray(sos, dtype=self.dtype)
+        self.n_channels = n_channels
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, block):
+        block = np.asarray(block, dtype=self.dtype)
+        if self.zi is None:
+            # Start from the steady state for the first sample so a large offset doesn't ring
+            self.zi = (sosfilt_zi(self.sos)[:, None, :] * block[:, :1][None, :, :]).astype(self.dtype)
+        filtered, self.zi = sosfilt(self.sos, block, axis=-1, zi=self.zi)
+        return filtered
+
+
+def preprocessing_sos(fs=SAMPLING_RATE, highpass=0.5, notch=50.0, notch_q=30.0, order=2):
+    """Designs the DC-blocking high-pass and mains notch as one cascade of second-order sections."""
+    sections = [butter(order, highpass, btype="highpass", fs=fs, output="sos")]
+    if notch and notch < fs / 2:
+        b, a = iirnotch(notch, notch_q, fs=fs)
+        sections.append(tf2sos(b, a))
+    return np.concatenate(sections, axis=0)
+
+
+class EEGPreprocessor:
+    """Stateful DC removal and notch stage run on every epoch before band extraction.
+
+    The raw Crown samples ride on offsets of tens of thousands of microvolts, which float32
+    can only resolve to a few hundredths, so the filter itself runs in float64 and only the
+    offset-free output is handed on as `dtype`.
+    """
+
+    def __init__(self, fs=SAMPLING_RATE, highpass=0.5, notch=50.0, n_channels=8, dtype=np.float32):
+        self.highpass = highpass
+        self.n_channels = n_channels
+        self.fs = fs
+        self.notch = notch
+        self.dtype = np.dtype(dtype)
+        self.filter = StreamingSOSFilter(preprocessing_sos(fs, highpass, notch), n_channels, np.float64)
+
+    def reset(self):
+        self.filter.reset()
+
+    def configure(self, info):
+        """Follows the sampling rate and notch frequency the device reports, redesigning if they change."""
+        fs = info.get('samplingRate', self.fs)
+        notch = parse_notch_frequency(info.get('notchFrequency'), self.notch)
+        if fs != self.fs or notch != self.notch:
+            self.fs = fs
+            self.notch = notch
+            self.filter = StreamingSOSFilter(preprocessing_sos(fs, self.highpass, notch), self.n_channels,
+                                             np.float64)
+
+    def process(self, epoch, info=None):
+        if info is not None:
+            self.configure(info)
+        return self.filter.process(epoch).astype(self.dtype, copy=False)
+
+
+class Rereferencer:
+    """Online re-referencing to the common average of the good channels, or to chosen channels."""
+
+    def __init__(self, reference='average', channel_names=CHANNEL_NAMES):
+        self.channel_names = list(channel_names)
+        self.set_reference(reference)
+
+    def set_reference(self, reference):
+        """Accepts 'average', 'none' or channel names (a list or a comma-separated string)."""
+        if isinstance(reference, str) and reference.lower() in ('average', 'none'):
+            self.reference = reference.lower()
+            self.reference_channels = None
+        else:
+            names = reference.split(',') if isinstance(reference, str) else reference
+            self.reference = 'channels'
+            self.reference_channels = [self.channel_names.index(name.strip()) for name in names]
+
+    def process(self, block, good=None):
+        block = np.asarray(block)
+        if self.reference == 'none':
+            return block
+        if self.reference == 'average':
+            # Bad channels would drag every other channel with them, so leave them out of the average
+            rows = block[good] if good is not None and good.any() else block
+        else:
+            rows = block[self.reference_channels]
+        return block - rows.mean(axis=0, keepdims=True)
+
+
+class StreamingDecimator:
+    """Anti-alias low-pass plus downsampling by an integer factor, continuous across blocks."""
+
+    def __init__(self, factor, fs=SAMPLING_RATE, n_channels=8, order=8, dtype=np.float32):
+        self.factor = factor
+        # Cut off at 80% of the new Nyquist frequency so little aliases back in
+        cutoff = 0.8 * (fs / factor) / 2
+        self.filter = StreamingSOSFilter(butter(order, cutoff, btype="lowpass", fs=fs, output="sos"), n_channels,
+                                         dtype)
+        self.phase = 0  # Offset of the next kept sample within the next block
+
+    def reset(self):
+        self.filter.reset()
+        self.phase = 0
+
+    def process(self, block):
+        filtered = self.filter.process(block)
+        decimated = filtered[:, self.phase::self.factor]
+        self.phase = (self.phase - filtered.shape[1]) % self.factor
+        return decimated
+
+
+RAW_RATE = 'raw'
+FEATURE_RATE = 'features'
+
+
+class MultiRateStream:
+    """Fans the cleaned stream out at full rate, at anti-aliased lower tiers and as band features.
+
+    Consumers subscribe to the lowest rate they need; tiers with no subscriber below
+    them are not computed at all.
+    """
+
+    def __init__(self, fs=SAMPLING_RATE, tiers=(64, 16), n_channels=8, dtype=np.float32):
+        self.fs = fs
+        self.tiers = tuple(tiers)
+        self.subscribers = {RAW_RATE: [], FEATURE_RATE: []}
+        self.decimators = []
+        rate = fs
+        for tier in self.tiers:
+            self.subscribers[tier] = []
+            self.decimators.append(StreamingDecimator(rate // tier, rate, n_channels, dtype=dtype))
+            rate = tier
+
+    def subscribe(self, rate, callback):
+        """Registers callback(block) for a rate: RAW_RATE, one of the tiers (Hz) or FEATURE_RATE."""
+        self.subscribers[rate].append(callback)
+        if rate in self.tiers:
+            for decimator in self.decimators:
+                decimator.reset()
+
+    def reset(self):
+        for decimator in self.decimators:
+            decimator.reset()
+
+    def push(self, block):
+        for callback in self.subscribers[RAW_RATE]:
+            callback(block)
+        # Each tier is decimated from the one above it, and only while something below still listens
+        for depth, (tier, decimator) in enumerate(zip(self.tiers, self.decimators)):
+            if not any(self.subscribers[lower] for lower in self.tiers[depth:]):
+                break
+            block = decimator.process(block)
+            if block.shape[1]:
+                for callback in self.subscribers[tier]:
+                    callback(block)
+
+    def publish_features(self, features):
+        for callback in self.subscribers[FEATURE_RATE]:
+            callback(features)
+
+
+# Frequency bands used by the live band-power engines (Hz)
+BAND_EDGES = {
+    'theta': (4, 8),
+    'alpha': (8, 13),
+    'beta': (13, 30),
+    'gamma': (30, 50)
+}
+BAND_NAMES = tuple(BAND_EDGES)
+
+
+class IIRBandPower:
+    """The original engine: band-pass with a 4th-order Butterworth per band and take the mean square.
+
+    The filters carry their state from block to block, and a running sum of the squared
+    output covers the last `window` samples, so every sample is filtered once however often
+    the power is read. The (b, a) form has poles too close to the unit circle for float32,
+    so the filtering and the sums stay in float64 and only the powers come back as `dtype`.
+    """
+
+    def __init__(self, fs=SAMPLING_RATE, window=SAMPLING_RATE, n_channels=8, bands=BAND_EDGES, order=4,
+                 dtype=np.float32):
+        self.fs = fs
+        self.window = window
+        self.n_channels = n_channels
+        self.dtype = np.dtype(dtype)
+        self.coefficients = [butter(order, band, btype="band", fs=fs) for band in bands.values()]
+        self.reset()
+
+    def reset(self):
+        self.zi = [np.zeros((self.n_channels, len(a) - 1)) for b, a in self.coefficients]
+        self.squares = np.zeros((len(self.coefficients), self.n_channels, self.window))  # Ring of squared outputs
+        self.sums = np.zeros((len(self.coefficients), self.n_channels))
+        self.position = 0
+        self.filled = 0
+        self.since_resync = 0
+
+    def update(self, block):
+        """Filters a (channels x n) block and returns the (channels x bands) power over the last window."""
+        block = np.asarray(block, dtype=np.float64)
+        n = block.shape[1]
+        if n > self.window:
+            for start in range(0, n, self.window):
+                powers = self.update(block[:, start:start + self.window])
+            return powers
+
+        squares = np.empty((len(self.coefficients), block.shape[0], n))
+        for i, (b, a) in enumerate(self.coefficients):
+            filtered, self.zi[i] = lfilter(b, a, block, axis=-1, zi=self.zi[i])
+            squares[i] = filtered ** 2
+
+        # Swap the squares leaving the window for the new ones
+        leaving_index = (self.position + np.arange(n)) % self.window
+        self.sums += squares.sum(axis=-1) - self.squares[:, :, leaving_index].sum(axis=-1)
+        self.squares[:, :, leaving_index] = squares
+        self.position = (self.position + n) % self.window
+        self.filled = min(self.filled + n, self.window)
+
+        # Re-add the sums from the ring once per window so rounding error can't build up
+        self.since_resync += n
+        if self.since_resync >= self.window:
+            self.sums = self.squares.sum(axis=-1)
+            self.since_resync = 0
+        return (self.sums / max(self.filled, 1)).T.astype(self.dtype)
+
+
+class SlidingDFTBandPower:
+    """Band power from a recursive sliding DFT over the last `window` samples of every channel.
+
+    Only the DFT bins inside the bands are tracked, so each new sample costs the same
+    whatever the window length. The bins are re-derived from the buffer with an FFT once
+    per window to stop rounding error building up in the recursion.
+    """
+
+    def __init__(self, fs=SAMPLING_RATE, window=SAMPLING_RATE, n_channels=8, bands=BAND_EDGES, dtype=np.float32):
+        self.fs = fs
+        self.window = window
+        self.n_channels = n_channels
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        freqs = np.fft.rfftfreq(window, 1.0 / fs)
+        band_bins = [np.flatnonzero((freqs >= low) & (freqs < high)) for low, high in bands.values()]
+        self.bins = np.concatenate(band_bins)
+        # Which tracked bin belongs to which band, as a (bins x bands) 0/1 matrix for one matmul
+        self.band_matrix = np.zeros((self.bins.size, len(band_bins)), dtype=self.dtype)
+        offset = 0
+        for i, bins in enumerate(band_bins):
+            self.band_matrix[offset:offset + bins.size, i] = 1.0
+            offset += bins.size
+        self.twiddle = np.exp(2j * np.pi * self.bins / window)  # Kept in complex128, weights are cast once
+        self._weights = {}  # Twiddle powers per block length, SDK epochs are always 16
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros((self.n_channels, self.window), dtype=self.dtype)
+        self.position = 0
+        self.since_resync = 0
+        self.spectrum = np.zeros((self.n_channels, self.bins.size), dtype=self.complex_dtype)
+
+    def _resync(self):
+        ordered = np.roll(self.buffer, -self.position, axis=1)
+        self.spectrum = np.fft.rfft(ordered, axis=1)[:, self.bins].astype(self.complex_dtype)
+        self.since_resync = 0
+
+    def update(self, block):
+        """Slides the DFT over a (channels x n) block and returns the (channels x bands) power matrix."""
+        block = np.asarray(block, dtype=self.dtype)
+        n = block.shape[1]
+        if n > self.window:
+            for start in range(0, n, self.window):
+                powers = self.update(block[:, start:start + self.window])
+            return powers
+
+        # Samples leaving the window, in the same order as the new ones arriving
+        leaving_index = (self.position + np.arange(n)) % self.window
+        delta = block - self.buffer[:, leaving_index]
+        self.buffer[:, leaving_index] = block
+        self.position = (self.position + n) % self.window
+
+        # X_n = (X_{n-1} + x_new - x_old) * w, applied for all n samples at once
+        if n not in self._weights:
+            steps = np.arange(n, 0, -1)[:, None]
+            self._weights[n] = ((self.twiddle ** n).astype(self.complex_dtype),
+                                (self.twiddle[None, :] ** steps).astype(self.complex_dtype))  # (bins,), (n x bins)
+        shift, weights = self._weights[n]
+        self.spectrum = self.spectrum * shift + delta @ weights
+
+        self.since_resync += n
+        if self.since_resync >= self.window:
+            self._resync()
+
+        # Parseval: the mean square of a band equals twice its one-sided bin energy over N^2
+        bin_power = np.abs(self.spectrum) ** 2 * self.dtype.type(2.0 / self.window ** 2)
+        return bin_power @ self.band_matrix
+
+
+# Cut-off of the envelope smoother per band (Hz); slower bands need more smoothing to stay steady.
+# At 256 Hz the group delay is about 190 ms (theta), 130 ms (alpha), 55 ms (beta) and 45 ms (gamma),
+# and a rhythm switching on shows half its power after about 240, 175, 70 and 60 ms (see
+# step_response_ms). Only beta and gamma make 100 ms: even with no smoothing and a 2-pole band-pass,
+# theta needs over 120 ms to resolve a 4 Hz-wide band, and faster alpha settings leave 15% ripple.
+ENVELOPE_SMOOTHING = {
+    'theta': 3.0,
+    'alpha': 6.0,
+    'beta': 8.0,
+    'gamma': 10.0
+}
+
+
+class EnvelopeBandPower:
+    """Instantaneous band power from a streaming filter bank followed by rectify-and-smooth.
+
+    Each band has a stateful 2nd-order Butterworth band-pass; its output is squared and
+    low-passed, so the reading follows the signal with only the filters' group delay
+    (see group_delays_ms) instead of waiting for a whole analysis window.
+    """
+
+    def __init__(self, fs=SAMPLING_RATE, n_channels=8, bands=BAND_EDGES, smoothing=ENVELOPE_SMOOTHING, order=2,
+                 dtype=np.float32):
+        self.fs = fs
+        self.dtype = np.dtype(dtype)
+        self.bands = dict(bands)
+        self.smoothing = {name: smoothing[name] for name in self.bands}
+        self.bandpass = [StreamingSOSFilter(butter(order, band, btype="band", fs=fs, output="sos"), n_channels, dtype)
+                         for band in self.bands.values()]
+        self.smoother = [StreamingSOSFilter(butter(2, cutoff, btype="lowpass", fs=fs, output="sos"), n_channels, dtype)
+                         for cutoff in self.smoothing.values()]
+        self.reset()
+
+    def reset(self):
+        for stage in self.bandpass + self.smoother:
+            stage.reset()
+        for smoother in self.smoother:
+            # Start the smoothers from zero power rather than from the first squared sample
+            smoother.zi = np.zeros((smoother.sos.shape[0], smoother.n_channels, 2), dtype=self.dtype)
+
+    def update(self, block):
+        """Returns the latest smoothed (channels x bands) power after a (channels x n) block."""
+        block = np.asarray(block, dtype=self.dtype)
+        powers = np.empty((block.shape[0], len(self.bandpass)), dtype=self.dtype)
+        for i, (bandpass, smoother) in enumerate(zip(self.bandpass, self.smoother)):
+            power = smoother.process(bandpass.process(block) ** 2)
+            powers[:, i] = np.maximum(power[:, -1], 0.0)
+        return powers
+
+    def amplitudes(self, powers):
+        """Band amplitude (envelope) from the power matrix: a sine of amplitude A has power A^2 / 2."""
+        return np.sqrt(2.0 * powers)
+
+    def group_delays_ms(self):
+        """Delay of each band's reading: band-pass delay at the band centre plus smoother delay at DC."""
+        delays = {}
+        for name, bandpass, smoother in zip(self.bands, self.bandpass, self.smoother):
+            low, high = self.bands[name]
+            centre = np.sqrt(low * high)
+            _, bandpass_delay = group_delay(sos2tf(bandpass.sos), w=[centre], fs=self.fs)
+            _, smoother_delay = group_delay(sos2tf(smoother.sos), w=[0.1], fs=self.fs)
+            delays[name] = (bandpass_delay[0] + smoother_delay[0]) * 1000.0 / self.fs
+        return delays
+
+    def step_response_ms(self, fraction=0.5):
+        """Time for each band's reading to reach `fraction` of its settled level once a sine at its centre starts."""
+        t = np.arange(2 * self.fs) / self.fs
+        times = {}
+        for name, bandpass, smoother in zip(self.bands, self.bandpass, self.smoother):
+            low, high = self.bands[name]
+            power = sosfilt(smoother.sos, sosfilt(bandpass.sos, np.sin(2 * np.pi * np.sqrt(low * high) * t)) ** 2)
+            settled = power[self.fs:].mean()
+            times[name] = np.argmax(power >= fraction * settled) * 1000.0 / self.fs
+        return times
+
+
+class AnalysisWindowAggregator:
+    """Collects 16-sample epochs in a ring buffer and calls back once per hop with the latest window.
+
+    The callback gets (window, new_samples, end_sample): the last `window_seconds` of data
+    (shorter at the very start of a session), just the samples added since the previous
+    call, and the device sample index the window ends at.
+    """
+
+    def __init__(self, callback, fs=SAMPLING_RATE, window_seconds=2.0, hop_seconds=0.25, n_channels=8):
+        self.callback = callback
+        self.window = int(round(window_seconds * fs))
+        self.hop = max(1, int(round(hop_seconds * fs)))
+        # Room for a full window plus whatever arrives past the boundary in the same block
+        self.buffer = SampleRingBuffer(n_channels, capacity=self.window + self.hop + fs)
+        self.next_boundary = self.hop
+
+    def reset(self):
+        self.buffer.clear()
+        self.next_boundary = self.hop
+
+    def push(self, block):
+        self.buffer.write(block)
+        while self.buffer.total_written >= self.next_boundary:
+            end = self.next_boundary
+            start = max(self.buffer.first_sample, end - self.window)
+            window = self.buffer.window(start, end)
+            new_samples = self.buffer.window(max(start, end - self.hop), end)
+            self.callback(window, new_samples, end)
+            self.next_boundary += self.hop
+
+
+BAND_POWER_ENGINES = {
+    'iir': IIRBandPower,
+    'sdft': SlidingDFTBandPower,
+    'envelope': EnvelopeBandPower
+}
+
+
+def make_band_power_engine(name='iir', fs=SAMPLING_RATE, window_seconds=None, **options):
+    """Builds a band power engine by name.
+
+    Every engine is stateful and is fed each sample once. `window_seconds` sets the
+    averaging window of the iir and sdft engines; the envelope engine has no window and
+    ignores it.
+    """
+    engine = BAND_POWER_ENGINES[name]
+    if window_seconds is not None and engine in (IIRBandPower, SlidingDFTBandPower):
+        options.setdefault('window', int(round(window_seconds * fs)))
+    return engine(fs=fs, **options)
+
+
+def estimation_delay(engine, window_seconds):
+    """Roughly how far behind the signal an engine's reading is, in seconds.
+
+    A window average reflects the middle of its window; the envelope engine lags by its
+    filters' group delay, averaged over the bands.
+    """
+    if isinstance(engine, EnvelopeBandPower):
+        return float(np.mean(list(engine.group_delays_ms().values()))) / 1000.0
+    if isinstance(engine, (IIRBandPower, SlidingDFTBandPower)):
+        return engine.window / engine.fs / 2.0
+    return window_seconds / 2.0
+
+
+# Left/right channel pairs of the Crown used for hemispheric asymmetry
+ASYMMETRY_PAIRS = {
+    'frontal': ('F5', 'F6'),
+    'central': ('C3', 'C4'),
+    'centro_parietal': ('CP3', 'CP4'),
+    'parietal': ('PO3', 'PO4')
+}
+
+
+def band_features(band_powers, channel_mask=None, channel_names=CHANNEL_NAMES):
+    """Derives relative power, asymmetry and engagement from one (channels x bands) power matrix.
+
+    Channels left out by the mask come back as NaN rather than being dropped, so every
+    array keeps its shape from update to update.
+    """
+    # Float32 powers stay float32; anything else (lists, integers) is taken as float64
+    powers = np.asarray(band_powers)
+    powers = powers.astype(np.result_type(powers.dtype, np.float32))  # A copy, so masking can't touch the input
+    if channel_mask is not None:
+        powers[~channel_mask] = np.nan
+    theta, alpha, beta = (powers[:, BAND_NAMES.index(name)] for name in ('theta', 'alpha', 'beta'))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = powers / powers.sum(axis=1, keepdims=True)
+        engagement = beta / (alpha + theta)
+
+        # ln(right) - ln(left) per pair and band; positive means the right hemisphere has more power
+        left = [channel_names.index(pair[0]) for pair in ASYMMETRY_PAIRS.values()]
+        right = [channel_names.index(pair[1]) for pair in ASYMMETRY_PAIRS.values()]
+        asymmetry = np.log(powers[right]) - np.log(powers[left])
+
+    return {
+        'relative_power': relative,   # channels x bands
+        'engagement': engagement,     # channels
+        'asymmetry': asymmetry        # pairs x bands
+    }
+
+
+def benchmark_band_engines(seconds=60, epoch=16, fs=SAMPLING_RATE, n_channels=8):
+    """Compares CPU time per epoch and response latency of the band-power engines."""
+    import time
+
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * fs) / fs
+    data = rng.normal(0, 5, (n_channels, t.size))
+    # Alpha switches on halfway through, to see how quickly each engine notices
+    onset = t.size // 2
+    data[:, onset:] += 20 * np.sin(2 * np.pi * 10 * t[onset:])
+
+    results = {}
+    for name in BAND_POWER_ENGINES:
+        engine = make_band_power_engine(name, fs)
+        alpha = []
+        started = time.perf_counter()
+        for start in range(0, t.size, epoch):
+            alpha.append(engine.update(data[:, start:start + epoch])[:, 1].mean())
+        elapsed = time.perf_counter() - started
+        alpha = np.array(alpha)
+
+        # Latency: time from onset until alpha first reaches 90% of its settled level
+        onset_epoch = onset // epoch
+        settled = np.median(alpha[-len(alpha) // 4:])
+        baseline = np.median(alpha[:onset_epoch])
+        crossed = np.flatnonzero(alpha[onset_epoch:] >= baseline + 0.9 * (settled - baseline))
+        latency_ms = crossed[0] * epoch * 1000.0 / fs if crossed.size else float('nan')
+        # How much the reading jitters once settled, relative to its level
+        jitter = np.std(alpha[-len(alpha) // 4:]) / settled
+
+        results[name] = {
+            'us_per_epoch': elapsed / len(alpha) * 1e6,
+            'latency_ms': latency_ms,
+            'relative_jitter': jitter
+        }
+        print(f"{name:>5}: {results[name]['us_per_epoch']:.1f} us/epoch, "
+              f"latency {latency_ms:.0f} ms, jitter {jitter:.1%}")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_band_engines()
+    envelope = EnvelopeBandPower()
+    half_rise = envelope.step_response_ms()
+    for band, delay in envelope.group_delays_ms().items():
+        print(f"envelope {band}: group delay {delay:.0f} ms, half rise {half_rise[band]:.0f} ms")
@@ -0,0 +1,83 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from eeg_session import SampleRingBuffer
+
+
+def session_array(session):
+    """Returns a (channels x samples) array and the device index of its first sample."""
+    if isinstance(session, SampleRingBuffer):
+        return session.ordered()
+    if isinstance(session, np.ndarray):  # Plain array / memmap; its own .data is a raw buffer
+        return session, 0
+    return session.data, 0  # RecordedSession
+
+
+def event_samples(markers, label=None):
+    """Returns the sample indices of all markers (optionally only those with a label)."""
+    samples, labels = markers.as_arrays()
+    if label is not None:
+        samples = samples[labels == label]
+    return samples
+
+
+def extract_epochs(session, events, before, after):
+    """Cuts every event window out of a session as one (events x channels x samples) array.
+
+    Events whose window runs off either end of the session are dropped; the second
+    return value says which of the requested events were kept.
+    """
+    data, first_sample = session_array(session)
+    events = np.asarray(events, dtype=np.int64) - first_sample
+    length = before + after
+    starts = events - before
+    kept = (starts >= 0) & (starts + length <= data.shape[-1])
+    if not kept.any():
+        # Also covers a window longer than the whole session, which has no strided view at all
+        return np.empty((0, data.shape[0], length), dtype=data.dtype), kept
+
+    # Strided view of every possible window, then gather the event windows in one go
+    windows = sliding_window_view(data, length, axis=-1)
+    epochs = windows[:, starts[kept], :].transpose(1, 0, 2)
+    return np.ascontiguousarray(epochs), kept
+
+
+def baseline_correct(epochs, baseline=None):
+    """Subtracts each epoch's per-channel mean over the baseline samples (a slice, default all)."""
+    if baseline is None:
+        baseline = slice(None)
+    return epochs - epochs[:, :, baseline].mean(axis=2, keepdims=True)
+
+
+def rejection_mask(epochs, max_amplitude=None, max_peak_to_peak=None, min_peak_to_peak=None):
+    """Returns a boolean mask of epochs that pass every amplitude criterion on every channel."""
+    keep = np.ones(epochs.shape[0], dtype=bool)
+    if max_amplitude is not None:
+        keep &= (np.abs(epochs).max(axis=2) <= max_amplitude).all(axis=1)
+    if max_peak_to_peak is not None or min_peak_to_peak is not None:
+        peak_to_peak = np.ptp(epochs, axis=2)
+        if max_peak_to_peak is not None:
+            keep &= (peak_to_peak <= max_peak_to_peak).all(axis=1)
+        if min_peak_to_peak is not None:  # Flat channels
+            keep &= (peak_to_peak >= min_peak_to_peak).all(axis=1)
+    return keep
+
+
+def average_epochs(epochs, mask=None):
+    """Averages the kept epochs into a (channels x samples) evoked response."""
+    if mask is not None:
+        epochs = epochs[mask]
+    if epochs.shape[0] == 0:
+        return np.full(epochs.shape[1:], np.nan), 0
+    return epochs.mean(axis=0), epochs.shape[0]
+
+
+def event_locked_average(session, markers, label, before, after, baseline=None,
+                         max_amplitude=None, max_peak_to_peak=None, min_peak_to_peak=None):
+    """Extracts, baseline-corrects, rejects and averages every epoch around markers with a label."""
+    epochs, _ = extract_epochs(session, event_samples(markers, label), before, after)
+    if baseline is not None:
+        epochs = baseline_correct(epochs, baseline)
+    mask = rejection_mask(epochs, max_amplitude, max_peak_to_peak, min_peak_to_peak)
+    evoked, n_kept = average_epochs(epochs, mask)
+    return evoked, epochs, mask, n_kept
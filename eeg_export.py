@@ -0,0 +1,167 @@
+from datetime import datetime
+
+import numpy as np
+
+from eeg_session import CHANNEL_NAMES, SAMPLING_RATE
+
+EXPORT_HEADERS = ["Sample Count"] + CHANNEL_NAMES + ["Marker Column", "Timestamp"]
+BLOCK_ROWS = 8192  # Small enough that formatting one block never holds the GIL for long
+
+
+def epochs_to_samples(data_points, n_channels=8, sampling_rate=SAMPLING_RATE):
+    """Stacks SDK epochs (channels x 16 each) into (samples x channels) rows with per-sample timestamps."""
+    if not data_points:
+        return np.empty((0, n_channels), dtype=np.float32), np.empty(0, dtype=np.int64)
+    blocks = [np.asarray(data_point['data'][:n_channels], dtype=np.float32) for data_point in data_points]
+    lengths = np.array([block.shape[1] for block in blocks])
+    samples = np.concatenate(blocks, axis=1).T
+    n_samples = samples.shape[0]
+
+    # Each epoch carries the device time of its first sample; the rest follow at the sampling rate
+    start_times = np.array([data_point.get('info', {}).get('startTime', np.nan) for data_point in data_points],
+                           dtype=np.float64)
+    if np.isnan(start_times).any():
+        # Without device times, count back from now
+        now_ms = datetime.now().timestamp() * 1000
+        epoch_firsts = np.cumsum(lengths) - lengths
+        start_times = now_ms - (n_samples - epoch_firsts) * 1000.0 / sampling_rate
+    offsets = np.arange(n_samples) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    timestamps = np.round(np.repeat(start_times, lengths) + offsets * 1000.0 / sampling_rate).astype(np.int64)
+    return samples, timestamps
+
+
+def write_samples_csv(filename, samples, timestamps, markers=None, headers=EXPORT_HEADERS,
+                      first_sample=0, decimals=3, block_rows=BLOCK_ROWS):
+    """Writes one row per sample, rendering whole blocks of rows to text with array operations.
+
+    Rows with a marker or a non-finite sample are rare and go through %-formatting, which
+    writes NaN and infinity as "nan", "inf" and "-inf".
+    """
+    n_samples, n_channels = samples.shape
+    channel_format = ",".join([f"%.{decimals}f"] * n_channels)
+    marked_row = "%d," + channel_format + ",%s,%d\n"
+    indices = np.arange(first_sample, first_sample + n_samples, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+
+    special = ~np.isfinite(samples).all(axis=1)
+    if markers is not None:
+        special |= markers != ""
+    special_rows = np.flatnonzero(special)
+
+    def plain_rows(first, last):
+        channels = samples[first:last].astype(np.float64)
+        fields = [(indices[first:last, None], 0, ","), (channels[:, :-1], decimals, ","),
+                  (channels[:, -1:], decimals, ",,"), (timestamps[first:last, None], 0, "\n")]
+        return _format_fields(fields, last - first)
+
+    with open(filename, mode='wb', buffering=1 << 20) as file:
+        file.write((",".join(headers) + "\n").encode())
+        for start in range(0, n_samples, block_rows):
+            stop = min(start + block_rows, n_samples)
+            # Split the block around the special rows and format the plain runs in bulk
+            cut_first = np.searchsorted(special_rows, start)
+            cut_last = np.searchsorted(special_rows, stop)
+            run_start = start
+            for row in special_rows[cut_first:cut_last]:
+                if row > run_start:
+                    file.write(plain_rows(run_start, row))
+                marker = markers[row] if markers is not None else ""
+                values = [int(indices[row])] + samples[row].tolist() + [marker, int(timestamps[row])]
+                file.write((marked_row % tuple(values)).encode())
+                run_start = row + 1
+            if stop > run_start:
+                file.write(plain_rows(run_start, stop))
+    return filename
+
+
+def _format_fields(fields, n_rows):
+    """Renders rows of numbers as ASCII bytes without a per-value Python call.
+
+    `fields` is a list of (values, decimals, separator) groups, where values is (rows x k)
+    of finite numbers and every value in the group is followed by the separator. Each value
+    is written as right-aligned digits into a fixed-width byte matrix; dropping the unused
+    leading columns and flattening row by row leaves exactly the text that "%.<decimals>f" /
+    "%d" would give. Floats are scaled to integers before rounding, which is exact for float32 samples
+    up to 8 decimals (the scaled value fits in a float64 mantissa), so the rounding matches
+    printf's round-half-to-even on the stored value.
+    """
+    layouts = []
+    for values, places, separator in fields:
+        if places:
+            negative = np.signbit(values)  # "%.3f" keeps the sign of values that round to zero
+            magnitude = np.abs(np.rint(values * 10.0 ** places))
+        else:
+            negative = values < 0
+            magnitude = np.abs(values)
+        largest = int(magnitude.max()) if magnitude.size else 0
+        magnitude = magnitude.astype(np.uint32 if largest < 2 ** 32 else np.uint64)
+        width = max(len(str(largest)), places + 1)
+        separator = np.frombuffer(separator.encode(), dtype=np.uint8)
+        layouts.append((magnitude, negative, places, width, separator))
+
+    row_width = sum(values.shape[1] * (1 + width + (1 if places else 0) + len(separator))
+                    for values, negative, places, width, separator in layouts)
+    chars = np.empty((n_rows, row_width), dtype=np.uint8)
+    keep = np.ones((n_rows, row_width), dtype=bool)
+    column = 0
+    for magnitude, negative, places, width, separator in layouts:
+        n_values = magnitude.shape[1]
+        field_width = 1 + width + (1 if places else 0) + len(separator)
+        field_chars = chars[:, column:column + n_values * field_width].reshape(n_rows, n_values, field_width)
+        field_keep = keep[:, column:column + n_values * field_width].reshape(n_rows, n_values, field_width)
+        column += n_values * field_width
+
+        field_chars[..., 0] = ord('-')
+        field_keep[..., 0] = negative
+        # Digits from the last one forwards, skipping over the decimal point
+        remaining = magnitude
+        position = width + (1 if places else 0)
+        for digit in range(width):
+            if places and digit == places:
+                position -= 1  # The decimal point
+            quotient = remaining // 10
+            np.subtract(remaining + ord('0'), quotient * 10, out=field_chars[..., position], casting='unsafe')
+            remaining = quotient
+            position -= 1
+        field_chars[..., -len(separator):] = separator
+        # Integer digits are kept from the first non-zero one on, and the units digit always
+        for position in range(1, width - places):
+            np.greater_equal(magnitude, 10 ** (width - position), out=field_keep[..., position])
+        if places:
+            field_chars[..., 1 + width - places] = ord('.')
+    return chars[keep].tobytes()
+
+
+def benchmark_export(minutes=60, sampling_rate=SAMPLING_RATE, filename="benchmark_export.csv"):
+    """Times write_samples_csv on a synthetic session and checks it against plain %-formatting.
+
+    An hour at 256 Hz is 921,600 rows, which should take well under a second.
+    """
+    import os
+    import time
+
+    rng = np.random.default_rng(0)
+    n_samples = int(minutes * 60 * sampling_rate)
+    samples = rng.normal(0, 20, (n_samples, len(CHANNEL_NAMES))).astype(np.float32)
+    timestamps = 1_700_000_000_000 + np.round(np.arange(n_samples) * 1000.0 / sampling_rate).astype(np.int64)
+    markers = np.full(n_samples, "", dtype=object)
+    markers[::sampling_rate * 60] = "minute"
+
+    started = time.perf_counter()
+    write_samples_csv(filename, samples, timestamps, markers)
+    seconds = time.perf_counter() - started
+
+    with open(filename, "r") as file:
+        next(file)
+        check_rows = min(n_samples, 20000)
+        written = [next(file) for _ in range(check_rows)]
+    expected = [f"{row}," + ",".join(f"{value:.3f}" for value in samples[row].tolist()) +
+                f",{markers[row]},{timestamps[row]}\n" for row in range(check_rows)]
+    os.remove(filename)
+    identical = written == expected
+    print(f"{n_samples} rows: {seconds:.2f} s, first {check_rows} rows identical: {identical}")
+    return seconds, identical
+
+
+if __name__ == "__main__":
+    benchmark_export()
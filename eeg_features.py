@@ -0,0 +1,74 @@
+import numpy as np
+
+# Frequency bands of the offline analysis (Hz, both edges inclusive)
+OFFLINE_BANDS = {
+    'theta': (4, 8),
+    'alpha': (8, 12),
+    'beta': (12, 30),
+    'gamma': (30, 50)
+}
+
+FEATURE_NAMES = (
+    'theta_power', 'alpha_power', 'beta_power', 'gamma_power',
+    'theta_relative', 'alpha_relative', 'beta_relative', 'gamma_relative',
+    'engagement', 'memory_commitment', 'spectral_entropy', 'peak_alpha_frequency'
+)
+
+_band_range_cache = {}
+
+
+def band_ranges(freqs, bands=OFFLINE_BANDS):
+    """Returns the (start, stop) index of every band on a sorted frequency grid, cached per grid."""
+    freqs = np.asarray(freqs, dtype=np.float64)
+    key = (freqs.size, freqs[0], freqs[-1], tuple(bands.values()))
+    if key not in _band_range_cache:
+        starts = np.searchsorted(freqs, [low for low, _ in bands.values()], side='left')
+        stops = np.searchsorted(freqs, [high for _, high in bands.values()], side='right')
+        _band_range_cache[key] = (starts, stops)
+    return _band_range_cache[key]
+
+
+def spectral_features(psds, freqs):
+    """Computes every band and derived feature for all channels from a (channels x freqs) PSD.
+
+    Returns a (channels x len(FEATURE_NAMES)) array of the PSD's float type, so float32
+    spectra give float32 features. Band sums come from one cumulative sum, so overlapping
+    band edges cost nothing extra; the sum itself runs in float64, as a float32 running
+    total over a long recording's frequency grid would lose the small bands' digits.
+    """
+    psds = np.asarray(psds)
+    psds = psds.astype(np.result_type(psds.dtype, np.float32), copy=False)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    starts, stops = band_ranges(freqs)
+    n_bands = len(OFFLINE_BANDS)
+
+    cumulative = np.zeros((psds.shape[0], psds.shape[1] + 1))
+    np.cumsum(psds, axis=1, out=cumulative[:, 1:])
+    band_sums = cumulative[:, stops] - cumulative[:, starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        band_means = band_sums / (stops - starts)
+        relative = band_sums / cumulative[:, -1:]
+
+        theta, alpha, beta = band_means[:, 0], band_means[:, 1], band_means[:, 2]
+        engagement = beta / (theta + alpha)
+        memory_commitment = alpha / (theta + beta)
+
+        # Normalised Shannon entropy of each channel's spectrum (1 = flat, 0 = a single peak)
+        distribution = psds / cumulative[:, -1:]
+        entropy = -np.sum(distribution * np.log(np.where(distribution > 0, distribution, 1)), axis=1)
+        entropy /= np.log(psds.shape[1])
+
+    alpha_start, alpha_stop = starts[1], stops[1]
+    if alpha_stop > alpha_start:
+        peak_alpha = freqs[alpha_start + np.argmax(psds[:, alpha_start:alpha_stop], axis=1)]
+    else:
+        peak_alpha = np.full(psds.shape[0], np.nan)
+
+    features = np.empty((psds.shape[0], len(FEATURE_NAMES)), dtype=psds.dtype)
+    features[:, :n_bands] = band_means
+    features[:, n_bands:2 * n_bands] = relative
+    features[:, 8] = engagement
+    features[:, 9] = memory_commitment
+    features[:, 10] = entropy
+    features[:, 11] = peak_alpha
+    return features
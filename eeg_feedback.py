@@ -0,0 +1,192 @@
+import numpy as np
+
+
+class FeedbackRule:
+    """A suggestion shown when one state stays above or below a threshold.
+
+    The condition has to hold for `hold_seconds` without a break before the rule fires
+    (debouncing), and the rule then stays quiet for `cooldown_seconds`.
+    """
+
+    def __init__(self, name, state, message, above=None, below=None, hold_seconds=3.0, cooldown_seconds=60.0):
+        if (above is None) == (below is None):
+            raise ValueError(f"Rule '{name}' needs exactly one of above or below")
+        self.name = name
+        self.state = state
+        self.message = message
+        self.above = above
+        self.below = below
+        self.hold_seconds = hold_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+    @property
+    def threshold(self):
+        return self.above if self.above is not None else self.below
+
+
+# Raw states are ratios of band shares, so their thresholds sit on those scales: a resting
+# recording gives focus around 2, engagement around 0.4 and distraction around 2
+FEEDBACK_RULES = (
+    FeedbackRule('distraction', 'distraction', 'High distraction detected. Consider taking a short break.', above=4.0),
+    FeedbackRule('focus', 'focus', 'Focus could be improved. Try deep breathing.', below=1.0),
+    FeedbackRule('engagement', 'engagement', 'Engagement is low. Consider interactive elements.', below=0.25)
+)
+
+# Calibrated states are 0-1 with 0.5 at the user's resting level; 0.25 and 0.75 are about
+# one standard deviation of the combined z-scores away from it
+CALIBRATED_FEEDBACK_RULES = (
+    FeedbackRule('distraction', 'distraction', 'High distraction detected. Consider taking a short break.', above=0.75),
+    FeedbackRule('focus', 'focus', 'Focus could be improved. Try deep breathing.', below=0.25),
+    FeedbackRule('engagement', 'engagement', 'Engagement is low. Consider interactive elements.', below=0.25)
+)
+
+
+class FeedbackRules:
+    """A set of FeedbackRules laid out as arrays, so every rule is checked in one pass.
+
+    Rules are in priority order: when several are ready at once, the first one is shown.
+    """
+
+    def __init__(self, rules, state_names):
+        self.rules = tuple(rules)
+        self.state_names = tuple(state_names)
+        unknown = [rule.state for rule in self.rules if rule.state not in self.state_names]
+        if unknown:
+            raise ValueError(f"Feedback rules refer to unknown states: {', '.join(unknown)}")
+        self.columns = np.array([self.state_names.index(rule.state) for rule in self.rules], dtype=np.intp)
+        # Comparing sign * (state - threshold) > 0 covers both directions at once
+        self.signs = np.array([1.0 if rule.above is not None else -1.0 for rule in self.rules])
+        self.thresholds = np.array([rule.threshold for rule in self.rules], dtype=np.float64)
+        self.hold_seconds = np.array([rule.hold_seconds for rule in self.rules], dtype=np.float64)
+        self.cooldown_seconds = np.array([rule.cooldown_seconds for rule in self.rules], dtype=np.float64)
+
+    def conditions(self, states):
+        """Which rules' conditions are met, for one state vector or a (ticks x states) array."""
+        states = np.asarray(states, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            return self.signs * (states[..., self.columns] - self.thresholds) > 0
+
+
+class FeedbackEngine:
+    """Turns the (smoothed) state vector into suggestions at a human pace.
+
+    On top of each rule's debounce and cooldown, at most one suggestion is shown every
+    `min_interval` seconds across all rules.
+    """
+
+    def __init__(self, rules, state_names, min_interval=20.0):
+        self.rules = rules if isinstance(rules, FeedbackRules) else FeedbackRules(rules, state_names)
+        self.min_interval = min_interval
+        self.reset()
+
+    def reset(self):
+        n_rules = len(self.rules.rules)
+        self.since = np.full(n_rules, np.nan)  # When each condition last became true, NaN while false
+        self.last_fired = np.full(n_rules, -np.inf)
+        self.last_any = -np.inf
+
+    def update(self, row, timestamp):
+        """Checks one tick; returns the FeedbackRule to show now, or None."""
+        met = self.rules.conditions(row)
+        self.since = np.where(met, np.where(np.isnan(self.since), timestamp, self.since), np.nan)
+        held = met & (timestamp - self.since >= self.rules.hold_seconds)
+        index = _next_rule(held, timestamp, self.last_fired, self.last_any, self.rules.cooldown_seconds,
+                           self.min_interval)
+        if index is None:
+            return None
+        self.last_fired[index] = timestamp
+        self.last_any = timestamp
+        return self.rules.rules[index]
+
+
+def _next_rule(held, timestamp, last_fired, last_any, cooldown_seconds, min_interval):
+    """The first held rule that is out of its cooldown, if the global interval allows one."""
+    if timestamp - last_any < min_interval:
+        return None
+    ready = np.flatnonzero(held & (timestamp - last_fired >= cooldown_seconds))
+    return int(ready[0]) if ready.size else None
+
+
+def session_feedback(states, timestamps, rules, state_names, min_interval=20.0):
+    """Runs a whole (ticks x states) timeline through the feedback rules at once.
+
+    Gives the same suggestions at the same ticks as feeding FeedbackEngine tick by tick:
+    conditions and debouncing are vectorized over the session, and only the ticks where a
+    rule is ready go through the cooldowns in order. Ticks with NaN states meet no
+    condition. Returns the (ticks, rule indices) of every suggestion, for tuning rules
+    against recorded sessions.
+    """
+    rules = rules if isinstance(rules, FeedbackRules) else FeedbackRules(rules, state_names)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    met = rules.conditions(states)
+    n_ticks = met.shape[0]
+
+    # Start of the current unbroken run of each condition: the latest tick where it switched on
+    switched_on = met.copy()
+    switched_on[1:] &= ~met[:-1]
+    start = np.where(switched_on, np.arange(n_ticks)[:, None], 0)
+    start = np.maximum.accumulate(start, axis=0)
+    held = met & (timestamps[:, None] - timestamps[start] >= rules.hold_seconds)
+
+    last_fired = np.full(len(rules.rules), -np.inf)
+    last_any = -np.inf
+    fired_ticks = []
+    fired_rules = []
+    for tick in np.flatnonzero(held.any(axis=1)):
+        index = _next_rule(held[tick], timestamps[tick], last_fired, last_any, rules.cooldown_seconds,
+                           min_interval)
+        if index is not None:
+            last_fired[index] = last_any = timestamps[tick]
+            fired_ticks.append(tick)
+            fired_rules.append(index)
+    return np.array(fired_ticks, dtype=np.intp), np.array(fired_rules, dtype=np.intp)
+
+
+def feedback_summary(fired_rules, rules, minutes):
+    """Suggestions per minute for each rule, from session_feedback's rule indices."""
+    counts = np.bincount(fired_rules, minlength=len(rules))
+    return {rule.name: count / minutes for rule, count in zip(rules, counts)}
+
+
+def benchmark_feedback(minutes=30, tick_seconds=0.1, seed=0):
+    """Checks session_feedback against a tick-by-tick FeedbackEngine and times both.
+
+    Uses smoothed raw states from a synthetic session that drifts between rest and
+    distraction, and reports how often the old check-every-tick approach would have
+    suggested something for comparison.
+    """
+    import time
+    from eeg_states import STATE_FORMULAS, analyze_session, make_state_smoother
+
+    rng = np.random.default_rng(seed)
+    n_ticks = int(minutes * 60 / tick_seconds)
+    # Theta and alpha swell together every few minutes, as they do when attention drifts
+    drift = 1 + 1.5 * np.clip(np.sin(np.arange(n_ticks) * tick_seconds / 90.0), 0, None) ** 4
+    levels = np.array([3.0, 10.0, 4.0, 1.5]) * np.stack([drift, drift, np.ones(n_ticks), np.ones(n_ticks)], axis=1)
+    bands = (levels * 10 ** rng.normal(0, 0.15, (n_ticks, 4))).astype(np.float32)
+    states = analyze_session(bands, smoother=make_state_smoother('one_euro'), tick_seconds=tick_seconds)['states']
+    timestamps = np.arange(n_ticks) * tick_seconds
+    names = STATE_FORMULAS.names
+
+    started = time.perf_counter()
+    fired_ticks, fired_rules = session_feedback(states, timestamps, FEEDBACK_RULES, names)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    engine = FeedbackEngine(FEEDBACK_RULES, names)
+    streamed = [(tick, engine.rules.rules.index(rule)) for tick in range(n_ticks)
+                for rule in [engine.update(states[tick], timestamps[tick])] if rule is not None]
+    streaming_seconds = time.perf_counter() - started
+
+    identical = streamed == list(zip(fired_ticks.tolist(), fired_rules.tolist()))
+    every_tick = int(engine.rules.conditions(states).any(axis=1).sum())
+    print(f"{n_ticks} ticks: batch {batch_seconds * 1000:.1f} ms, streaming {streaming_seconds * 1000:.0f} ms, "
+          f"identical: {identical}")
+    print(f"{len(fired_ticks) / minutes:.2f} suggestions/min (checking every tick: {every_tick / minutes:.0f}/min)")
+    for name, rate in feedback_summary(fired_rules, FEEDBACK_RULES, minutes).items():
+        print(f"{name:>12}: {rate:.2f}/min")
+    return identical
+
+
+if __name__ == "__main__":
+    benchmark_feedback()
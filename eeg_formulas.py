@@ -0,0 +1,99 @@
+import ast
+import json
+import os
+
+import numpy as np
+
+# Functions a formula may call, on top of + - * / ** and numbers
+FORMULA_FUNCTIONS = {
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'clip': np.clip
+}
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+def parse_formula(name, text, inputs):
+    """Parses one formula, allowing only arithmetic on the named inputs, numbers and FORMULA_FUNCTIONS."""
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError as error:
+        raise ValueError(f"State '{name}': {error.msg} in {text!r}") from None
+    called = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"State '{name}': {type(node).__name__} is not allowed in {text!r}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"State '{name}': only numbers can appear as constants in {text!r}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FORMULA_FUNCTIONS or node.keywords:
+                raise ValueError(f"State '{name}': unknown function in {text!r}")
+        elif isinstance(node, ast.Name) and id(node) not in called and node.id not in inputs:
+            raise ValueError(f"State '{name}': unknown feature '{node.id}' in {text!r}, "
+                             f"expected one of {', '.join(inputs)}")
+    return tree.body
+
+
+class StateFormulas:
+    """A set of named state formulas compiled into one function over a (ticks x inputs) array.
+
+    Each formula is an expression over the input columns by name, e.g.
+    "(beta + gamma) / (alpha + theta)". All of them are compiled together into a single
+    function that binds the columns once and evaluates every state on whole arrays, so
+    scoring a tick or a session costs the same number of Python calls whatever the
+    number of states.
+    """
+
+    def __init__(self, formulas, inputs=('theta', 'alpha', 'beta', 'gamma'), dtype=np.float32):
+        self.formulas = dict(formulas)
+        self.names = tuple(self.formulas)
+        self.inputs = tuple(inputs)
+        self.dtype = dtype
+        bodies = [parse_formula(name, text, self.inputs) for name, text in self.formulas.items()]
+        source = f"lambda {', '.join(self.inputs)}: ({''.join(ast.unparse(body) + ', ' for body in bodies)})"
+        self._kernel = eval(compile(source, '<state formulas>', 'eval'), {'__builtins__': {}, **FORMULA_FUNCTIONS})
+
+    def __call__(self, features):
+        """(ticks x len(names)) states from (ticks x len(inputs)) features."""
+        features = np.atleast_2d(np.asarray(features, dtype=self.dtype))
+        states = np.empty((features.shape[0], len(self.names)), dtype=self.dtype)
+        # A formula that is just a number broadcasts down its column
+        for column, values in enumerate(self._kernel(*features.T)):
+            states[:, column] = values
+        return states
+
+    def updated(self, formulas):
+        """A new set with some formulas replaced and any new ones added at the end."""
+        return StateFormulas(dict(self.formulas, **formulas), self.inputs, self.dtype)
+
+
+def load_state_formulas(path, states, calibrated_states):
+    """Reads formula overrides for the raw and calibrated StateFormulas from a JSON file.
+
+    The file may hold a "states" and a "calibrated_states" object, each mapping state names
+    to formulas that replace or add to the defaults passed in. A missing file or section
+    keeps the defaults. Both sets must end up with the same states in the same order, as
+    the display switches between them.
+    """
+    if not os.path.exists(path):
+        return states, calibrated_states
+    with open(path, "r") as file:
+        config = json.load(file)
+    states = states.updated(config.get('states', {}))
+    calibrated_states = calibrated_states.updated(config.get('calibrated_states', {}))
+    unmatched = set(states.names) ^ set(calibrated_states.names)
+    if unmatched:
+        raise ValueError(f"{path}: {', '.join(sorted(unmatched))} must be defined in both "
+                         f"'states' and 'calibrated_states'")
+    if calibrated_states.names != states.names:
+        calibrated_states = StateFormulas({name: calibrated_states.formulas[name] for name in states.names},
+                                          calibrated_states.inputs, calibrated_states.dtype)
+    return states, calibrated_states
@@ -0,0 +1,234 @@
+import csv
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from eeg_markers import MarkerStore
+from eeg_session import CHANNEL_NAMES, SAMPLING_RATE, create_session, write_session_info
+
+# Column layout of the headerless legacy recordings (e.g. 'Prototype Dataset 1.csv')
+LEGACY_COLUMNS = [
+    'Sample Count',
+    'EEG Channel Value: CP3',
+    'EEG Channel Value: C3',
+    'EEG Channel Value: F5',
+    'EEG Channel Value: PO3',
+    'EEG Channel Value: PO4',
+    'EEG Channel Value: F6',
+    'EEG Channel Value: C4',
+    'EEG Channel Value: CP4',
+    'Marker Column',
+    'Timestamp'
+]
+
+CHUNK_ROWS = 65536
+
+
+def _is_number(field):
+    try:
+        float(field)
+        return True
+    except ValueError:
+        return field.strip() == ""
+
+
+def detect_header(file_path):
+    """Returns the header names if the first line is a header, otherwise None."""
+    with open(file_path, "r", newline="") as file:
+        first_row = next(csv.reader(file), [])
+    # A data row can carry a text marker, so only call it a header when most fields are text
+    text_fields = sum(not _is_number(field) for field in first_row)
+    if text_fields * 2 <= len(first_row):
+        return None
+    return [field.strip() for field in first_row]
+
+
+def _column_roles(names):
+    """Splits column names into channel columns and the sample count / marker / timestamp columns."""
+    roles = {'channels': [], 'sample': None, 'marker': None, 'timestamp': None}
+    for name in names:
+        lowered = name.lower()
+        if 'timestamp' in lowered:
+            roles['timestamp'] = roles['timestamp'] or name
+        elif 'marker' in lowered or 'label' in lowered:
+            roles['marker'] = roles['marker'] or name
+        elif 'sample' in lowered:
+            roles['sample'] = roles['sample'] or name
+        else:
+            roles['channels'].append(name)
+    return roles
+
+
+def describe_csv(file_path):
+    """Works out the column names, header row and column roles of an EEG CSV."""
+    header = detect_header(file_path)
+    if header is None:
+        with open(file_path, "r", newline="") as file:
+            n_columns = len(next(csv.reader(file), []))
+        names = LEGACY_COLUMNS if n_columns == len(LEGACY_COLUMNS) else [f"Column {i}" for i in range(n_columns)]
+    else:
+        names = header
+    return names, header is not None, _column_roles(names)
+
+
+def count_rows(file_path, has_header):
+    """Counts data rows by scanning raw bytes, so arrays can be allocated once up front."""
+    rows = 0
+    last_byte = b"\n"
+    with open(file_path, "rb") as file:
+        while True:
+            block = file.read(1 << 20)
+            if not block:
+                break
+            rows += block.count(b"\n")
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        rows += 1  # No newline after the last row
+    return rows - (1 if has_header else 0)
+
+
+def iter_eeg_blocks(file_path, chunksize=CHUNK_ROWS, with_markers=False):
+    """Reads an EEG CSV in chunks, yielding (channels x n) float32 blocks.
+
+    Each item is (data, sample_count, timestamps, markers) where sample_count and
+    timestamps are int64 (or None if the file has no such column) and markers is an
+    object array of marker strings when with_markers is set.
+    """
+    names, has_header, roles = describe_csv(file_path)
+    channels = roles['channels']
+    counters = [roles[role] for role in ('sample', 'timestamp') if roles[role] is not None]
+    # Numbers are left to the parser's own inference, which stays on its fast float path for clean
+    # columns; a stray text cell turns its column to strings, which are coerced to NaN below
+    dtypes = {}
+    usecols = list(channels) + counters
+    if with_markers and roles['marker'] is not None:
+        usecols.append(roles['marker'])
+        dtypes[roles['marker']] = str
+
+    reader = pd.read_csv(
+        file_path,
+        header=0 if has_header else None,
+        names=names,
+        usecols=usecols,
+        dtype=dtypes,
+        chunksize=chunksize,
+        engine='c'
+    )
+    for chunk in reader:
+        numeric = chunk[channels + counters]
+        text = [name for name in numeric.columns if not pd.api.types.is_numeric_dtype(numeric[name])]
+        if text:
+            numeric = numeric.assign(**{name: pd.to_numeric(numeric[name], errors='coerce') for name in text})
+        data = numeric[channels].to_numpy(dtype=np.float32)
+        # As the original loader did, a row with an unreadable channel value is dropped rather than the file
+        valid = ~np.isnan(data).any(axis=1)
+        if not valid.all():
+            chunk, numeric, data = chunk[valid], numeric[valid], data[valid]
+        data = data.T
+        sample_count = timestamps = markers = None
+        if roles['sample'] is not None:
+            sample_count = np.nan_to_num(numeric[roles['sample']].to_numpy(dtype=np.float64)).astype(np.int64)
+        if roles['timestamp'] is not None:
+            timestamps = np.nan_to_num(numeric[roles['timestamp']].to_numpy(dtype=np.float64)).astype(np.int64)
+        if with_markers and roles['marker'] is not None:
+            markers = chunk[roles['marker']].fillna("").to_numpy(dtype=object)
+        yield data, sample_count, timestamps, markers
+
+
+def _load_columns(file_path, chunksize):
+    """Reads a whole EEG CSV into arrays allocated once from a row count."""
+    names, has_header, roles = describe_csv(file_path)
+    n_rows = count_rows(file_path, has_header)
+    data = np.empty((len(roles['channels']), n_rows), dtype=np.float32)
+    sample_count = np.zeros(n_rows, dtype=np.int64) if roles['sample'] is not None else None
+    timestamps = np.zeros(n_rows, dtype=np.int64) if roles['timestamp'] is not None else None
+
+    filled = 0
+    for block, block_sample_count, block_timestamps, _ in iter_eeg_blocks(file_path, chunksize):
+        n = block.shape[1]
+        data[:, filled:filled + n] = block
+        if sample_count is not None:
+            sample_count[filled:filled + n] = block_sample_count
+        if timestamps is not None:
+            timestamps[filled:filled + n] = block_timestamps
+        filled += n
+    # Blank lines are skipped by the parser, so trim any unused space
+    data = data[:, :filled]
+    if sample_count is not None:
+        sample_count = sample_count[:filled]
+    if timestamps is not None:
+        timestamps = timestamps[:filled]
+    return names, roles, data, sample_count, timestamps
+
+
+def load_eeg_arrays(file_path, chunksize=CHUNK_ROWS):
+    """Loads a whole EEG CSV as (channels x samples) float32 data, int64 timestamps and channel names."""
+    _, roles, data, _, timestamps = _load_columns(file_path, chunksize)
+    return data, timestamps, roles['channels']
+
+
+def load_eeg_frame(file_path, chunksize=CHUNK_ROWS):
+    """Loads an EEG CSV as a DataFrame with every channel float32 and the counters int64."""
+    names, roles, data, sample_count, timestamps = _load_columns(file_path, chunksize)
+    columns = {}
+    for name in names:
+        if name in roles['channels']:
+            columns[name] = data[roles['channels'].index(name)]
+        elif name == roles['sample']:
+            columns[name] = sample_count
+        elif name == roles['timestamp']:
+            columns[name] = timestamps
+    return pd.DataFrame(columns, columns=list(columns))
+
+
+def convert_csv_to_session(file_path, base_path=None, sampling_rate=SAMPLING_RATE, chunksize=CHUNK_ROWS):
+    """Streams one legacy CSV into the binary session format without loading it whole."""
+    if base_path is None:
+        base_path = os.path.splitext(file_path)[0]
+    names, has_header, roles = describe_csv(file_path)
+    n_rows = count_rows(file_path, has_header)
+    session = create_session(base_path, len(roles['channels']), n_rows)
+
+    markers = MarkerStore()
+    start_time = None
+    filled = 0
+    for block, _, timestamps, block_markers in iter_eeg_blocks(file_path, chunksize, with_markers=True):
+        n = block.shape[1]
+        session[:, filled:filled + n] = block
+        if start_time is None and timestamps is not None and n:
+            start_time = int(timestamps[0])
+        if block_markers is not None:
+            for offset in np.flatnonzero(block_markers != ""):
+                markers.add(filled + offset, block_markers[offset])
+        filled += n
+    session.flush()
+    del session
+
+    if filled != n_rows:
+        # Blank lines were skipped, so shrink the file to the rows actually read
+        data = np.load(base_path + ".npy", mmap_mode="r")[:, :filled]
+        np.save(base_path + ".tmp.npy", data)
+        del data
+        os.replace(base_path + ".tmp.npy", base_path + ".npy")
+
+    channel_names = [name.replace('EEG Channel Value: ', '') for name in roles['channels']]
+    write_session_info(base_path, markers, sampling_rate, channel_names or CHANNEL_NAMES, start_time)
+    return base_path
+
+
+def convert_csv_archive(source, out_dir=None, sampling_rate=SAMPLING_RATE):
+    """Converts every CSV in a directory (or matching a glob) into the binary session format."""
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.csv")))
+    else:
+        paths = sorted(glob.glob(source))
+    converted = []
+    for path in paths:
+        base_path = None
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+            base_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0])
+        converted.append(convert_csv_to_session(path, base_path, sampling_rate))
+    return converted
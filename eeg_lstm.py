@@ -0,0 +1,181 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.special import expit
+
+LSTM_WEIGHTS = "new_iteration_lstm.npz"
+
+
+def export_keras_weights(model, path=LSTM_WEIGHTS, fingerprint=""):
+    """Saves a Sequential of LSTM and Dense layers (Keras default activations) as a compact .npz.
+
+    `fingerprint` is stored alongside, to identify the data and settings the weights came from,
+    and so is the window length the model was trained on when its input shape fixes one.
+    """
+    arrays = {}
+    kinds = []
+    for layer in model.layers:
+        config = layer.get_config()
+        name = type(layer).__name__
+        if name == 'LSTM':
+            if config.get('activation') != 'tanh' or config.get('recurrent_activation') != 'sigmoid':
+                raise ValueError(f"{layer.name}: only tanh/sigmoid LSTMs can be exported")
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            index = len(kinds)
+            arrays[f'{index}_kernel'] = kernel
+            arrays[f'{index}_recurrent_kernel'] = recurrent_kernel
+            arrays[f'{index}_bias'] = bias
+            kinds.append('lstm_sequences' if config.get('return_sequences') else 'lstm')
+        elif name == 'Dense':
+            if config.get('activation') != 'linear':
+                raise ValueError(f"{layer.name}: only linear Dense layers can be exported")
+            kernel, bias = layer.get_weights()
+            index = len(kinds)
+            arrays[f'{index}_kernel'] = kernel
+            arrays[f'{index}_bias'] = bias
+            kinds.append('dense')
+        elif name != 'InputLayer':
+            raise ValueError(f"{layer.name}: {name} layers are not supported")
+    arrays = {key: np.asarray(value, dtype=np.float32) for key, value in arrays.items()}
+    time_steps = model.input_shape[1]
+    if time_steps is not None:
+        arrays['time_steps'] = np.array(time_steps)
+    np.savez(path, layers=np.array(kinds), fingerprint=np.array(fingerprint), **arrays)
+    return path
+
+
+class LSTMNetwork:
+    """NumPy inference for the New Iteration network: stacked LSTMs followed by a Dense layer.
+
+    Gates follow the Keras layout (input, forget, cell, output) and everything runs in
+    float32, so predictions match Keras to float32 rounding.
+    """
+
+    def __init__(self, layers, fingerprint="", time_steps=None):
+        self.layers = layers  # [(kind, weights dict)], as read from an exported .npz
+        self.fingerprint = fingerprint  # Identifies the training data and settings, empty if unknown
+        self.time_steps = time_steps  # Length of the training windows, None if unknown
+
+    @classmethod
+    def load(cls, path=LSTM_WEIGHTS):
+        with np.load(path, allow_pickle=False) as stored:
+            layers = []
+            for index, kind in enumerate(str(kind) for kind in stored['layers']):
+                prefix = f'{index}_'
+                layers.append((kind, {key[len(prefix):]: stored[key] for key in stored.files if key.startswith(prefix)}))
+            fingerprint = str(stored['fingerprint']) if 'fingerprint' in stored.files else ""
+            time_steps = int(stored['time_steps']) if 'time_steps' in stored.files else None
+        return cls(layers, fingerprint, time_steps)
+
+    @property
+    def n_inputs(self):
+        return self.layers[0][1]['kernel'].shape[0]
+
+    @property
+    def n_outputs(self):
+        return self.layers[-1][1]['kernel'].shape[1]
+
+    @staticmethod
+    def _lstm_step(projected, h, c, weights):
+        """One time step for a batch: `projected` is x @ kernel + bias, already computed."""
+        units = h.shape[1]
+        z = projected + h @ weights['recurrent_kernel']
+        i = expit(z[:, :units])
+        f = expit(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = expit(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        return h, c
+
+    def initial_state(self, batch=1):
+        """Zero (h, c) for every LSTM layer, as Keras starts each sequence."""
+        return [(np.zeros((batch, weights['recurrent_kernel'].shape[0]), dtype=np.float32),
+                 np.zeros((batch, weights['recurrent_kernel'].shape[0]), dtype=np.float32))
+                if kind.startswith('lstm') else None
+                for kind, weights in self.layers]
+
+    def run(self, sequences, state=None):
+        """Runs (batch x time x features) through the network, starting from `state`.
+
+        Returns the output for every time step (batch x time x outputs) and the final state.
+        Layers that only return their last step in Keras are run for every step here, so the
+        last output equals model.predict and the ones before it are available for streaming.
+        """
+        x = np.asarray(sequences, dtype=np.float32)
+        state = self.initial_state(x.shape[0]) if state is None else state
+        final_state = []
+        for (kind, weights), layer_state in zip(self.layers, state):
+            if kind == 'dense':
+                x = x @ weights['kernel'] + weights['bias']
+                final_state.append(None)
+                continue
+            # The input projection for every time step at once; only the recurrence is sequential
+            projected = x @ weights['kernel'] + weights['bias']
+            h, c = layer_state
+            outputs = np.empty(projected.shape[:2] + (h.shape[1],), dtype=np.float32)
+            for step in range(projected.shape[1]):
+                h, c = self._lstm_step(projected[:, step], h, c, weights)
+                outputs[:, step] = h
+            x = outputs
+            final_state.append((h, c))
+        return x, final_state
+
+    def predict(self, windows, batch_size=1024):
+        """Same as the Keras model.predict on (samples x time_steps x features) windows."""
+        windows = np.asarray(windows, dtype=np.float32)
+        predictions = np.empty((windows.shape[0], self.n_outputs), dtype=np.float32)
+        # In batches so the gate projections of a long recording don't all sit in memory at once
+        for start in range(0, windows.shape[0], batch_size):
+            outputs, _ = self.run(windows[start:start + batch_size])
+            predictions[start:start + batch_size] = outputs[:, -1]
+        return predictions
+
+
+class StreamingLSTM:
+    """Feeds samples through an LSTMNetwork as they arrive, predicting after each one.
+
+    Keras trained the model on windows of `window_size` samples, each starting from a zero
+    state, so with a window size every prediction runs the latest window from zero, exactly
+    as model.predict would. The windows of a block go through as one batch of `window_size`
+    sequential steps; with the app's 16-sample epochs that is about 2.5x the time of carrying
+    the state (18 ms against 7 ms per second of data). Until a full window has arrived, the
+    predictions run over the samples there are.
+
+    Without a window size the hidden state is carried from sample to sample instead. That
+    is one step per sample, but the network never saw state older than its window in
+    training, so the outputs drift away from what it was trained to give.
+    """
+
+    def __init__(self, network, window_size=None):
+        self.network = network
+        self.window_size = window_size
+        self.reset()
+
+    def reset(self):
+        self.state = self.network.initial_state()
+        self.history = np.empty((0, self.network.n_inputs), dtype=np.float32)
+
+    def update(self, block):
+        """Takes a (channels x n) block and returns the (n x outputs) prediction after each sample."""
+        samples = np.asarray(block, dtype=np.float32).T[:, :self.network.n_inputs]
+        if self.window_size is None:
+            outputs, self.state = self.network.run(samples[None], self.state)
+            return outputs[0]
+
+        samples = np.concatenate([self.history, samples])
+        first = len(self.history)  # Where the new samples start
+        complete = max(first, self.window_size - 1)  # The first new sample with a full window behind it
+        outputs = np.empty((len(samples) - first, self.network.n_outputs), dtype=np.float32)
+        for end in range(first, min(complete, len(samples))):
+            outputs[end - first] = self.network.predict(samples[None, :end + 1])[0]
+        if len(samples) > complete:
+            windows = sliding_window_view(samples, self.window_size, axis=0)[complete - self.window_size + 1:]
+            outputs[complete - first:] = self.network.predict(windows.transpose(0, 2, 1))
+        self.history = samples[max(0, len(samples) - self.window_size + 1):]
+        return outputs
+
+
+def compare_with_keras(model, network, windows):
+    """Largest absolute difference between Keras and NumPy predictions on the same windows."""
+    expected = model.predict(windows, verbose=0)
+    return float(np.max(np.abs(network.predict(windows) - expected)))
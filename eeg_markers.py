@@ -0,0 +1,159 @@
+import bisect
+import json
+import threading
+
+import numpy as np
+
+# Marker labels emitted by the session screens
+SESSION_START = "session_start"
+SESSION_STOP = "session_stop"
+DOCUMENT_SHOWN = "document_shown"
+COLOUR_CHANGE = "colour_change"
+USER_INPUT = "user_input"
+FEEDBACK_PROMPT = "feedback_prompt"
+CALIBRATION_DONE = "calibration_done"
+LABEL_FOCUSED = "label_focused"  # The user says they were focused
+LABEL_DISTRACTED = "label_distracted"  # The user says they were distracted
+
+
+class MarkerStore:
+    """Sorted index of event markers stamped with the device sample index.
+
+    Markers are added from both the Tk thread and the SDK callback thread, so the lists are
+    read and changed under a lock.
+    """
+
+    def __init__(self):
+        # Parallel lists, always kept sorted by sample index
+        self._samples = []
+        self._labels = []
+        self._details = []
+        self._by_label = {}  # Sorted sample indices of each label
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(zip(self._samples, self._labels, self._details)))
+
+    def clear(self):
+        with self._lock:
+            self._samples = []
+            self._labels = []
+            self._details = []
+            self._by_label = {}
+
+    def add(self, sample_index, label, detail=""):
+        """Stores a marker, keeping the index sorted by sample."""
+        sample_index = int(sample_index)
+        with self._lock:
+            # Markers nearly always arrive in order, so appending is the common case
+            if not self._samples or sample_index >= self._samples[-1]:
+                position = len(self._samples)
+            else:
+                position = bisect.bisect_right(self._samples, sample_index)
+            self._samples.insert(position, sample_index)
+            self._labels.insert(position, label)
+            self._details.insert(position, detail)
+            bisect.insort_right(self._by_label.setdefault(label, []), sample_index)
+        return position
+
+    def sample_of(self, position):
+        with self._lock:
+            return self._samples[position]
+
+    def label_of(self, position):
+        with self._lock:
+            return self._labels[position]
+
+    def find(self, label, occurrence=0):
+        """Returns the position of the n-th marker with the given label, or None."""
+        with self._lock:
+            samples = self._by_label.get(label, [])
+            if not 0 <= occurrence < len(samples):
+                return None
+            sample_index = samples[occurrence]
+            # Markers at the same sample keep their insertion order, so count along those ties
+            skip = occurrence - bisect.bisect_left(samples, sample_index)
+            position = bisect.bisect_left(self._samples, sample_index)
+            while True:
+                if self._labels[position] == label:
+                    if not skip:
+                        return position
+                    skip -= 1
+                position += 1
+
+    def between(self, start, stop):
+        """Returns the (first, last) positions of markers with start <= sample < stop."""
+        with self._lock:
+            first = bisect.bisect_left(self._samples, start)
+            last = bisect.bisect_left(self._samples, stop)
+        return first, last
+
+    def markers_between(self, start, stop):
+        with self._lock:
+            first, last = self.between(start, stop)
+            return list(zip(self._samples[first:last], self._labels[first:last], self._details[first:last]))
+
+    def nearest(self, sample_index):
+        """Returns the position of the marker closest to a sample index, or None."""
+        with self._lock:
+            if not self._samples:
+                return None
+            position = bisect.bisect_left(self._samples, sample_index)
+            if position == 0:
+                return 0
+            if position == len(self._samples):
+                return position - 1
+            before = sample_index - self._samples[position - 1]
+            after = self._samples[position] - sample_index
+        return position - 1 if before <= after else position
+
+    def window_around(self, position, before, after, total_samples=None):
+        """Returns the (start, stop) sample range around the marker at a position."""
+        centre = self.sample_of(position)
+        start = max(0, centre - before)
+        stop = centre + after
+        if total_samples is not None:
+            stop = min(stop, total_samples)
+        return start, stop
+
+    def samples_around(self, data, position, before, after):
+        """Slices a (channels x samples) array around the marker at a position."""
+        start, stop = self.window_around(position, before, after, data.shape[-1])
+        return data[..., start:stop]
+
+    def as_arrays(self):
+        """Returns the sample indices (int64) and labels as NumPy arrays."""
+        with self._lock:
+            return np.asarray(self._samples, dtype=np.int64), np.asarray(self._labels, dtype=object)
+
+    def labels_for_samples(self, first_sample, n_samples):
+        """Builds a per-sample label column for the range [first_sample, first_sample + n_samples)."""
+        column = np.full(n_samples, "", dtype=object)
+        for sample_index, label, _ in self.markers_between(first_sample, first_sample + n_samples):
+            offset = sample_index - first_sample
+            if column[offset]:
+                column[offset] = column[offset] + ";" + label
+            else:
+                column[offset] = label
+        return column
+
+    def save(self, file_path):
+        """Writes the markers to a JSON file next to the recorded samples."""
+        with self._lock:
+            saved = {"sample": list(self._samples), "label": list(self._labels), "detail": list(self._details)}
+        with open(file_path, "w") as file:
+            json.dump(saved, file)
+
+    @classmethod
+    def load(cls, file_path):
+        store = cls()
+        with open(file_path, "r") as file:
+            saved = json.load(file)
+        for sample_index, label, detail in zip(saved["sample"], saved["label"], saved["detail"]):
+            store.add(sample_index, label, detail)
+        return store
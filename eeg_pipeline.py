@@ -0,0 +1,141 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+from eeg_cache import code_digest, stage_key
+
+
+class Stage:
+    """One step of an offline pipeline: named array inputs in, named array outputs out.
+
+    `function` is called with the inputs and `params` as keyword arguments and returns its
+    outputs as a tuple in the order of `outputs` (or the single output on its own). `code`
+    lists helpers whose source should also invalidate the stage's checkpoint when edited, and
+    `constants` any module-level settings the function reads.
+    """
+
+    def __init__(self, name, function, inputs, outputs, params=None, code=(), constants=(), checkpoint=False):
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.params = dict(params or {})
+        self.code = tuple(code)
+        self.constants = tuple(constants)
+        self.checkpoint = checkpoint
+
+    def __call__(self, values):
+        result = self.function(**{name: values[name] for name in self.inputs}, **self.params)
+        result = (result,) if len(self.outputs) == 1 else tuple(result)
+        return dict(zip(self.outputs, result))
+
+
+class Pipeline:
+    """Runs a DAG of Stages, handing arrays from one to the next in memory.
+
+    Only stages marked `checkpoint` are written to the FeatureCache, keyed by their code,
+    parameters and the keys of everything upstream, so a run can resume from the latest
+    checkpoint that is still valid. Each run leaves per-stage timings in `report`, and the peak
+    memory of each stage with `trace_memory` (tracemalloc slows the stages down noticeably).
+    """
+
+    def __init__(self, stages, cache=None, trace_memory=False):
+        self.stages = list(stages)
+        self.cache = cache
+        self.trace_memory = trace_memory
+        self.producer = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producer:
+                    raise ValueError(f"{output} is produced by both {self.producer[output].name} and {stage.name}")
+                self.producer[output] = stage
+        self.report = []
+
+    def checkpoint(self, *names):
+        """Marks the named stages (and only those) to be written to the cache."""
+        for stage in self.stages:
+            stage.checkpoint = stage.name in names
+        return self
+
+    def _stage_keys(self, source_keys):
+        keys = dict(source_keys)
+        stage_keys = {}
+
+        def key_of(name):
+            if name not in keys:
+                if name not in self.producer:
+                    raise KeyError(f"No source or stage provides {name}")
+                stage = self.producer[name]
+                if stage.name not in stage_keys:
+                    stage_keys[stage.name] = stage_key(stage.name, code_digest(stage.function, *stage.code),
+                                                       stage.params, stage.constants,
+                                                       [key_of(input) for input in stage.inputs])
+                keys[name] = stage_keys[stage.name]
+            return keys[name]
+
+        for stage in self.stages:
+            for output in stage.outputs:
+                key_of(output)
+        return stage_keys
+
+    def run(self, sources, targets, source_keys=None):
+        """Computes `targets` from the `sources` dict, running only the stages they need.
+
+        `source_keys` identify the sources in checkpoint keys (e.g. a file digest for a path);
+        a source without one is keyed by its value.
+        """
+        source_keys = {name: (source_keys or {}).get(name, value) for name, value in sources.items()}
+        keys = self._stage_keys(source_keys)
+        values = dict(sources)
+        self.report = []
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+
+        def resolve(name):
+            if name in values:
+                return
+            stage = self.producer[name]
+            if stage.checkpoint and self.cache is not None:
+                started = time.perf_counter()
+                stored = self.cache.load(stage.name, keys[stage.name])
+                if stored is not None and all(output in stored for output in stage.outputs):
+                    values.update({output: stored[output] for output in stage.outputs})
+                    self._record(stage, time.perf_counter() - started, None, values, 'checkpoint')
+                    return
+            for input in stage.inputs:
+                resolve(input)
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            values.update(stage(values))
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] - baseline if self.trace_memory else None
+            if stage.checkpoint and self.cache is not None:
+                self.cache.save(stage.name, keys[stage.name], **{output: values[output] for output in stage.outputs})
+            self._record(stage, seconds, peak, values, 'run')
+
+        try:
+            for target in targets:
+                resolve(target)
+        finally:
+            if tracing:
+                tracemalloc.stop()
+        return {target: values[target] for target in targets}
+
+    def _record(self, stage, seconds, peak, values, source):
+        output_bytes = sum(np.asarray(values[output]).nbytes for output in stage.outputs)
+        self.report.append({'stage': stage.name, 'source': source, 'seconds': seconds,
+                            'peak_mb': None if peak is None else peak / 1e6, 'output_mb': output_bytes / 1e6})
+
+
+def format_report(report):
+    """One line per stage of a Pipeline report: where its outputs came from, time and memory."""
+    lines = []
+    for entry in report:
+        peak = '' if entry['peak_mb'] is None else f", peak {entry['peak_mb']:.1f} MB"
+        lines.append(f"{entry['stage']:<10} {entry['source']:<10} {entry['seconds'] * 1000:8.1f} ms"
+                     f"{peak}, outputs {entry['output_mb']:.1f} MB")
+    return '\n'.join(lines)
@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+
+from eeg_markers import MarkerStore
+
+# Channel layout of the Neurosity Crown
+CHANNEL_NAMES = ['CP3', 'C3', 'F5', 'PO3', 'PO4', 'F6', 'C4', 'CP4']
+SAMPLING_RATE = 256
+
+
+class SampleRingBuffer:
+    """Fixed-size (channels x samples) buffer holding the most recent samples of a live session."""
+
+    def __init__(self, n_channels=8, capacity=SAMPLING_RATE * 60, dtype=np.float32):
+        self.n_channels = n_channels
+        self.capacity = capacity
+        self.buffer = np.zeros((n_channels, capacity), dtype=dtype)
+        self.total_written = 0  # Device sample index of the next sample to be written
+
+    def clear(self):
+        self.total_written = 0
+
+    @property
+    def first_sample(self):
+        """Device sample index of the oldest sample still held."""
+        return max(0, self.total_written - self.capacity)
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    def write(self, samples):
+        """Appends a (channels x n) block, overwriting the oldest samples."""
+        samples = np.asarray(samples, dtype=self.buffer.dtype)
+        n = samples.shape[1]
+        if n >= self.capacity:
+            samples = samples[:, -self.capacity:]
+            self.total_written += n - self.capacity
+            n = self.capacity
+        start = self.total_written % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            self.buffer[:, start:end] = samples
+        else:
+            split = self.capacity - start
+            self.buffer[:, start:] = samples[:, :split]
+            self.buffer[:, :end - self.capacity] = samples[:, split:]
+        self.total_written += n
+
+    def window(self, start, stop):
+        """Returns samples [start, stop) by device sample index (a view when it doesn't wrap)."""
+        if start < self.first_sample or stop > self.total_written:
+            raise IndexError("Requested samples are no longer (or not yet) in the buffer")
+        first = start % self.capacity
+        last = first + (stop - start)
+        if last <= self.capacity:
+            return self.buffer[:, first:last]
+        return np.concatenate((self.buffer[:, first:], self.buffer[:, :last - self.capacity]), axis=1)
+
+    def latest(self, n):
+        n = min(n, len(self))
+        return self.window(self.total_written - n, self.total_written)
+
+    def ordered(self):
+        """Returns every held sample in time order, with the device index of the first one."""
+        return self.latest(len(self)), self.first_sample
+
+
+class RecordedSession:
+    """A session stored on disk: memory-mapped samples plus its info and markers."""
+
+    def __init__(self, data, sampling_rate, channel_names, markers, start_time=None):
+        self.data = data
+        self.sampling_rate = sampling_rate
+        self.channel_names = channel_names
+        self.markers = markers
+        self.start_time = start_time
+
+    @property
+    def n_samples(self):
+        return self.data.shape[1]
+
+
+def create_session(base_path, n_channels, n_samples):
+    """Creates an empty float32 '<base>.npy' on disk and returns it memory-mapped for filling in."""
+    return np.lib.format.open_memmap(base_path + ".npy", mode="w+", dtype=np.float32,
+                                     shape=(n_channels, n_samples))
+
+
+def write_session_info(base_path, markers=None, sampling_rate=SAMPLING_RATE,
+                       channel_names=CHANNEL_NAMES, start_time=None):
+    """Writes a session's info and markers to '<base>.json'."""
+    info = {
+        "sampling_rate": sampling_rate,
+        "channel_names": list(channel_names),
+        "start_time": start_time,
+        "markers": {"sample": [], "label": [], "detail": []}
+    }
+    if markers is not None:
+        for sample_index, label, detail in markers:
+            info["markers"]["sample"].append(sample_index)
+            info["markers"]["label"].append(label)
+            info["markers"]["detail"].append(detail)
+    with open(base_path + ".json", "w") as file:
+        json.dump(info, file)
+
+
+def save_session(base_path, data, markers=None, sampling_rate=SAMPLING_RATE,
+                 channel_names=CHANNEL_NAMES, start_time=None):
+    """Writes a (channels x samples) array to '<base>.npy' and its info/markers to '<base>.json'."""
+    np.save(base_path + ".npy", np.asarray(data, dtype=np.float32))
+    write_session_info(base_path, markers, sampling_rate, channel_names, start_time)
+    return base_path
+
+
+def open_session(base_path):
+    """Opens a saved session with its samples memory-mapped rather than loaded."""
+    base_path = os.path.splitext(base_path)[0] if base_path.endswith((".npy", ".json")) else base_path
+    data = np.load(base_path + ".npy", mmap_mode="r")
+    with open(base_path + ".json", "r") as file:
+        info = json.load(file)
+    markers = MarkerStore()
+    saved = info.get("markers", {})
+    for sample_index, label, detail in zip(saved.get("sample", []), saved.get("label", []), saved.get("detail", [])):
+        markers.add(sample_index, label, detail)
+    return RecordedSession(data, info["sampling_rate"], info["channel_names"], markers, info.get("start_time"))
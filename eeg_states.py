@@ -0,0 +1,753 @@
+import time
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from eeg_formulas import StateFormulas
+
+# Order of the columns in every state array; band arrays are (theta, alpha, beta, gamma) like BAND_NAMES
+STATE_NAMES = ('focus', 'concentration', 'engagement', 'enjoyment', 'memory', 'distraction')
+
+# Colour ranges the display moves through (hue in degrees, lightness and saturation 0-1)
+COLOR_RANGES = {
+    'hue': (180, 240),  # Blue spectrum
+    'lightness': (0.6, 0.95),  # Increased contrast
+    'saturation': (0.15, 0.35)  # Slightly more saturated
+}
+DEFAULT_COLORS = ('#FFFFFF', '#000000')  # Background and text before the first analysed tick
+
+# The states as formulas over each band's share of the total power; a config file can tune
+# these or add states (see eeg_formulas.load_state_formulas)
+STATE_FORMULAS = StateFormulas({
+    'focus': '(beta * 0.4 + gamma * 0.3) / (theta * 0.3)',
+    'concentration': 'beta / (theta + 0.1)',
+    'engagement': '(beta + gamma) / (alpha + theta)',
+    'enjoyment': '(alpha + gamma) / 2',
+    'memory': '(theta + gamma) / 2',
+    'distraction': '(theta + alpha) / (beta + 0.1)'
+})
+
+# The same combinations over band z-scores against the user's baseline: in log space ratios
+# become differences, squashed to 0-1 so that 0.5 is the user's resting level
+CALIBRATED_STATE_FORMULAS = StateFormulas({
+    'focus': 'sigmoid((beta * 0.4 + gamma * 0.3) / 0.7 - theta)',
+    'concentration': 'sigmoid(beta - theta)',
+    'engagement': 'sigmoid((beta + gamma) / 2 - (alpha + theta) / 2)',
+    'enjoyment': 'sigmoid((alpha + gamma) / 2)',
+    'memory': 'sigmoid((theta + gamma) / 2)',
+    'distraction': 'sigmoid((theta + alpha) / 2 - beta)'
+})
+
+
+def brain_states(bands, formulas=STATE_FORMULAS):
+    """Scores the states from (ticks x 4) theta/alpha/beta/gamma band values.
+
+    Each tick is normalised by its own total power. Returns (ticks x states) float32; a tick
+    with no power at all comes back as a row of NaN.
+    """
+    bands = np.atleast_2d(np.asarray(bands, dtype=np.float32))
+    total = bands.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        states = formulas(bands / total)
+    states[total[:, 0] == 0] = np.nan
+    return states
+
+
+def calibrated_states(band_zscores, formulas=CALIBRATED_STATE_FORMULAS):
+    """Scores the states from (ticks x 4) band z-scores against the user's baseline."""
+    return formulas(band_zscores)
+
+
+_trend_weights = {}
+
+
+def trend_weights(n):
+    """Least-squares slope weights for n evenly spaced points: slope = sum(weights * values)."""
+    if n not in _trend_weights:
+        x = np.arange(n, dtype=np.float64)
+        x -= x.mean()
+        _trend_weights[n] = x / np.sum(x * x)
+    return _trend_weights[n]
+
+
+def trend_slopes(windows):
+    """Slope of the least-squares line through the last axis of `windows` (..., n).
+
+    Summed term by term so a single window and a whole session's stack of windows
+    give bit-identical results.
+    """
+    n = windows.shape[-1]
+    weights = trend_weights(n)
+    slope = windows[..., 0] * weights[0]
+    for k in range(1, n):
+        slope = slope + windows[..., k] * weights[k]
+    return slope
+
+
+def rolling_trends(states, window_size=10, min_length=3):
+    """Trend of every state at every tick over (up to) the last window_size ticks, including that tick.
+
+    Ticks with fewer than min_length values behind them get a trend of 0.
+    """
+    states = np.asarray(states)
+    n_ticks = states.shape[0]
+    trends = np.zeros(states.shape, dtype=np.float64)
+    # The history is still filling up for the first ticks, so their windows are shorter
+    for length in range(min_length, min(window_size, n_ticks + 1)):
+        trends[length - 1] = trend_slopes(states[:length].T)
+    if n_ticks >= window_size:
+        windows = sliding_window_view(states, window_size, axis=0)  # ticks x states x window
+        trends[window_size - 1:] = trend_slopes(windows)
+    return trends
+
+
+def hls_to_rgb(h, l, s):
+    """colorsys.hls_to_rgb over arrays, step for step so the results match it exactly."""
+    h, l, s = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in (h, l, s)))
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+
+    def channel(hue):
+        hue = np.mod(hue, 1.0)
+        return np.select(
+            [hue < 1.0 / 6.0, hue < 0.5, hue < 2.0 / 3.0],
+            [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2.0 / 3.0 - hue) * 6.0],
+            m1)
+
+    rgb = np.stack([channel(h + 1.0 / 3.0), channel(h), channel(h - 1.0 / 3.0)], axis=-1)
+    rgb[s == 0.0] = l[s == 0.0, None]
+    return rgb
+
+
+def state_colors(states, color_ranges=COLOR_RANGES, names=STATE_NAMES):
+    """Background and text colour for every tick of a (ticks x states) array with columns `names`.
+
+    Only the six STATE_NAMES drive the colours, so extra configured states are ignored.
+    Returns two object arrays of hex strings; a tick whose colour can't be computed
+    (non-finite states) gets None.
+    """
+    states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+    focus, concentration, engagement, enjoyment, memory, distraction = (
+        states[:, names.index(name)] for name in STATE_NAMES)
+    hue_range, lightness_range, saturation_range = (color_ranges[key] for key in ('hue', 'lightness', 'saturation'))
+
+    # Hue follows focus and concentration, lightness engagement and enjoyment,
+    # saturation memory commitment against distraction
+    focus_factor = np.clip(focus, 0.1, 0.9)
+    concentration_factor = np.clip(concentration, 0.1, 0.9)
+    hue = hue_range[0] + (hue_range[1] - hue_range[0]) * ((focus_factor + concentration_factor) / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lightness = lightness_range[0] + (lightness_range[1] - lightness_range[0]) * ((engagement + enjoyment) / 2)
+        saturation = saturation_range[0] + (
+            (saturation_range[1] - saturation_range[0]) * (memory / (distraction + 0.1)))
+        rgb = hls_to_rgb(hue / 360, lightness, saturation)
+
+    finite = np.isfinite(rgb).all(axis=1)
+    levels = np.zeros(rgb.shape, dtype=np.int64)
+    levels[finite] = (rgb[finite] * 255).astype(np.int64)  # Truncates like int()
+    brightness = (rgb[:, 0] * 299 + rgb[:, 1] * 587 + rgb[:, 2] * 114) / 1000
+
+    backgrounds = np.full(len(states), None, dtype=object)
+    texts = np.full(len(states), None, dtype=object)
+    for tick in np.flatnonzero(finite):
+        backgrounds[tick] = '#{:02x}{:02x}{:02x}'.format(*levels[tick].tolist())
+        texts[tick] = '#000000' if brightness[tick] > 0.5 else '#FFFFFF'
+    return backgrounds, texts
+
+
+def smooth_states(states, smoother, timestamps):
+    """Runs a (ticks x 6) state timeline through a smoother, tick by tick as the live path does."""
+    smoother.reset()
+    smoothed = np.empty(states.shape, dtype=np.float32)
+    for tick, (row, timestamp) in enumerate(zip(states, timestamps)):
+        smoothed[tick] = smoother.update(row, timestamp)
+    return smoothed
+
+
+def too_soon(elapsed, transition_delay):
+    """Whether a colour change `elapsed` seconds after the last one comes within the transition delay.
+
+    Allows for rounding, so ticks exactly one delay apart aren't held back.
+    """
+    return elapsed < transition_delay - 1e-9 * max(transition_delay, 1.0)
+
+
+def _displayed_colors(states, timestamps, gate, transition_delay, color_ranges, names):
+    """The colours each tick sets on the display, None where it leaves them, as StateAnalyzer decides.
+
+    A tick within `transition_delay` of the last colour change is skipped before it reaches
+    the gate, a gated tick is coloured from the states the gate lets through, and a tick whose
+    colours can't be computed doesn't count as a change.
+    """
+    if gate is None:
+        new_backgrounds, new_texts = state_colors(states, color_ranges, names)
+    backgrounds = np.full(len(states), None, dtype=object)
+    texts = np.full(len(states), None, dtype=object)
+    if gate is not None:
+        gate.reset()
+    last_change = -np.inf
+    for tick, (row, timestamp) in enumerate(zip(states, timestamps)):
+        if too_soon(timestamp - last_change, transition_delay):
+            continue
+        if gate is None:
+            background, text = new_backgrounds[tick], new_texts[tick]
+        else:
+            held, changed = gate.update(row)
+            if not changed:
+                continue
+            (background,), (text,) = state_colors([held], color_ranges, names)
+        if background is None:
+            continue
+        backgrounds[tick], texts[tick] = background, text
+        last_change = timestamp
+    return backgrounds, texts
+
+
+def analyze_session(bands, calibrated=False, window_size=10, color_ranges=COLOR_RANGES,
+                    smoother=None, gate=None, tick_seconds=0.1, formulas=None, forecaster=None, latency=0.0,
+                    transition_delay=0.0):
+    """Runs a whole band timeline through the state analysis at once.
+
+    `bands` is (ticks x 4) theta/alpha/beta/gamma values, or band z-scores if calibrated.
+    Gives what StateAnalyzer (and so the app's BrainStateAnalyzer) would show with the same
+    smoother, gate, forecaster and colour transition delay: ticks with no power are skipped
+    as the streaming path skips them, and keep the previous colours. With a forecaster the colours follow the states
+    forecast `latency` plus half the transition delay ahead, and a tick within
+    `transition_delay` seconds of the last colour change leaves the colours (and the gate)
+    as they are. The smoother, forecaster, gate and delay are recursive, so those steps go
+    tick by tick. `formulas` replaces the default StateFormulas of the chosen mode.
+    Returns a dict of states, trends, valid mask and colours.
+    """
+    formulas = formulas or (CALIBRATED_STATE_FORMULAS if calibrated else STATE_FORMULAS)
+    states = calibrated_states(bands, formulas) if calibrated else brain_states(bands, formulas)
+    valid = ~np.isnan(states).all(axis=1)
+    if smoother is not None:
+        states[valid] = smooth_states(states[valid], smoother, np.flatnonzero(valid) * tick_seconds)
+
+    trends = np.full(states.shape, np.nan)
+    trends[valid] = rolling_trends(states[valid], window_size)
+
+    shown = states[valid]
+    times = np.flatnonzero(valid) * tick_seconds
+    if forecaster is not None:
+        shown = forecast_states(shown, times, latency + transition_delay / 2, forecaster)
+    backgrounds = np.full(len(states), None, dtype=object)
+    texts = np.full(len(states), None, dtype=object)
+    if gate is None and transition_delay <= 0:
+        backgrounds[valid], texts[valid] = state_colors(shown, color_ranges, formulas.names)
+    else:
+        backgrounds[valid], texts[valid] = _displayed_colors(shown, times, gate, transition_delay,
+                                                             color_ranges, formulas.names)
+    # A tick without a new colour keeps showing the previous one
+    background, text = DEFAULT_COLORS
+    for tick in range(len(states)):
+        if backgrounds[tick] is None:
+            backgrounds[tick], texts[tick] = background, text
+        else:
+            background, text = backgrounds[tick], texts[tick]
+    # The display only repaints when the colours actually change
+    redraw = np.ones(len(states), dtype=bool)
+    redraw[1:] = (backgrounds[1:] != backgrounds[:-1]) | (texts[1:] != texts[:-1])
+
+    return {
+        'states': states,            # ticks x formulas.names, float32
+        'trends': trends,            # ticks x formulas.names, NaN on skipped ticks
+        'valid': valid,              # ticks
+        'background': backgrounds,   # ticks, hex strings
+        'text': texts,               # ticks, hex strings
+        'redraw': redraw             # ticks, True where the colours changed
+    }
+
+
+class EMASmoother:
+    """Exponential moving average of every state with a time constant in seconds."""
+
+    def __init__(self, time_constant=0.15):
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.last_time = None
+
+    def _step(self, row, dt):
+        weight = 1.0 - np.exp(-dt / self.time_constant)
+        return self.value + weight * (row - self.value)
+
+    def update(self, row, timestamp):
+        """Folds one tick of states (seconds timestamp) in and returns the smoothed row."""
+        row = np.asarray(row, dtype=np.float64)
+        if self.value is None:
+            self.value = np.where(np.isfinite(row), row, 0.0)
+        else:
+            dt = max(timestamp - self.last_time, 1e-3)
+            # A state that blew up this tick (e.g. no theta) holds its previous value
+            self.value = np.where(np.isfinite(row), self._step(np.where(np.isfinite(row), row, self.value), dt),
+                                  self.value)
+        self.last_time = timestamp
+        return self.value
+
+
+class OneEuroSmoother(EMASmoother):
+    """One-euro filter: heavy smoothing while a state holds still, less as it moves, so little lag.
+
+    Speed is measured relative to the state's own size, so one beta suits the 0-1 states
+    and the much larger uncalibrated ratios alike.
+    """
+
+    def __init__(self, min_cutoff=0.5, beta=1.0, derivative_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.derivative = None
+
+    @staticmethod
+    def _weight(cutoff, dt):
+        return 1.0 / (1.0 + 1.0 / (2 * np.pi * cutoff * dt))
+
+    def _step(self, row, dt):
+        if self.derivative is None:
+            self.derivative = np.zeros_like(row)
+        speed = (row - self.value) / dt / (np.abs(self.value) + 0.05)
+        self.derivative = self.derivative + self._weight(self.derivative_cutoff, dt) * (speed - self.derivative)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.derivative)
+        return self.value + self._weight(cutoff, dt) * (row - self.value)
+
+
+class KalmanSmoother(EMASmoother):
+    """A scalar random-walk Kalman filter per state; the gain settles to suit the noise levels given."""
+
+    def __init__(self, process_variance=0.5, measurement_variance=0.1):
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.variance = None
+
+    def _step(self, row, dt):
+        if self.variance is None:
+            self.variance = np.full(row.shape, self.measurement_variance)
+        # Process noise is per second, so a longer gap lets the estimate move further
+        predicted = self.variance + self.process_variance * dt
+        gain = predicted / (predicted + self.measurement_variance)
+        self.variance = (1.0 - gain) * predicted
+        return self.value + gain * (row - self.value)
+
+
+class PassThroughSmoother(EMASmoother):
+    """No smoothing."""
+
+    def __init__(self):
+        self.reset()
+
+    def _step(self, row, dt):
+        return row
+
+
+STATE_SMOOTHERS = {
+    'none': PassThroughSmoother,
+    'ema': EMASmoother,
+    'one_euro': OneEuroSmoother,
+    'kalman': KalmanSmoother
+}
+
+
+def make_state_smoother(name='one_euro', **options):
+    return STATE_SMOOTHERS[name](**options)
+
+
+class HysteresisGate:
+    """Holds the states shown on screen until their settled level moves clear of a band around the held one.
+
+    Band power only changes once per analysis hop, and the hop-to-hop estimation noise moves
+    the states as much as a real change of mind does, so a band on the per-tick states either
+    redraws all the time or hides real changes. Instead each state is averaged over about two
+    hops (`settle_rate` per tick, a 0.45 s time constant at the app's 10 ticks/s) and that
+    level is what is gated and shown. The band around each held level is `width` plus `relative` times it, and
+    never narrower than `noise_multiple` times the level's own running spread (updated at
+    `noise_rate` per tick), since the noise is 25% of some states and 7% of others. When any
+    state crosses, all are taken together.
+
+    The defaults are tuned for at most 30 redraws a minute while the band powers hold steady
+    (235 without the gate), with a step in alpha still shown within a second
+    (benchmark_state_smoothing). `settle_rate=1`
+    and `noise_multiple=0` gate the per-tick states on the fixed band alone.
+    """
+
+    def __init__(self, width=0.05, relative=0.15, settle_rate=0.2, noise_multiple=2.5, noise_rate=0.01):
+        self.width = width
+        self.relative = relative
+        self.settle_rate = settle_rate
+        self.noise_multiple = noise_multiple
+        self.noise_rate = noise_rate
+        self.reset()
+
+    def reset(self):
+        self.held = None
+        self.level = None
+        self.mean = None
+        self.variance = None
+
+    def _settle(self, row):
+        if self.level is None:
+            self.level = row.copy()
+            self.mean = row.copy()
+            self.variance = np.zeros_like(row)
+            return
+        # A state that blew up this tick holds its level, and one that has never been finite starts now
+        fresh = np.isfinite(row) & ~np.isfinite(self.level)
+        self.level[fresh] = self.mean[fresh] = row[fresh]
+        live = np.isfinite(row) & ~fresh
+        self.level[live] += self.settle_rate * (row[live] - self.level[live])
+        delta = self.level[live] - self.mean[live]
+        self.mean[live] += self.noise_rate * delta
+        self.variance[live] = (1 - self.noise_rate) * (self.variance[live] + self.noise_rate * delta ** 2)
+
+    def update(self, row):
+        """Returns (held row, True if it just changed)."""
+        self._settle(np.asarray(row, dtype=np.float64))
+        if self.held is None:
+            self.held = self.level.copy()
+            return self.held, True
+        band = np.maximum(self.width + self.relative * np.abs(self.held),
+                          self.noise_multiple * np.sqrt(self.variance))
+        with np.errstate(invalid='ignore'):
+            crossed = np.abs(self.level - self.held) > band
+        if not crossed.any():
+            return self.held, False
+        self.held = self.level.copy()
+        return self.held, True
+
+
+class TrendForecaster:
+    """Extrapolates every state along its recent linear trend, to make up for pipeline latency.
+
+    The slope is the least-squares line through the (timestamp, state) pairs of the last
+    `window_seconds`; the forecast moves `damping` of the way along it, and never more than
+    `max_horizon` seconds ahead, so a noisy slope can't throw the colours far off.
+    """
+
+    def __init__(self, window_seconds=1.0, damping=0.5, max_horizon=0.5, max_points=32):
+        self.window_seconds = window_seconds
+        self.damping = damping
+        self.max_horizon = max_horizon
+        self.max_points = max_points
+        self.reset()
+
+    def reset(self):
+        self.times = deque(maxlen=self.max_points)
+        self.values = deque(maxlen=self.max_points)
+
+    def update(self, row, timestamp):
+        self.times.append(timestamp)
+        self.values.append(np.asarray(row, dtype=np.float64))
+
+    def slope(self):
+        """Change per second of every state over the window, zero until there are three points."""
+        times = np.array(self.times)
+        recent = times >= times[-1] - self.window_seconds
+        if recent.sum() < 3:
+            return np.zeros_like(self.values[-1])
+        x = times[recent] - times[recent].mean()
+        values = np.array(self.values)[recent]
+        return (x @ values) / max(np.sum(x * x), 1e-12)
+
+    def predict(self, horizon):
+        """The latest states carried `horizon` seconds forward; NaN slopes leave a state as it is."""
+        latest = self.values[-1]
+        if horizon <= 0 or len(self.values) < 3:
+            return latest
+        step = self.damping * min(horizon, self.max_horizon) * self.slope()
+        return np.where(np.isfinite(step), latest + step, latest)
+
+
+def forecast_states(states, timestamps, horizon, forecaster=None):
+    """Forecasts of a (ticks x states) timeline, each made from the ticks up to it as the live path does."""
+    forecaster = forecaster or TrendForecaster()
+    forecaster.reset()
+    forecasts = np.empty(states.shape, dtype=np.float64)
+    for tick, (row, timestamp) in enumerate(zip(states, timestamps)):
+        forecaster.update(row, timestamp)
+        forecasts[tick] = forecaster.predict(horizon)
+    return forecasts
+
+
+class StateAnalyzer:
+    """The live state analysis, one display tick at a time.
+
+    Scores the states with the raw or calibrated formulas, smooths them and keeps a short
+    history for their trends. The colours come from the states (or their forecast) through
+    the optional hysteresis gate, at most once per `transition_delay` seconds.
+    analyze_session gives the same results for a whole recording. `clock` returns the
+    current time in seconds.
+    """
+
+    def __init__(self, formulas=STATE_FORMULAS, calibrated_formulas=CALIBRATED_STATE_FORMULAS, window_size=10,
+                 color_ranges=COLOR_RANGES, smoother=None, gate=None, forecaster=None, transition_delay=0.1,
+                 clock=time.time):
+        self.formulas = formulas
+        self.calibrated_formulas = calibrated_formulas
+        self.state_names = formulas.names
+
+        # Moving windows for trend analysis, one float32 row per state with the newest value last
+        self.window_size = window_size
+        self.history_values = np.zeros((len(self.state_names), window_size), dtype=np.float32)
+        self.history_length = 0
+
+        self.color_ranges = dict(color_ranges)
+        self.current_colors = {'text': DEFAULT_COLORS[1], 'background': DEFAULT_COLORS[0]}
+        self.last_update = -np.inf  # When the colours last changed
+        self.transition_delay = transition_delay
+
+        self.smoother = smoother or PassThroughSmoother()
+        self.gate = gate
+        self.forecaster = forecaster
+        self.clock = clock
+
+        # Whether the states are on the calibrated 0-1 scale rather than the raw band ratios
+        self.calibrated = False
+
+    def reset(self):
+        """Forgets the previous session's history and smoothing."""
+        self.calibrated = False
+        self.reset_states()
+
+    def reset_states(self):
+        """Forgets the state history, smoothing, hysteresis and forecast."""
+        self.history_length = 0
+        self.smoother.reset()
+        if self.gate is not None:
+            self.gate.reset()
+        if self.forecaster is not None:
+            self.forecaster.reset()
+
+    def use_scale(self, calibrated):
+        """Starts the states afresh when they switch from raw ratios to the calibrated scale (or back)."""
+        if calibrated != self.calibrated:
+            self.calibrated = calibrated
+            self.reset_states()
+
+    def analyze_brain_state(self, alpha, beta, theta, gamma):
+        """The states by name from the latest band powers, or None if there is no power at all."""
+        self.use_scale(False)
+        # The same kernel scores whole recorded sessions, so live and replayed states always agree
+        return self.record_states(brain_states([[theta, alpha, beta, gamma]], self.formulas)[0])
+
+    def analyze_calibrated_state(self, band_zscores):
+        """The states by name from theta/alpha/beta/gamma z-scores against the user's own baseline."""
+        self.use_scale(True)
+        return self.record_states(calibrated_states([band_zscores], self.calibrated_formulas)[0])
+
+    def record_states(self, row):
+        """Smooths one tick of states (in state_names order), adds it to the history and returns it by name.
+
+        A tick whose states are all NaN is skipped, as analyze_session skips it, and gives None.
+        """
+        if np.isnan(row).all():
+            return None
+        now = self.clock()
+        row = self.smoother.update(row, now).astype(np.float32)
+        if self.forecaster is not None:
+            self.forecaster.update(row, now)
+        self.history_values[:, :-1] = self.history_values[:, 1:]
+        self.history_values[:, -1] = row
+        self.history_length = min(self.history_length + 1, self.window_size)
+        return dict(zip(self.state_names, row))
+
+    @property
+    def history(self):
+        """The filled part of each state's window, oldest first."""
+        filled = self.history_values[:, self.window_size - self.history_length:]
+        return dict(zip(self.state_names, filled))
+
+    def get_state_trends(self, states):
+        """The slope of each state over its history, 0 until there are three ticks."""
+        if self.history_length < 3:
+            return dict.fromkeys(self.state_names, 0.0)
+        slopes = trend_slopes(self.history_values[:, self.window_size - self.history_length:])
+        return dict(zip(self.state_names, slopes))
+
+    def optimize_colors(self, states, trends, latency=None):
+        """The colours to show for the latest states; the same dict as before if they stay.
+
+        With a latency (seconds) and a forecaster, the colours are set from the states
+        forecast that far ahead, plus half the transition delay for the wait until the
+        screen next updates.
+        """
+        now = self.clock()
+        if not states or too_soon(now - self.last_update, self.transition_delay):
+            return self.current_colors
+
+        row = [states[state] for state in self.state_names]
+        if self.forecaster is not None and latency is not None:
+            row = self.forecaster.predict(latency + self.transition_delay / 2)
+
+        # Small wobbles inside the hysteresis band leave the colours as they are
+        if self.gate is not None:
+            row, changed = self.gate.update(row)
+            if not changed:
+                return self.current_colors
+
+        # Hue from focus and concentration, lightness from engagement and enjoyment,
+        # saturation from memory commitment against distraction
+        backgrounds, texts = state_colors([row], self.color_ranges, self.state_names)
+        if backgrounds[0] is None:  # Runaway state values, keep the current colours
+            return self.current_colors
+        self.current_colors = {'text': texts[0], 'background': backgrounds[0]}
+        self.last_update = now
+        return self.current_colors
+
+
+def replay_analyzer(analyzer, bands, tick_seconds=0.1, latency=None, calibrated=False):
+    """Feeds a (ticks x 4) band timeline to a StateAnalyzer one display tick at a time, on a simulated clock.
+
+    Returns the states and trends (NaN on skipped ticks) and the (background, text) shown
+    after every tick, to compare with analyze_session.
+    """
+    now = 0.0
+    analyzer.clock = lambda: now
+    states = np.full((len(bands), len(analyzer.state_names)), np.nan, dtype=np.float32)
+    trends = np.full(states.shape, np.nan)
+    colours = []
+    for tick, (theta, alpha, beta, gamma) in enumerate(bands):
+        now = tick * tick_seconds
+        if calibrated:
+            row = analyzer.analyze_calibrated_state([theta, alpha, beta, gamma])
+        else:
+            row = analyzer.analyze_brain_state(alpha, beta, theta, gamma)
+        if row:
+            tick_trends = analyzer.get_state_trends(row)
+            states[tick] = [row[name] for name in analyzer.state_names]
+            trends[tick] = [tick_trends[name] for name in analyzer.state_names]
+            analyzer.optimize_colors(row, tick_trends, latency)
+        colours.append((analyzer.current_colors['background'], analyzer.current_colors['text']))
+    return states, trends, colours
+
+
+def benchmark_session_replay(hours=1.0, tick_seconds=0.1, window_size=10, seed=0):
+    """Checks analyze_session against StateAnalyzer fed tick by tick, as the app feeds it, and times both."""
+    rng = np.random.default_rng(seed)
+    n_ticks = int(hours * 3600 / tick_seconds)
+    bands = (10 ** rng.normal([0.5, 1.0, 0.6, 0.2], 0.3, (n_ticks, 4))).astype(np.float32)
+    bands[rng.random(n_ticks) < 0.001] = 0  # The odd tick with every channel rejected
+
+    started = time.perf_counter()
+    batch = analyze_session(bands, window_size=window_size, tick_seconds=tick_seconds)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    states, trends, colours = replay_analyzer(StateAnalyzer(window_size=window_size), bands, tick_seconds)
+    streaming_seconds = time.perf_counter() - started
+
+    identical = (np.array_equal(states, batch['states'], equal_nan=True)
+                 and np.array_equal(trends, batch['trends'], equal_nan=True)
+                 and colours == list(zip(batch['background'], batch['text'])))
+    print(f"{n_ticks} ticks: batch {batch_seconds * 1000:.0f} ms, streaming {streaming_seconds * 1000:.0f} ms, "
+          f"identical: {identical}")
+    return identical
+
+
+def benchmark_state_smoothing(minutes=10, tick_seconds=0.1, hop_seconds=0.25, transition_delay=0.1, seed=0):
+    """Compares colour redraws, jitter and step-response lag of each smoother, with the hysteresis gate.
+
+    Alpha steps up by 2.5x every other minute, under per-hop estimation noise. Redraws are
+    counted outside the 10 s after each step, i.e. while the band powers hold steady; the
+    target for the app's settings is at most 30 a minute. Lag is the time from the tick of
+    a clean step until the state is halfway to its new level, interpolated between ticks;
+    0 means it was past halfway on the step's own tick. Shown is the median time from a
+    step until the displayed background is nearer the new level's colour than the old one;
+    the step only moves it by 6-7 RGB levels, about twice the colour noise, so single steps vary.
+    Jitter is the tick-to-tick change of the states before the first step, relative to their level.
+    """
+    rng = np.random.default_rng(seed)
+    n_ticks = int(minutes * 60 / tick_seconds)
+    period = int(round(60 / tick_seconds))
+    onsets = np.arange(period, n_ticks, period)
+    levels = np.tile([3.0, 10.0, 4.0, 1.5], (n_ticks, 1))
+    up = np.arange(n_ticks) // period % 2 == 1
+    levels[up, 1] *= 2.5
+    # Band power only changes once per analysis hop, and the display reads it every tick
+    hop = (np.arange(n_ticks) * tick_seconds // hop_seconds).astype(int)
+    noise = 10 ** rng.normal(0, 0.1, (hop[-1] + 1, 4))
+    bands = (levels * noise[hop]).astype(np.float32)
+    settling = np.zeros(n_ticks, dtype=bool)
+    for onset in onsets:
+        settling[onset:onset + int(round(10 / tick_seconds))] = True
+
+    def rgb(colors):
+        return np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in colors], dtype=np.float64)
+
+    clean = analyze_session(levels.astype(np.float32), tick_seconds=tick_seconds)
+    low, high = rgb(clean['background'][[period - 1, 2 * period - 1]])
+    enjoyment = STATE_NAMES.index('enjoyment')
+    results = {}
+    for name in STATE_SMOOTHERS:
+        # The hop noise moves the states as much as the step does, so the lag comes from a clean run
+        trace = analyze_session(levels.astype(np.float32), smoother=make_state_smoother(name), tick_seconds=tick_seconds
+                                )['states'][period - 1:2 * period, enjoyment].astype(np.float64)
+        half = (trace[0] + trace[-1]) / 2
+        crossed = np.flatnonzero(trace[1:] >= half)[0] + 1
+        lag_ms = (crossed - 2 + (half - trace[crossed - 1]) / (trace[crossed] - trace[crossed - 1])
+                  if crossed > 1 else 0.0) * tick_seconds * 1000
+        for gated in (False, True):
+            session = analyze_session(bands, smoother=make_state_smoother(name),
+                                      gate=HysteresisGate() if gated else None, tick_seconds=tick_seconds,
+                                      transition_delay=transition_delay)
+            steady = session['states'][:period]
+            jitter = np.mean(np.std(np.diff(steady, axis=0), axis=0) / np.mean(np.abs(steady), axis=0))
+            redraws_per_minute = session['redraw'][~settling].sum() / ((~settling).sum() * tick_seconds / 60)
+            shown = rgb(session['background'])
+            nearer_new = (np.linalg.norm(shown - np.where(up[:, None], high, low), axis=1)
+                          < np.linalg.norm(shown - np.where(up[:, None], low, high), axis=1))
+            shown_s = np.median([np.argmax(nearer_new[onset:onset + period]) * tick_seconds
+                                 if nearer_new[onset:onset + period].any() else np.inf for onset in onsets])
+            label = f"{name}{' + gate' if gated else ''}"
+            results[label] = {'redraws_per_minute': redraws_per_minute, 'lag_ms': lag_ms, 'jitter': jitter,
+                              'shown_s': shown_s}
+            print(f"{label:>16}: {redraws_per_minute:6.1f} redraws/min, jitter {jitter:.1%}, lag {lag_ms:.0f} ms, "
+                  f"shown within {shown_s:.1f} s")
+    return results
+
+
+def benchmark_state_forecast(latency=0.3, minutes=10, tick_seconds=0.1, hop_seconds=0.25, seed=0):
+    """Compares forecast and stale states against what the states actually became `latency` later.
+
+    The display shows the smoothed states of `latency` seconds ago; without a forecast its
+    error is the change over that time, with one it is how far the forecast misses.
+    """
+    rng = np.random.default_rng(seed)
+    n_ticks = int(minutes * 60 / tick_seconds)
+    t = np.arange(n_ticks) * tick_seconds
+    # Alpha and beta drift over a few seconds, as attention does, under per-hop estimation noise
+    levels = np.tile([3.0, 10.0, 4.0, 1.5], (n_ticks, 1))
+    levels[:, 1] *= 1 + 0.6 * np.sin(2 * np.pi * t / 7.0)
+    levels[:, 2] *= 1 + 0.4 * np.sin(2 * np.pi * t / 11.0 + 1.0)
+    hop = (t // hop_seconds).astype(int)
+    bands = (levels * 10 ** rng.normal(0, 0.05, (hop[-1] + 1, 4))[hop]).astype(np.float32)
+    states = analyze_session(bands, smoother=make_state_smoother('one_euro'), tick_seconds=tick_seconds)['states']
+
+    shift = int(round(latency / tick_seconds))
+    actual = states[shift:]
+    stale = states[:-shift]
+    forecast = forecast_states(states, t, latency)[:-shift]
+    # Relative to each state's spread, so the large ratios don't dominate
+    scale = np.std(states, axis=0)
+    stale_error = np.sqrt(np.mean(((stale - actual) / scale) ** 2, axis=0))
+    forecast_error = np.sqrt(np.mean(((forecast - actual) / scale) ** 2, axis=0))
+    for name, before, after in zip(STATE_NAMES, stale_error, forecast_error):
+        print(f"{name:>13}: stale {before:.3f}, forecast {after:.3f} (RMS error in standard deviations)")
+    print(f"{'mean':>13}: stale {stale_error.mean():.3f}, forecast {forecast_error.mean():.3f}")
+    return {'stale': stale_error, 'forecast': forecast_error}
+
+
+if __name__ == "__main__":
+    benchmark_session_replay()
+    benchmark_state_smoothing()
+    benchmark_state_forecast()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from eeg_artifacts import ArtifactDetector
+from eeg_dsp import Rereferencer
+from eeg_session import CHANNEL_NAMES
+
+FRONTAL = [CHANNEL_NAMES.index('F5'), CHANNEL_NAMES.index('F6')]
+
+
+def blink_epoch(amplitude, seed=0):
+    """A 16-sample epoch of background EEG with a blink-shaped deflection on both frontal channels."""
+    epoch = np.random.default_rng(seed).normal(0, 5, (8, 16)).astype(np.float32)
+    epoch[FRONTAL] += amplitude * np.hanning(16).astype(np.float32)
+    return epoch
+
+
+def test_blinks_are_flagged_before_re_referencing():
+    for amplitude in (120, 200, 300):
+        clean_mask, flags = ArtifactDetector().check(blink_epoch(amplitude))
+        assert flags[3, FRONTAL].all()
+        assert clean_mask.tolist() == [index not in FRONTAL for index in range(8)]
+
+
+def test_common_average_without_flagged_channels_keeps_the_blink_off_the_others():
+    epoch = blink_epoch(200)
+    clean_mask, _ = ArtifactDetector().check(epoch)
+
+    referenced = Rereferencer('average').process(epoch, clean_mask)
+    others = ~np.isin(np.arange(8), FRONTAL)
+    assert np.ptp(referenced[others], axis=1).max() < 50
+
+    # With the blink in the average, every other channel picks up a quarter of it
+    smeared = Rereferencer('average').process(epoch)
+    assert np.ptp(smeared[others], axis=1).min() > 40
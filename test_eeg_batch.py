@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+from eeg_batch import find_sessions
+
+
+def touch(path):
+    with open(path, "w") as file:
+        file.write("")
+
+
+def test_find_sessions_lists_each_recording_once(tmp_path):
+    # The live app saves a recording as a CSV and as a binary session next to it
+    for stem in ("session 1", "session 2"):
+        touch(tmp_path / f"{stem}.csv")
+        np.save(tmp_path / f"{stem}.npy", np.zeros((8, 4), dtype=np.float32))
+        touch(tmp_path / f"{stem}.json")
+    # A CSV-only recording and a stray .npy without its sidecar
+    touch(tmp_path / "legacy.csv")
+    np.save(tmp_path / "stray.npy", np.zeros(3))
+
+    found = [os.path.basename(path) for path in find_sessions(str(tmp_path))]
+    assert found == ["legacy.csv", "session 1.npy", "session 2.npy", "stray.npy"]
+
+
+def test_find_sessions_dedupes_glob_matches(tmp_path):
+    touch(tmp_path / "a.csv")
+    np.save(tmp_path / "a.npy", np.zeros((8, 4), dtype=np.float32))
+    touch(tmp_path / "a.json")
+
+    found = find_sessions(str(tmp_path / "a.*"))
+    assert [os.path.basename(path) for path in found] == ["a.npy"]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from eeg_calibration import BaselineAccumulator, BaselineCache, log_power
+
+
+def test_masked_channels_are_left_out_of_the_baseline():
+    rng = np.random.default_rng(0)
+    readings = 10 ** rng.normal(1, 0.2, (40, 8, 4))
+    masks = rng.random((40, 8)) > 0.3
+    masks[:, 7] = False  # A channel that is never clean
+
+    accumulator = BaselineAccumulator()
+    for band_powers, mask in zip(readings, masks):
+        accumulator.update(band_powers, mask)
+    assert accumulator.updates == 40
+    np.testing.assert_array_equal(accumulator.count, masks.sum(axis=0))
+
+    baseline = accumulator.baseline("alice")
+    for channel in range(7):
+        clean = log_power(readings[masks[:, channel], channel]).astype(np.float64)
+        np.testing.assert_allclose(baseline.mean[channel], clean.mean(axis=0), rtol=1e-5)
+        np.testing.assert_allclose(baseline.std[channel], clean.std(axis=0, ddof=1), rtol=1e-4)
+    # The never-clean channel borrows the average of the others
+    np.testing.assert_allclose(baseline.mean[7], baseline.mean[:7].mean(axis=0), rtol=1e-5)
+
+
+def test_fully_masked_updates_change_nothing():
+    accumulator = BaselineAccumulator()
+    accumulator.update(np.ones((8, 4)), np.zeros(8, dtype=bool))
+    assert accumulator.updates == 1
+    assert not accumulator.count.any()
+    with pytest.raises(ValueError):
+        accumulator.baseline("alice")
+
+
+def test_baseline_cache_round_trip_checks_the_settings(tmp_path):
+    accumulator = BaselineAccumulator()
+    for band_powers in 10 ** np.random.default_rng(1).normal(1, 0.2, (20, 8, 4)):
+        accumulator.update(band_powers)
+    cache = BaselineCache(["alice"], directory=str(tmp_path))
+    cache.save(accumulator.baseline("alice", engine="iir", window=2.0))
+
+    loaded = cache.load("alice", engine="iir", window=2.0)
+    np.testing.assert_allclose(loaded.mean, accumulator.mean, rtol=1e-6)
+    assert cache.load("alice", engine="sdft", window=2.0) is None
+    assert cache.load("Guest", engine="iir", window=2.0) is None
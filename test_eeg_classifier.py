@@ -0,0 +1,63 @@
+import numpy as np
+
+from eeg_calibration import GUEST
+from eeg_classifier import FEATURE_NAMES, ClassifierStore, OnlineLogisticRegression, classifier_features
+from eeg_session import CHANNEL_NAMES
+
+
+def labelled_features(n=400, seed=0):
+    """Feature vectors on very different scales, where focus raises the log engagement column."""
+    rng = np.random.default_rng(seed)
+    labels = rng.random(n) < 0.5
+    features = rng.normal(0, 1, (n, len(FEATURE_NAMES))) * rng.uniform(0.1, 10, len(FEATURE_NAMES))
+    features[:, FEATURE_NAMES.index('log_engagement')] = np.where(labels, 0.3, -0.3) + rng.normal(0, 0.1, n)
+    return features, labels.astype(float)
+
+
+def test_classifier_features_include_alpha_asymmetry():
+    powers = np.ones((8, 4), dtype=np.float32)
+    powers[CHANNEL_NAMES.index('F6'), 1] = np.e  # More alpha on the right frontal channel
+
+    features = dict(zip(FEATURE_NAMES, classifier_features(powers)))
+    assert features['frontal_alpha_asymmetry'] == np.float32(1.0)
+    assert features['parietal_alpha_asymmetry'] == 0.0
+
+    # With F6 masked the frontal pair has no asymmetry to give
+    mask = np.ones(8, dtype=bool)
+    mask[CHANNEL_NAMES.index('F6')] = False
+    features = dict(zip(FEATURE_NAMES, classifier_features(powers, mask)))
+    assert features['frontal_alpha_asymmetry'] == 0.0
+    assert np.isfinite(list(features.values())).all()
+
+
+def test_classifier_features_need_a_clean_channel():
+    assert classifier_features(np.ones((8, 4)), np.zeros(8, dtype=bool)) is None
+
+
+def test_online_regression_learns_separable_labels():
+    features, labels = labelled_features()
+    classifier = OnlineLogisticRegression()
+    for x, y in zip(features[:300], labels[:300]):
+        classifier.update(x, y)
+    predictions = np.array([classifier.predict_proba(x) for x in features[300:]])
+    assert np.mean((predictions > 0.5) == labels[300:]) > 0.95
+
+
+def test_classifier_store_round_trip_and_feature_mismatch(tmp_path):
+    features, labels = labelled_features()
+    classifier = OnlineLogisticRegression()
+    for x, y in zip(features[:50], labels[:50]):
+        classifier.update(x, y)
+    store = ClassifierStore(["alice"], directory=str(tmp_path))
+    assert store.save(GUEST, classifier) is None
+    path = store.save("alice", classifier)
+
+    loaded = store.load("alice")
+    assert loaded.count == 50
+    assert loaded.predict_proba(features[60]) == classifier.predict_proba(features[60])
+
+    # Weights trained on another feature layout are not reused
+    with np.load(path) as stored:
+        arrays = dict(stored)
+    np.savez(path, **dict(arrays, feature_names=np.array(FEATURE_NAMES[:-1])))
+    assert store.load("alice").count == 0
@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.signal import lfilter
+
+from eeg_dsp import BAND_EDGES, IIRBandPower, SlidingDFTBandPower
+
+
+def fft_band_powers(window_data, fs):
+    """Band powers of a (channels x window) block straight from an FFT."""
+    n = window_data.shape[1]
+    spectrum = np.fft.rfft(window_data, axis=1)
+    freqs = np.fft.rfftfreq(n, 1.0 / fs)
+    bin_power = 2.0 * np.abs(spectrum) ** 2 / n ** 2
+    return np.stack([bin_power[:, (freqs >= low) & (freqs < high)].sum(axis=1) for low, high in BAND_EDGES.values()],
+                    axis=1)
+
+
+def test_sliding_dft_matches_fft_of_the_latest_window():
+    fs, window = 256, 512
+    rng = np.random.default_rng(0)
+    t = np.arange(3000) / fs
+    data = rng.normal(0, 5, (8, t.size)) + 20 * np.sin(2 * np.pi * 10 * t)
+
+    for dtype, tolerance in ((np.float64, 1e-9), (np.float32, 1e-3)):
+        engine = SlidingDFTBandPower(fs, window, dtype=dtype)
+        # Epochs of 16 that don't line up with the window, so the recursion runs between resyncs
+        for start in range(0, 2992, 16):
+            powers = engine.update(data[:, start:start + 16])
+        assert powers.dtype == dtype
+        np.testing.assert_allclose(powers, fft_band_powers(data[:, 2992 - window:2992], fs), rtol=tolerance)
+
+
+def test_iir_filters_each_sample_once_and_averages_the_latest_window():
+    data = np.random.default_rng(2).normal(0, 5, (8, 4000))
+    engine = IIRBandPower(256, 512, dtype=np.float64)
+    for start in range(0, 4000, 64):  # One hop at a time, as the app feeds it
+        powers = engine.update(data[:, start:start + 64])
+
+    # The same as filtering the whole recording in one go and averaging the last window
+    expected = np.stack([np.mean(lfilter(b, a, data, axis=-1)[:, -512:] ** 2, axis=-1)
+                         for b, a in engine.coefficients], axis=1)
+    np.testing.assert_allclose(powers, expected, rtol=1e-9)
+
+    # Before a full window has arrived, the average covers what there is
+    engine.reset()
+    powers = engine.update(data[:, :100])
+    expected = np.stack([np.mean(lfilter(b, a, data[:, :100], axis=-1) ** 2, axis=-1)
+                         for b, a in engine.coefficients], axis=1)
+    np.testing.assert_allclose(powers, expected, rtol=1e-9)
+
+
+def test_sliding_dft_splits_blocks_longer_than_the_window():
+    engine = SlidingDFTBandPower(256, 256, dtype=np.float64)
+    data = np.random.default_rng(1).normal(0, 5, (8, 1000))
+    np.testing.assert_allclose(engine.update(data), fft_band_powers(data[:, -256:], 256), rtol=1e-9)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from eeg_epochs import event_locked_average, extract_epochs
+from eeg_markers import MarkerStore
+
+
+def test_extract_epochs_cuts_event_windows_and_drops_the_ends():
+    data = np.arange(2 * 100, dtype=np.float32).reshape(2, 100)
+    epochs, kept = extract_epochs(data, [3, 50, 98, 10], before=5, after=10)
+
+    assert kept.tolist() == [False, True, False, True]
+    assert epochs.shape == (2, 2, 15)
+    for epoch, event in zip(epochs, [50, 10]):
+        np.testing.assert_array_equal(epoch, data[:, event - 5:event + 10])
+
+
+def test_extract_epochs_window_longer_than_session():
+    epochs, kept = extract_epochs(np.zeros((8, 20), dtype=np.float32), [10], before=15, after=15)
+    assert epochs.shape == (0, 8, 30)
+    assert not kept.any()
+
+
+def test_event_locked_average_rejects_and_averages():
+    data = np.zeros((1, 200), dtype=np.float32)
+    markers = MarkerStore()
+    for event, height in [(40, 1.0), (100, 3.0), (160, 500.0)]:
+        data[0, event:event + 5] = height
+        markers.add(event, "stimulus")
+    markers.add(70, "other")
+
+    evoked, epochs, mask, n_kept = event_locked_average(data, markers, "stimulus", before=10, after=20,
+                                                        baseline=slice(0, 10), max_amplitude=100)
+    assert epochs.shape == (3, 1, 30)
+    assert mask.tolist() == [True, True, False]
+    assert n_kept == 2
+    np.testing.assert_allclose(evoked[0, 10:15], 2.0)
+    np.testing.assert_allclose(evoked[0, :10], 0.0)
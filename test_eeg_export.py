@@ -0,0 +1,40 @@
+import numpy as np
+
+from eeg_export import write_samples_csv
+
+
+def expected_csv(samples, timestamps, markers, headers):
+    lines = [",".join(headers) + "\n"]
+    for row, (values, timestamp, marker) in enumerate(zip(samples.tolist(), timestamps.tolist(), markers)):
+        lines.append(f"{row}," + ",".join(f"{value:.3f}" for value in values) + f",{marker},{timestamp}\n")
+    return "".join(lines)
+
+
+def test_write_samples_csv_matches_printf(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 50, (500, 3)).astype(np.float32)
+    samples[7] = [-0.0001, 0.0005, -12345.678]
+    timestamps = np.arange(500, dtype=np.int64) * 4 + 1_700_000_000_000
+    markers = np.full(500, "", dtype=object)
+    markers[[0, 123, 499]] = ["start", "click", "stop"]
+    headers = ["Sample Count", "A", "B", "C", "Marker Column", "Timestamp"]
+
+    path = write_samples_csv(str(tmp_path / "out.csv"), samples, timestamps, markers, headers, block_rows=64)
+    with open(path) as file:
+        assert file.read() == expected_csv(samples, timestamps, markers, headers)
+
+
+def test_write_samples_csv_writes_non_finite_samples(tmp_path):
+    samples = np.ones((40, 2), dtype=np.float32)
+    samples[3, 0] = np.nan
+    samples[20] = [np.inf, -np.inf]
+    timestamps = np.arange(40, dtype=np.int64)
+    headers = ["Sample Count", "A", "B", "Marker Column", "Timestamp"]
+
+    path = write_samples_csv(str(tmp_path / "out.csv"), samples, timestamps, None, headers, block_rows=16)
+    with open(path) as file:
+        text = file.read()
+    assert text == expected_csv(samples, timestamps, [""] * 40, headers)
+    lines = text.splitlines()
+    assert lines[4] == "3,nan,1.000,,3"
+    assert lines[21] == "20,inf,-inf,,20"
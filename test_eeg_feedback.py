@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from eeg_feedback import FeedbackEngine, FeedbackRule, session_feedback
+
+NAMES = ('focus', 'distraction')
+RULES = (
+    FeedbackRule('distraction', 'distraction', 'Take a break.', above=4.0, hold_seconds=3.0, cooldown_seconds=60.0),
+    FeedbackRule('focus', 'focus', 'Breathe.', below=1.0, hold_seconds=1.0, cooldown_seconds=30.0)
+)
+
+
+def fired(states, tick_seconds=0.1, min_interval=20.0):
+    """(seconds, rule name) of every suggestion from a tick-by-tick engine."""
+    engine = FeedbackEngine(RULES, NAMES, min_interval)
+    return [(round(tick * tick_seconds, 1), rule.name) for tick, row in enumerate(states)
+            for rule in [engine.update(row, tick * tick_seconds)] if rule is not None]
+
+
+def test_a_condition_must_hold_unbroken_to_fire():
+    states = np.tile([2.0, 2.0], (1000, 1))
+    states[10:39, 1] = 5.0   # 2.9 s: not long enough
+    states[50:90, 1] = 5.0   # Fires 3 s after it starts, at 8 s
+    states[100:200, 1] = 5.0  # Held long enough, but within the 60 s cooldown
+    assert fired(states) == [(8.0, 'distraction')]
+
+
+def test_cooldown_and_min_interval():
+    states = np.tile([2.0, 5.0], (1500, 1))
+    # Distraction holds throughout: at 3 s, then again each time its 60 s cooldown is over
+    assert fired(states) == [(3.0, 'distraction'), (63.0, 'distraction'), (123.0, 'distraction')]
+
+    # With low focus as well, only one suggestion every 20 s; when both are ready the first rule goes first
+    states[:, 0] = 0.5
+    assert fired(states) == [(1.0, 'focus'), (21.0, 'distraction'), (41.0, 'focus'), (71.0, 'focus'),
+                             (91.0, 'distraction'), (111.0, 'focus'), (141.0, 'focus')]
+    # Without the interval each rule keeps to its own cooldown
+    assert fired(states, min_interval=0.0) == [(1.0, 'focus'), (3.0, 'distraction'), (31.0, 'focus'), (61.0, 'focus'),
+                                               (63.0, 'distraction'), (91.0, 'focus'), (121.0, 'focus'),
+                                               (123.0, 'distraction')]
+
+
+def test_rules_need_one_threshold_and_a_known_state():
+    with pytest.raises(ValueError):
+        FeedbackRule('both', 'focus', '', above=1.0, below=0.5)
+    with pytest.raises(ValueError):
+        FeedbackEngine([FeedbackRule('memory', 'memory', '', above=1.0)], NAMES)
+
+
+def test_session_feedback_matches_the_engine():
+    rng = np.random.default_rng(0)
+    states = np.column_stack([1.5 + np.cumsum(rng.normal(0, 0.05, 20000)), 3.0 + np.cumsum(rng.normal(0, 0.05, 20000))])
+    states[rng.random(20000) < 0.01] = np.nan
+    timestamps = np.arange(20000) * 0.1
+
+    ticks, rules = session_feedback(states, timestamps, RULES, NAMES)
+    assert len(ticks) > 5
+    assert [(round(timestamps[tick], 1), RULES[rule].name) for tick, rule in zip(ticks, rules)] == fired(states)
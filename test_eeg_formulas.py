@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from eeg_formulas import StateFormulas, load_state_formulas
+
+
+@pytest.mark.parametrize("text, message", [
+    ("alpha + delta", "unknown feature 'delta'"),
+    ("eval(alpha)", "unknown function"),
+    ("sigmoid(x=alpha)", "unknown function"),
+    ("alpha.real", "Attribute is not allowed"),
+    ("alpha if beta else theta", "IfExp is not allowed"),
+    ("[alpha][0]", "Subscript is not allowed"),
+    ("'alpha'", "only numbers"),
+    ("alpha +", r"State 'focus': .+ in 'alpha \+'"),  # The parser's wording varies by Python version
+])
+def test_formulas_outside_the_whitelist_are_rejected(text, message):
+    with pytest.raises(ValueError, match=message):
+        StateFormulas({'focus': text})
+
+
+def test_formulas_evaluate_every_state_over_whole_arrays():
+    formulas = StateFormulas({'engagement': "beta / (alpha + theta)", 'calm': "sigmoid(log10(alpha))",
+                              'constant': "0.5"})
+    features = np.array([[3.0, 10.0, 4.0, 1.5], [2.0, 1.0, 6.0, 0.5]])
+    states = formulas(features)
+    assert states.dtype == np.float32 and states.shape == (2, 3)
+    np.testing.assert_allclose(states[:, 0], features[:, 2] / (features[:, 1] + features[:, 0]), rtol=1e-6)
+    np.testing.assert_allclose(states[:, 1], 1 / (1 + np.exp(-np.log10(features[:, 1]))), rtol=1e-6)
+    np.testing.assert_array_equal(states[:, 2], 0.5)
+
+
+def test_loaded_formulas_replace_and_add_in_both_sets(tmp_path):
+    states = StateFormulas({'focus': "beta / alpha", 'calm': "alpha / beta"})
+    calibrated = StateFormulas({'focus': "sigmoid(beta - alpha)", 'calm': "sigmoid(alpha - beta)"})
+    path = tmp_path / "formulas.json"
+    assert load_state_formulas(str(path), states, calibrated) == (states, calibrated)
+
+    # Added in a different order in each section, so the calibrated set is reordered to match
+    path.write_text(json.dumps({'states': {'focus': "beta / theta", 'drive': "gamma", 'rest': "theta"},
+                                'calibrated_states': {'rest': "sigmoid(theta)", 'drive': "sigmoid(gamma)"}}))
+    loaded, loaded_calibrated = load_state_formulas(str(path), states, calibrated)
+    assert loaded.names == loaded_calibrated.names == ('focus', 'calm', 'drive', 'rest')
+    assert loaded.formulas['focus'] == "beta / theta"
+    assert loaded_calibrated.formulas['focus'] == "sigmoid(beta - alpha)"
+
+    path.write_text(json.dumps({'states': {'drive': "gamma"}}))
+    with pytest.raises(ValueError, match="drive must be defined in both"):
+        load_state_formulas(str(path), states, calibrated)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from eeg_lstm import LSTMNetwork, StreamingLSTM, compare_with_keras, export_keras_weights
+
+
+def random_network(n_inputs=8, units=(6, 4), n_outputs=8, seed=0):
+    """A small network in the exported layout: stacked LSTMs and a Dense layer, as New Iteration builds it."""
+    rng = np.random.default_rng(seed)
+    layers = []
+    for index, size in enumerate(units):
+        previous = n_inputs if index == 0 else units[index - 1]
+        kind = 'lstm_sequences' if index < len(units) - 1 else 'lstm'
+        layers.append((kind, {'kernel': rng.normal(0, 0.5, (previous, 4 * size)).astype(np.float32),
+                              'recurrent_kernel': rng.normal(0, 0.5, (size, 4 * size)).astype(np.float32),
+                              'bias': rng.normal(0, 0.1, 4 * size).astype(np.float32)}))
+    layers.append(('dense', {'kernel': rng.normal(0, 0.5, (units[-1], n_outputs)).astype(np.float32),
+                             'bias': rng.normal(0, 0.1, n_outputs).astype(np.float32)}))
+    return LSTMNetwork(layers, time_steps=10)
+
+
+def reference_predict(network, window):
+    """The Keras LSTM equations written out one sample at a time in float64."""
+    def sigmoid(z):
+        return 1 / (1 + np.exp(-z))
+
+    x = np.asarray(window, dtype=np.float64)
+    for kind, weights in network.layers:
+        kernel, bias = weights['kernel'].astype(np.float64), weights['bias'].astype(np.float64)
+        if kind == 'dense':
+            x = x @ kernel + bias
+            continue
+        recurrent = weights['recurrent_kernel'].astype(np.float64)
+        units = recurrent.shape[0]
+        h, c = np.zeros(units), np.zeros(units)
+        outputs = []
+        for sample in x:
+            z = sample @ kernel + h @ recurrent + bias
+            i, f = sigmoid(z[:units]), sigmoid(z[units:2 * units])
+            g, o = np.tanh(z[2 * units:3 * units]), sigmoid(z[3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+            outputs.append(h)
+        x = np.array(outputs)
+    return x[-1]
+
+
+def test_network_matches_the_lstm_equations():
+    network = random_network()
+    windows = np.random.default_rng(1).normal(0, 1, (5, 10, 8))
+    expected = np.array([reference_predict(network, window) for window in windows])
+    np.testing.assert_allclose(network.predict(windows), expected, atol=1e-5)
+
+
+def test_streaming_predictions_match_predict_on_the_training_windows():
+    network = random_network()
+    signal = np.random.default_rng(2).normal(0, 1, (8, 60)).astype(np.float32)
+    streaming = StreamingLSTM(network, window_size=network.time_steps)
+    # Blocks shorter and longer than the window, starting before a full window has arrived
+    windowed = np.vstack([streaming.update(signal[:, start:end]) for start, end in
+                         [(0, 3), (3, 7), (7, 23), (23, 24), (24, 60)]])
+
+    expected = [network.predict(signal[None, :, max(0, end - 9):end + 1].transpose(0, 2, 1))[0] for end in range(60)]
+    np.testing.assert_allclose(windowed, expected, atol=1e-6)
+
+    # Carrying the state instead is one run over the whole signal, which departs from the windows once they fill
+    carried = StreamingLSTM(network)
+    outputs = np.vstack([carried.update(signal[:, start:start + 16]) for start in range(0, 60, 16)])
+    np.testing.assert_allclose(outputs, network.run(signal.T[None])[0][0], atol=1e-6)
+    np.testing.assert_allclose(outputs[:10], windowed[:10], atol=1e-6)
+    assert not np.allclose(outputs[10:], windowed[10:], atol=1e-3)
+
+
+def test_exported_weights_match_keras(tmp_path):
+    keras = pytest.importorskip("tensorflow.keras")
+    model = keras.Sequential([keras.layers.Input(shape=(10, 8)), keras.layers.LSTM(6, return_sequences=True),
+                              keras.layers.LSTM(4), keras.layers.Dense(8)])
+    path = export_keras_weights(model, str(tmp_path / "lstm.npz"), fingerprint="test")
+
+    network = LSTMNetwork.load(path)
+    assert network.fingerprint == "test" and network.time_steps == 10
+    windows = np.random.default_rng(3).normal(0, 1, (64, 10, 8)).astype(np.float32)
+    assert compare_with_keras(model, network, windows) < 1e-5
@@ -0,0 +1,24 @@
+from eeg_markers import MarkerStore
+
+
+def test_find_counts_occurrences_in_sample_order():
+    markers = MarkerStore()
+    for sample_index, label in [(30, "a"), (10, "b"), (20, "a"), (20, "b"), (20, "a"), (5, "a")]:
+        markers.add(sample_index, label)
+
+    found = [markers.find("a", occurrence) for occurrence in range(5)]
+    assert [markers.sample_of(position) for position in found[:4]] == [5, 20, 20, 30]
+    assert all(markers.label_of(position) == "a" for position in found[:4])
+    assert found[1] < found[2]  # Ties keep their insertion order
+    assert found[4] is None
+    assert markers.find("missing") is None
+
+
+def test_labels_for_samples_joins_markers_on_the_same_sample():
+    markers = MarkerStore()
+    markers.add(2, "start")
+    markers.add(2, "click")
+    markers.add(6, "stop")
+
+    column = markers.labels_for_samples(1, 4)
+    assert column.tolist() == ["", "start;click", "", ""]
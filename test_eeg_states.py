@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from eeg_states import (HysteresisGate, StateAnalyzer, TrendForecaster, analyze_session, benchmark_state_smoothing,
+                        make_state_smoother, replay_analyzer)
+
+
+def drifting_bands(n_ticks=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_ticks) * 0.1
+    levels = np.tile([3.0, 10.0, 4.0, 1.5], (n_ticks, 1))
+    levels[:, 1] *= 1 + 0.6 * np.sin(2 * np.pi * t / 7.0)
+    bands = (levels * 10 ** rng.normal(0, 0.1, (n_ticks, 4))).astype(np.float32)
+    bands[[5, 6, 700, 1500]] = 0  # Ticks with every channel rejected
+    return bands
+
+
+@pytest.mark.parametrize("smoothing, gated, forecast, delay", [
+    ('none', False, False, 0.0),
+    ('one_euro', True, False, 0.1),
+    ('one_euro', True, True, 0.1),
+    ('ema', True, True, 0.25),
+    ('kalman', False, False, 0.3),
+])
+def test_analyze_session_matches_the_live_analyzer(smoothing, gated, forecast, delay):
+    bands = drifting_bands()
+    latency = 0.3 if forecast else None
+
+    def parts():
+        return dict(smoother=make_state_smoother(smoothing), gate=HysteresisGate() if gated else None,
+                    forecaster=TrendForecaster() if forecast else None)
+
+    batch = analyze_session(bands, tick_seconds=0.1, latency=latency or 0.0, transition_delay=delay, **parts())
+    states, trends, colours = replay_analyzer(StateAnalyzer(transition_delay=delay, **parts()), bands, 0.1, latency)
+
+    np.testing.assert_array_equal(states, batch['states'])
+    np.testing.assert_array_equal(trends, batch['trends'])
+    assert colours == list(zip(batch['background'], batch['text']))
+
+
+def test_calibrated_analyze_session_matches_the_live_analyzer():
+    zscores = np.random.default_rng(1).normal(0, 1, (2000, 4)).astype(np.float32)
+    batch = analyze_session(zscores, calibrated=True, smoother=make_state_smoother('one_euro'),
+                            gate=HysteresisGate(), transition_delay=0.1)
+    analyzer = StateAnalyzer(smoother=make_state_smoother('one_euro'), gate=HysteresisGate(), transition_delay=0.1)
+    states, trends, colours = replay_analyzer(analyzer, zscores, calibrated=True)
+
+    np.testing.assert_array_equal(states, batch['states'])
+    assert colours == list(zip(batch['background'], batch['text']))
+
+
+def test_switching_scale_restarts_the_history():
+    analyzer = StateAnalyzer(clock=lambda: 0.0)
+    for _ in range(5):
+        analyzer.analyze_brain_state(10.0, 4.0, 3.0, 1.5)
+    assert analyzer.history_length == 5
+    analyzer.analyze_calibrated_state([0.1, 0.2, 0.3, 0.4])
+    assert analyzer.calibrated and analyzer.history_length == 1
+    assert analyzer.analyze_brain_state(0.0, 0.0, 0.0, 0.0) is None
+    assert not analyzer.calibrated and analyzer.history_length == 0
+
+
+def test_the_app_settings_meet_the_redraw_target():
+    results = benchmark_state_smoothing()
+    assert results['none']['redraws_per_minute'] > 200
+    # What the app runs: one-euro smoothing and the hysteresis gate, 0.1 s transition delay
+    app = results['one_euro + gate']
+    assert app['redraws_per_minute'] <= 30
+    assert app['shown_s'] <= 1.0
@@ -0,0 +1,148 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from eeg_dsp import (BAND_POWER_ENGINES, EEGPreprocessor, MultiRateStream, Rereferencer, band_features,
+                     make_band_power_engine)
+from eeg_session import CHANNEL_NAMES, SAMPLING_RATE
+
+# Largest deviation of a float32 result from the float64 one, relative to the result's typical size
+LIVE_TOLERANCE = 1e-3
+# Ratios such as engagement magnify the error whenever their denominator dips, so they get more room
+RATIO_TOLERANCE = 2e-2
+OFFLINE_TOLERANCE = 1e-3
+EPOCH = 16
+
+
+def synthetic_recording(seconds=60, fs=SAMPLING_RATE, n_channels=8, seed=0):
+    """Crown-like raw data: large DC offsets with drift, background noise, alpha bursts and mains hum."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * fs) / fs
+    offsets = rng.uniform(-40000, 40000, (n_channels, 1))
+    drift = np.cumsum(rng.normal(0, 0.05, (n_channels, t.size)), axis=1)
+    alpha = 15 * np.sin(2 * np.pi * 10 * t) * (np.sin(2 * np.pi * 0.05 * t) > 0)
+    beta = 4 * np.sin(2 * np.pi * 21 * t + rng.uniform(0, 2 * np.pi, (n_channels, 1)))
+    mains = 8 * np.sin(2 * np.pi * 50 * t)
+    return offsets + drift + rng.normal(0, 6, (n_channels, t.size)) + alpha + beta + mains
+
+
+def deviation(reference, result):
+    """Max absolute difference per column, relative to the column's median magnitude."""
+    reference = np.asarray(reference, dtype=np.float64).reshape(len(reference), -1)
+    result = np.asarray(result, dtype=np.float64).reshape(len(result), -1)
+    scale = np.maximum(np.nanmedian(np.abs(reference), axis=0), 1e-12)
+    with np.errstate(invalid='ignore'):  # inf - inf where a ratio blew up in both
+        return float(np.nanmax(np.nanmax(np.abs(result - reference), axis=0) / scale))
+
+
+def run_live(raw, engine_name, dtype, fs=SAMPLING_RATE):
+    """Runs the live chain epoch by epoch; returns band powers, engagement, the 16 Hz tier and seconds taken."""
+    preprocessor = EEGPreprocessor(fs, dtype=dtype)
+    rereferencer = Rereferencer('average')
+    engine = make_band_power_engine(engine_name, fs, dtype=dtype)
+    streams = MultiRateStream(fs, dtype=dtype)
+    slow = []
+    streams.subscribe(16, slow.append)
+
+    powers, engagement = [], []
+    started = time.perf_counter()
+    for start in range(0, raw.shape[1], EPOCH):
+        cleaned = rereferencer.process(preprocessor.process(raw[:, start:start + EPOCH]))
+        streams.push(cleaned)
+        band_powers = engine.update(cleaned)
+        powers.append(band_powers)
+        engagement.append(band_features(band_powers)['engagement'])
+    elapsed = time.perf_counter() - started
+    return np.array(powers), np.array(engagement), np.concatenate(slow, axis=1), elapsed
+
+
+@pytest.fixture(scope="module")
+def recording():
+    return synthetic_recording()
+
+
+def check_live(raw, name, warmup_epochs=64):
+    """Runs one band-power engine in float32 and float64; returns (deviation, engagement deviation, speed-up)."""
+    powers64, engagement64, slow64, seconds64 = run_live(raw, name, np.float64)
+    powers32, engagement32, slow32, seconds32 = run_live(raw, name, np.float32)
+    assert powers32.dtype == np.float32 and slow32.dtype == np.float32, f"{name}: float32 path promoted"
+
+    worst = max(deviation(powers64[warmup_epochs:].reshape(-1, powers64.shape[-1]),
+                          powers32[warmup_epochs:].reshape(-1, powers32.shape[-1])),
+                deviation(slow64[:, warmup_epochs:].T, slow32[:, warmup_epochs:].T))
+    ratio = deviation(engagement64[warmup_epochs:], engagement32[warmup_epochs:])
+    print(f"live {name:>8}: max relative deviation {worst:.1e} (engagement {ratio:.1e}), "
+          f"{raw.shape[1] / EPOCH / seconds32:.0f} epochs/s ({seconds64 / seconds32:.2f}x float64)")
+    return worst, ratio, seconds64 / seconds32
+
+
+@pytest.mark.parametrize("name", list(BAND_POWER_ENGINES))
+def test_live_float32_matches_float64(recording, name):
+    worst, ratio, _ = check_live(recording, name)
+    assert worst < LIVE_TOLERANCE, f"{name}: float32 deviates by {worst:.2e}"
+    assert ratio < RATIO_TOLERANCE, f"{name}: float32 engagement deviates by {ratio:.2e}"
+
+
+def check_offline(raw, fs=SAMPLING_RATE):
+    """Runs the offline preprocess -> PSD -> analysis path in float32 and float64; returns the deviation."""
+    from eeg_analysis import preprocess_eeg_data, extract_features, analyze_eeg_data
+
+    columns = [f'EEG Channel Value: {name}' for name in CHANNEL_NAMES]
+    frame = pd.DataFrame(raw.T.astype(np.float32), columns=columns)
+    frame['Timestamp'] = np.arange(raw.shape[1]) * (1000.0 / fs)
+
+    outputs = {}
+    for dtype in (np.float64, np.float32):
+        started = time.perf_counter()
+        filtered = preprocess_eeg_data(frame.copy(), fs, dtype=dtype)
+        psd_df = extract_features(filtered, fs, dtype=dtype)
+        analysis = analyze_eeg_data(psd_df)
+        outputs[dtype] = (filtered.get_data(), psd_df, analysis, time.perf_counter() - started)
+
+    filtered64, psd64, analysis64, seconds64 = outputs[np.float64]
+    filtered32, psd32, analysis32, seconds32 = outputs[np.float32]
+    numeric = analysis64.columns.drop('Channel')
+    worst = max(deviation(psd64.values.T, psd32.values.T),
+                deviation(analysis64[numeric].values, analysis32[numeric].values))
+    assert psd32.values.dtype == np.float32, "offline: PSDs promoted to float64"
+    print(f"offline: max relative deviation {worst:.1e}, {seconds32:.2f} s vs {seconds64:.2f} s in float64")
+    print(f"offline memory: filtered data {filtered64.nbytes / 1e6:.1f} MB -> {filtered32.nbytes / 1e6:.1f} MB, "
+          f"PSDs {psd64.values.nbytes / 1e6:.1f} MB -> {psd32.values.nbytes / 1e6:.1f} MB")
+    return worst
+
+
+def nested_list_bytes(rows):
+    """Approximate footprint of the SDK's list-of-lists epoch (list objects plus boxed floats)."""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + len(row) * sys.getsizeof(0.0) for row in rows)
+
+
+def test_offline_float32_matches_float64(recording):
+    worst = check_offline(recording)
+    assert worst < OFFLINE_TOLERANCE, f"offline: float32 deviates by {worst:.2e}"
+
+
+def report_session_memory(hours=1.0, fs=SAMPLING_RATE, n_channels=8):
+    """How much a live session's stored epochs take as SDK lists versus float32 blocks; returns the ratio."""
+    epoch = np.zeros((n_channels, EPOCH))
+    n_epochs = int(hours * 3600 * fs / EPOCH)
+    as_lists = nested_list_bytes(epoch.tolist()) * n_epochs
+    as_float32 = epoch.astype(np.float32).nbytes * n_epochs
+    print(f"stored epochs, {hours:g} h session: {as_lists / 1e6:.0f} MB as lists -> "
+          f"{as_float32 / 1e6:.0f} MB as float32 ({as_lists / as_float32:.1f}x smaller)")
+    return as_lists / as_float32
+
+
+def test_stored_epochs_are_smaller_as_float32():
+    assert report_session_memory() > 8
+
+
+if __name__ == "__main__":
+    # Prints the deviations, throughput and memory without pytest
+    raw = synthetic_recording(seconds=120)
+    for engine_name in BAND_POWER_ENGINES:
+        check_live(raw, engine_name)
+    check_offline(raw)
+    report_session_memory()